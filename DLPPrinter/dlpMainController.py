@@ -3,6 +3,8 @@ from DLPPrinter.dlpProjectorController import DLPProjectorController
 from PySide2.QtGui import QPixmap
 from PySide2.QtCore import QObject, Signal, Slot, QTimer, QFile, QIODevice, QJsonDocument, QTime, QDate, QDateTime
 from pathlib import Path
+import os
+import re
 
 DEBUG_MODE_ON = False
 
@@ -52,6 +54,7 @@ class DLPMainController(QObject):
         self.support_burn_exposure = self.__default_parameters['support_burn_exposure (ms)']  # ms
         self.support_burn_amplitude = int(self.__default_parameters['support_burn_amplitude'])
         self.support_file_names = {}
+        self.support_layers_thickness = None  # per image thickness in mm of adaptive layers, None for a constant thickness
         # Features Parameters
         self.features_thickness = self.__default_parameters['features_thickness (mm)']  # mm
         self.features_exposure = self.__default_parameters['features_exposure (ms)']  # ms
@@ -60,6 +63,7 @@ class DLPMainController(QObject):
         self.features_burn_exposure = self.__default_parameters['features_burn_exposure (ms)']  # ms
         self.features_burn_amplitude = int(self.__default_parameters['features_burn_amplitude'])
         self.features_file_names = {}
+        self.features_layers_thickness = None
         # Advanced Parameters
         self.incremental_thickness = self.__default_parameters['incremental_thickness']
         self.incremental_exposure = self.__default_parameters['incremental_exposure']
@@ -187,7 +191,10 @@ class DLPMainController(QObject):
             move_building_plate = True
             if self.current_layer < len(self.support_file_names):
                 self.current_file_name = self.support_file_names[self.current_layer]
-                self.current_thickness = self.support_thickness
+                if self.support_layers_thickness is not None:
+                    self.current_thickness = self.support_layers_thickness[self.current_layer]
+                else:
+                    self.current_thickness = self.support_thickness
                 is_burning_layer = self.current_layer < self.support_burn_layers
                 if is_burning_layer:
                     self.current_amplitude = self.support_burn_amplitude
@@ -211,7 +218,7 @@ class DLPMainController(QObject):
                     self.current_amplitude = self.features_amplitude
                     self.current_exposure = self.starting_incremental_exposure + \
                                         (self.current_layer - burning_layers_threshold) * self.incremental_step_exposure
-                elif self.incremental_thickness:
+                elif self.incremental_thickness and self.features_layers_thickness is None:
                     self.current_thickness = self.starting_incremental_thickness + \
                                          (self.current_layer - burning_layers_threshold) * self.incremental_step_thickness
                     self.current_amplitude = self.features_amplitude
@@ -226,6 +233,9 @@ class DLPMainController(QObject):
                 else:
                     self.current_amplitude = self.features_amplitude
                     self.current_exposure = self.features_exposure
+                # adaptive layers move the building plate by the thickness they were sliced with
+                if self.features_layers_thickness is not None:
+                    self.current_thickness = self.features_layers_thickness[self.current_layer - len(self.support_file_names)]
             else:
                 self.print_text_signal.emit("...printing process ended!")
                 self.print_status = "SUCCESS"
@@ -323,6 +333,7 @@ class DLPMainController(QObject):
         for im in images:
             self.print_text_signal.emit(im)
         self.print_text_signal.emit("Loaded " + str(len(images)) + " support images!")
+        self.support_layers_thickness = self.__load_layers_schedule__(images)
         self.number_of_layers = len(self.features_file_names) + len(self.support_file_names)
         self.etc_updated_signal.emit(self.evaluate_time_estimate())
 
@@ -362,9 +373,34 @@ class DLPMainController(QObject):
         for im in images:
             self.print_text_signal.emit(im)
         self.print_text_signal.emit("Loaded " + str(len(images)) + " features images!")
+        self.features_layers_thickness = self.__load_layers_schedule__(images)
         self.number_of_layers = len(self.features_file_names) + len(self.support_file_names)
         self.etc_updated_signal.emit(self.evaluate_time_estimate())
 
+    # thickness of each image sliced with adaptive layers, read from the layers_thickness.txt written by the slicer
+    # next to the layer_N.png images. None when the images have no schedule (constant thickness)
+    def __load_layers_schedule__(self, images):
+        if len(images) == 0:
+            return None
+        schedule_name = os.path.join(os.path.dirname(images[0]), 'layers_thickness.txt')
+        if not os.path.exists(schedule_name):
+            return None
+        try:
+            with open(schedule_name) as schedule_file:
+                schedule = [float(line) for line in schedule_file if line.strip()]
+        except (OSError, ValueError) as e:
+            self.print_text_signal.emit("Invalid layers schedule " + schedule_name + ": " + str(e))
+            return None
+        layers_thickness = []
+        for image in images:
+            match = re.match(r'layer_(\d+)', os.path.basename(image))
+            if os.path.dirname(image) != os.path.dirname(images[0]) or match is None or int(match.group(1)) >= len(schedule):
+                self.print_text_signal.emit("The layers schedule does not match the image " + image + ", using a constant thickness")
+                return None
+            layers_thickness.append(schedule[int(match.group(1))])
+        self.print_text_signal.emit("Loaded the adaptive layers schedule " + schedule_name)
+        return layers_thickness
+
     @Slot(bool)
     def set_incremental_amplitude(self, value):
         self.incremental_amplitude = value
@@ -5,8 +5,10 @@ from PySide2.QtGui import QVector3D, QOpenGLFunctions,\
     QQuaternion, QOpenGLFramebufferObject, QOpenGLFramebufferObjectFormat, QImage, QMatrix4x4
 from OpenGL import GL
 import struct
+import os
 from helpers import my_shaders as ms
 from helpers import geometry_loader
+from helpers import slicer_helpers
 
 class DLPSlicer(QOpenGLWidget, QOpenGLFunctions):
 
@@ -76,6 +78,12 @@ class DLPSlicer(QOpenGLWidget, QOpenGLFunctions):
         self.slice_height = self.projector_height
         self.samples_per_pixel = self.dlp_controller.samples_per_pixel
         self.slice_thickness_microns = self.dlp_controller.support_thickness * 1000  # microns
+        self.adaptive_layers = False
+        self.min_slice_thickness_microns = self.slice_thickness_microns
+        self.max_slice_thickness_microns = 4 * self.slice_thickness_microns
+        self.cusp_height_microns = 0.5 * self.slice_thickness_microns
+        self.layers_height_mm = []  # bottom height of each layer
+        self.layers_thickness_mm = []
         self.current_slice = 0
         self.number_of_slices = 0
         self.is_slicing = False
@@ -215,6 +223,22 @@ class DLPSlicer(QOpenGLWidget, QOpenGLFunctions):
     def set_slice_thickness(self, value):
         self.slice_thickness_microns = value
 
+    @Slot(bool)
+    def set_adaptive_layers(self, value):
+        self.adaptive_layers = value
+
+    @Slot(float)
+    def set_min_slice_thickness(self, value):
+        self.min_slice_thickness_microns = value
+
+    @Slot(float)
+    def set_max_slice_thickness(self, value):
+        self.max_slice_thickness_microns = value
+
+    @Slot(float)
+    def set_cusp_height(self, value):
+        self.cusp_height_microns = value
+
     @Slot(int)
     def set_samples_per_pixel(self, value):
         self.samples_per_pixel = value
@@ -461,12 +485,38 @@ class DLPSlicer(QOpenGLWidget, QOpenGLFunctions):
         self.slicer_camera_matrix.setToIdentity()
         self.slicer_camera_matrix.lookAt(self.slicer_eye, self.slicer_look_at, self.slicer_up)
         self.slicer_camera_matrix_array = np.asarray(self.slicer_camera_matrix.copyDataTo(), np.float32)
-        self.number_of_slices = np.ceil(1000 * self.global_bbox_height_mm / self.slice_thickness_microns)
+        self.__compute_layers_schedule__()
         self.slice_width = np.ceil(1000 * self.global_bbox_width_mm / self.pixel_size_microns)
         self.slice_height = np.ceil(1000 * self.global_bbox_depth_mm / self.pixel_size_microns)
         self.save_directory_name = directory
         self.__initialize_slicer_opengl__()
 
+    def __compute_layers_schedule__(self):
+        if self.adaptive_layers:
+            triangles = []
+            for geometry_idx in range(self.geometries_loaded):
+                transformation_matrix = np.array(self.model_matrix_list[geometry_idx].data(), dtype=np.float64).reshape(4, 4).transpose()
+                vertices = self.vertices_list[geometry_idx].reshape(-1, 3)
+                triangles.append(vertices.dot(transformation_matrix[:3, :3].transpose()) + transformation_matrix[0:3, 3])
+            triangles = np.vstack(triangles)
+            layers_thickness = slicer_helpers.compute_adaptive_layer_thicknesses(triangles, self.global_bbox_height_mm,
+                                                                                 self.min_slice_thickness_microns / 1000.0,
+                                                                                 self.max_slice_thickness_microns / 1000.0,
+                                                                                 self.cusp_height_microns / 1000.0)
+        else:
+            number_of_slices = int(np.ceil(1000 * self.global_bbox_height_mm / self.slice_thickness_microns))
+            layers_thickness = np.full(max(number_of_slices, 0), self.slice_thickness_microns / 1000.0)
+        self.layers_thickness_mm = layers_thickness.tolist()
+        self.layers_height_mm = (np.cumsum(layers_thickness) - layers_thickness).tolist()
+        self.number_of_slices = len(self.layers_thickness_mm)
+
+    # one line per layer_N.png with its thickness in mm, written only for adaptive layers
+    def __save_layers_schedule_to_disk__(self):
+        schedule_file = open(self.save_directory_name + '/layers_thickness.txt', 'w')
+        for layer_thickness in self.layers_thickness_mm:
+            schedule_file.write("%.4f\n" % layer_thickness)
+        schedule_file.close()
+
     @Slot()
     def interrupt_slicing(self):
         if self.is_slicing:
@@ -575,7 +625,7 @@ class DLPSlicer(QOpenGLWidget, QOpenGLFunctions):
                 self.glClear(GL.GL_STENCIL_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
                 self.ortho_matrix.setToIdentity()
                 self.ortho_matrix.ortho(self.global_bbox_width_mm / 2.0, -self.global_bbox_width_mm / 2.0, -self.global_bbox_depth_mm / 2.0, self.global_bbox_depth_mm / 2.0,
-                           0.0, self.slice_thickness_microns * ((sample + 1.0) / self.samples_per_pixel + self.current_slice) / 1000.0)
+                           0.0, self.layers_height_mm[self.current_slice] + self.layers_thickness_mm[self.current_slice] * (sample + 1.0) / self.samples_per_pixel)
                 self.ortho_matrix_array = np.asarray(self.ortho_matrix.copyDataTo(), np.float32)
                 GL.glUniformMatrix4fv(self.slicer_projection_matrix_location, 1, GL.GL_TRUE, self.ortho_matrix_array)
                 for geometry_idx in range(self.geometries_loaded):
@@ -586,6 +636,11 @@ class DLPSlicer(QOpenGLWidget, QOpenGLFunctions):
             self.__save_slice_to_disk__(self.temp_fbo)
             self.current_slice += 1
         if self.current_slice == self.number_of_slices:
+            if self.adaptive_layers:
+                self.__save_layers_schedule_to_disk__()
+            elif os.path.exists(self.save_directory_name + '/layers_thickness.txt'):
+                # a schedule of a previous adaptive slicing would be applied to these constant thickness layers
+                os.remove(self.save_directory_name + '/layers_thickness.txt')
             self.__reset_default_opengl_buffer__()
             self.update_slice_counts.emit(self.current_slice, self.number_of_slices)
 
@@ -268,6 +268,41 @@ class DLPSlicerGUI(QWidget):
         samples_per_pixel_edit.setValue(self.dlp_controller.samples_per_pixel)
         samples_per_pixel_edit.valueChanged.connect(self.__slicer_widget.set_samples_per_pixel)
 
+        adaptive_layers_box = QCheckBox("Adaptive Layers", self.__slicer_options_widget)
+        adaptive_layers_box.setChecked(self.__slicer_widget.adaptive_layers)
+        adaptive_layers_box.toggled.connect(self.__slicer_widget.set_adaptive_layers)
+        adaptive_layers_box.toggled.connect(thickness_edit.setDisabled)
+        min_thickness_edit = QDoubleSpinBox(self.__slicer_options_widget)
+        min_thickness_edit.setPrefix("Min: ")
+        min_thickness_edit.setSuffix(str('\u03BCm'))
+        min_thickness_edit.setMaximum(1000000)
+        min_thickness_edit.setMinimum(0.001)
+        min_thickness_edit.setDecimals(3)
+        min_thickness_edit.setSingleStep(0.001)
+        min_thickness_edit.setValue(self.__slicer_widget.min_slice_thickness_microns)
+        min_thickness_edit.valueChanged.connect(self.__slicer_widget.set_min_slice_thickness)
+        max_thickness_edit = QDoubleSpinBox(self.__slicer_options_widget)
+        max_thickness_edit.setPrefix("Max: ")
+        max_thickness_edit.setSuffix(str('\u03BCm'))
+        max_thickness_edit.setMaximum(1000000)
+        max_thickness_edit.setMinimum(0.001)
+        max_thickness_edit.setDecimals(3)
+        max_thickness_edit.setSingleStep(0.001)
+        max_thickness_edit.setValue(self.__slicer_widget.max_slice_thickness_microns)
+        max_thickness_edit.valueChanged.connect(self.__slicer_widget.set_max_slice_thickness)
+        cusp_height_label = QLabel("Cusp Height", self.__slicer_options_widget)
+        cusp_height_edit = QDoubleSpinBox(self.__slicer_options_widget)
+        cusp_height_edit.setSuffix(str('\u03BCm'))
+        cusp_height_edit.setMaximum(1000000)
+        cusp_height_edit.setMinimum(0.001)
+        cusp_height_edit.setDecimals(3)
+        cusp_height_edit.setSingleStep(0.001)
+        cusp_height_edit.setValue(self.__slicer_widget.cusp_height_microns)
+        cusp_height_edit.valueChanged.connect(self.__slicer_widget.set_cusp_height)
+        for widget in (min_thickness_edit, max_thickness_edit, cusp_height_edit):
+            widget.setEnabled(self.__slicer_widget.adaptive_layers)
+            adaptive_layers_box.toggled.connect(widget.setEnabled)
+
         slice_geometry_button = QPushButton("Slice Geometry")
         slice_geometry_button.clicked.connect(self.start_slicing_process)
 
@@ -282,6 +317,8 @@ class DLPSlicerGUI(QWidget):
         samples_per_pixel_row = 3
         slice_button_row = 4
         slices_label_row = 5
+        adaptive_layers_row = 6
+        cusp_height_row = 7
         # slice_interrupt_row = slice_button_row
 
         slice_layout = QGridLayout(self.__slicer_options_widget)
@@ -297,6 +334,11 @@ class DLPSlicerGUI(QWidget):
         slice_layout.addWidget(slice_interrupt_button, slice_button_row, 2)
         slice_layout.addWidget(samples_per_pixel_label, samples_per_pixel_row, 0)
         slice_layout.addWidget(samples_per_pixel_edit, samples_per_pixel_row, 1)
+        slice_layout.addWidget(adaptive_layers_box, adaptive_layers_row, 0)
+        slice_layout.addWidget(min_thickness_edit, adaptive_layers_row, 1)
+        slice_layout.addWidget(max_thickness_edit, adaptive_layers_row, 2)
+        slice_layout.addWidget(cusp_height_label, cusp_height_row, 0)
+        slice_layout.addWidget(cusp_height_edit, cusp_height_row, 1)
         self.__slicer_options_widget.setLayout(slice_layout)
 
     @Slot(float)
@@ -0,0 +1,323 @@
+import socket
+import threading
+import random
+import time
+import multiprocessing
+import numpy as np
+from collections import deque
+
+
+# simulated galvo controller to test the G-code sender without the Teensy. It listens on a local TCP socket and the
+# sender connects to the pyserial url "socket://localhost:<port>". The socket is only the transport of a simulated
+# serial line: the bytes are sent one after the other at baud_rate with 10 bits per byte in each direction and reach
+# the other side half of round_trip_latency_s later. The bytes that reach the controller fill a receive buffer of
+# rx_buffer_size bytes, the bytes that do not fit are lost. Every line is executed in command_latency_s and then
+# acknowledged with "ok". A line with a wrong checksum, or one picked with probability error_rate, is asked again
+# with "resend [number]". Numbered frames "N<number> <command>*<checksum>" must arrive in order: after a resend the
+# frames are dropped without reply until the requested one arrives, M110 restarts the numbering. A baud_rate of 0
+# sends the bytes without transfer time
+class ControllerSimulator():
+
+    def __init__(self, port=0, rx_buffer_size=127, command_latency_s=0.0005, error_rate=0.0, seed=0, baud_rate=115200,
+                 round_trip_latency_s=0.001):
+        self.rx_buffer_size = rx_buffer_size
+        self.command_latency_s = command_latency_s
+        self.error_rate = error_rate
+        self.baud_rate = baud_rate
+        self.round_trip_latency_s = round_trip_latency_s
+        self.__byte_time_s = 10.0 / baud_rate if baud_rate > 0 else 0.0
+        self.__random = random.Random(seed)
+        self.__server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__server.bind(('localhost', port))
+        self.__server.listen(1)
+        self.port = self.__server.getsockname()[1]
+        self.__connection = None
+        self.__is_running = False
+        self.__rx_buffer = bytearray()
+        self.__line_arrival_times = deque()
+        self.__rx_condition = threading.Condition()
+        # (arrival time of the first byte, bytes) on the line to the controller and (arrival time, connection, bytes)
+        # of the replies on the line to the sender, each line is busy until its free time
+        self.__rx_line = deque()
+        self.__rx_line_free_time = 0.0
+        self.__tx_line = deque()
+        self.__tx_line_free_time = 0.0
+        self.__tx_condition = threading.Condition()
+        self.__expected_line_number = 1
+        self.__threads = []
+        self.reset_statistics()
+
+    def get_url(self):
+        return "socket://localhost:%i" % self.port
+
+    def reset_statistics(self):
+        self.__received_lines = 0
+        self.__acknowledged_lines = 0
+        self.__resend_requests = 0
+        self.__dropped_frames = 0
+        self.__lost_bytes = 0
+        self.__max_rx_fill = 0
+        # time from the arrival of the last byte of a line to its reply
+        self.__latencies_s = []
+
+    def get_statistics(self):
+        latencies_ms = np.asarray(self.__latencies_s) * 1000
+        percentiles = np.percentile(latencies_ms, [50, 95, 99]) if len(latencies_ms) > 0 else np.zeros(3)
+        return {'received_lines': self.__received_lines,
+                'acknowledged_lines': self.__acknowledged_lines,
+                'resend_requests': self.__resend_requests,
+                'dropped_frames': self.__dropped_frames,
+                'lost_bytes': self.__lost_bytes,
+                'max_rx_fill': self.__max_rx_fill,
+                'latency_p50_ms': float(percentiles[0]),
+                'latency_p95_ms': float(percentiles[1]),
+                'latency_p99_ms': float(percentiles[2])}
+
+    def start(self):
+        self.__is_running = True
+        self.__threads = [threading.Thread(target=self.__accept_connections, daemon=True),
+                          threading.Thread(target=self.__deliver_bytes, daemon=True),
+                          threading.Thread(target=self.__execute_lines, daemon=True),
+                          threading.Thread(target=self.__transmit_replies, daemon=True)]
+        for thread in self.__threads:
+            thread.start()
+
+    def stop(self):
+        self.__is_running = False
+        with self.__rx_condition:
+            self.__rx_condition.notify_all()
+        with self.__tx_condition:
+            self.__tx_condition.notify_all()
+        # the shutdown wakes up the thread waiting in accept
+        try:
+            self.__server.shutdown(socket.SHUT_RDWR)
+        except:
+            pass
+        try:
+            self.__server.close()
+        except:
+            pass
+        self.__close_connection()
+        for thread in self.__threads:
+            thread.join(1)
+
+    def __close_connection(self):
+        if self.__connection is not None:
+            try:
+                self.__connection.close()
+            except:
+                pass
+            self.__connection = None
+
+    # one sender at a time, a new connection replaces the previous one
+    def __accept_connections(self):
+        while self.__is_running:
+            try:
+                connection, address = self.__server.accept()
+            except:
+                return
+            self.__close_connection()
+            with self.__rx_condition:
+                self.__rx_buffer = bytearray()
+                self.__line_arrival_times.clear()
+                self.__rx_line.clear()
+                self.__expected_line_number = 1
+                self.__connection = connection
+            with self.__tx_condition:
+                self.__tx_line.clear()
+            threading.Thread(target=self.__receive, args=(connection,), daemon=True).start()
+
+    # the bytes written by the sender are queued on the line, after the bytes still being transferred
+    def __receive(self, connection):
+        while self.__is_running:
+            try:
+                data = connection.recv(4096)
+            except:
+                return
+            if len(data) == 0:
+                return
+            send_time = time.perf_counter()
+            with self.__rx_condition:
+                if connection is not self.__connection:
+                    return
+                send_time = max(send_time, self.__rx_line_free_time)
+                self.__rx_line_free_time = send_time + len(data) * self.__byte_time_s
+                self.__rx_line.append((send_time + self.round_trip_latency_s / 2 + self.__byte_time_s, data))
+                self.__rx_condition.notify_all()
+
+    # moves the bytes that reached the controller from the line to the receive buffer
+    def __deliver_bytes(self):
+        while self.__is_running:
+            with self.__rx_condition:
+                while self.__is_running and (len(self.__rx_line) == 0 or self.__rx_line[0][0] > time.perf_counter()):
+                    self.__rx_condition.wait(None if len(self.__rx_line) == 0 else max(self.__rx_line[0][0] - time.perf_counter(), 0))
+                if not self.__is_running:
+                    return
+                arrival_time, data = self.__rx_line[0]
+                now = time.perf_counter()
+                count = len(data)
+                if self.__byte_time_s > 0:
+                    count = min(count, 1 + int((now - arrival_time) / self.__byte_time_s))
+                if count < len(data):
+                    self.__rx_line[0] = (arrival_time + count * self.__byte_time_s, data[count:])
+                else:
+                    self.__rx_line.popleft()
+                data = data[:count]
+                free_space = self.rx_buffer_size - len(self.__rx_buffer)
+                if len(data) > free_space:
+                    self.__lost_bytes += len(data) - max(free_space, 0)
+                    data = data[:max(free_space, 0)]
+                self.__rx_buffer += data
+                self.__line_arrival_times.extend([now] * data.count(b'\n'))
+                self.__max_rx_fill = max(self.__max_rx_fill, len(self.__rx_buffer))
+                self.__rx_condition.notify_all()
+
+    # the line stays in the receive buffer while it is executed
+    def __execute_lines(self):
+        while self.__is_running:
+            with self.__rx_condition:
+                while self.__is_running and self.__rx_buffer.find(b'\n') < 0:
+                    self.__rx_condition.wait()
+                if not self.__is_running:
+                    return
+                arrival_time = self.__line_arrival_times.popleft()
+                connection = self.__connection
+                line = bytes(self.__rx_buffer[:self.__rx_buffer.find(b'\n')])
+            if self.command_latency_s > 0:
+                time.sleep(self.command_latency_s)
+            with self.__rx_condition:
+                del self.__rx_buffer[:len(line) + 1]
+            reply = self.__get_reply(line.decode('ascii', 'replace').strip())
+            if reply is None:
+                continue
+            reply = reply.encode('ascii') + b'\n'
+            send_time = time.perf_counter()
+            self.__latencies_s.append(send_time - arrival_time)
+            with self.__tx_condition:
+                send_time = max(send_time, self.__tx_line_free_time)
+                self.__tx_line_free_time = send_time + len(reply) * self.__byte_time_s
+                self.__tx_line.append((self.__tx_line_free_time + self.round_trip_latency_s / 2, connection, reply))
+                self.__tx_condition.notify_all()
+
+    # the replies are written to the socket once they reached the sender
+    def __transmit_replies(self):
+        while self.__is_running:
+            with self.__tx_condition:
+                while self.__is_running and (len(self.__tx_line) == 0 or self.__tx_line[0][0] > time.perf_counter()):
+                    self.__tx_condition.wait(None if len(self.__tx_line) == 0 else max(self.__tx_line[0][0] - time.perf_counter(), 0))
+                if not self.__is_running:
+                    return
+                _, connection, reply = self.__tx_line.popleft()
+            try:
+                connection.sendall(reply)
+            except:
+                continue
+
+    def __get_reply(self, line):
+        self.__received_lines += 1
+        body, separator, checksum = line.rpartition('*')
+        if separator == '':
+            body, checksum = line, None
+        line_number = None
+        if body[0:1] == 'N':
+            number, _, command = body[1:].partition(' ')
+            try:
+                line_number = int(number)
+            except ValueError:
+                line_number = None
+            if line_number is not None and 'M110' not in command and line_number != self.__expected_line_number:
+                self.__dropped_frames += 1
+                return None
+        is_corrupted = checksum is not None and not self.__is_valid_checksum(body, checksum)
+        if is_corrupted or self.__random.random() < self.error_rate:
+            self.__resend_requests += 1
+            if line_number is not None:
+                return "resend %i" % self.__expected_line_number
+            return "resend"
+        if line_number is not None:
+            self.__expected_line_number = line_number + 1
+        self.__acknowledged_lines += 1
+        return "ok"
+
+    @staticmethod
+    def __is_valid_checksum(body, checksum):
+        value = 0
+        for byte in body.encode('ascii', 'replace'):
+            value ^= byte
+        try:
+            return value == int(checksum)
+        except ValueError:
+            return False
+
+
+# ControllerSimulator running in a process of its own, so that its threads do not share the interpreter lock with the
+# sender they measure. The arguments are the ones of ControllerSimulator, the statistics are kept when it is stopped
+class ControllerSimulatorProcess():
+
+    def __init__(self, **arguments):
+        self.__arguments = arguments
+        self.__connection = None
+        self.__process = None
+        self.__statistics = None
+        self.port = None
+
+    def get_url(self):
+        return "socket://localhost:%i" % self.port
+
+    # spawned on every platform, like on Windows, the simulator does not inherit the threads of the caller
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        self.__connection, child_connection = context.Pipe()
+        self.__process = context.Process(target=serve_simulator, args=(child_connection, self.__arguments), daemon=True)
+        self.__process.start()
+        child_connection.close()
+        self.port = self.__connection.recv()
+
+    def reset_statistics(self):
+        self.__statistics = None
+        self.__connection.send('reset_statistics')
+        self.__connection.recv()
+
+    def get_statistics(self):
+        if self.__process is not None:
+            self.__connection.send('get_statistics')
+            return self.__connection.recv()
+        return self.__statistics
+
+    def stop(self):
+        if self.__process is None:
+            return
+        try:
+            self.__connection.send('stop')
+            self.__statistics = self.__connection.recv()
+        except (OSError, EOFError):
+            pass
+        self.__process.join(5)
+        if self.__process.is_alive():
+            self.__process.terminate()
+        self.__connection.close()
+        self.__process = None
+
+
+# entry point of the simulator process: it sends the port of the simulator, then it answers the requests of
+# ControllerSimulatorProcess until it is stopped or the connection is closed
+def serve_simulator(connection, arguments):
+    simulator = ControllerSimulator(**arguments)
+    simulator.start()
+    connection.send(simulator.port)
+    try:
+        while True:
+            request = connection.recv()
+            if request == 'reset_statistics':
+                simulator.reset_statistics()
+                connection.send(None)
+            elif request == 'get_statistics':
+                connection.send(simulator.get_statistics())
+            else:
+                break
+        connection.send(simulator.get_statistics())
+    except (OSError, EOFError):
+        pass
+    finally:
+        simulator.stop()
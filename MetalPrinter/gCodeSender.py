@@ -7,15 +7,30 @@ from motors.clearpathSCSK import ClearpathSCSK
 import serial
 import serial.tools.list_ports
 import time
-from PySide2.QtCore import QObject, Signal, Slot, QRunnable, QThreadPool
-import array
+import threading
+import queue
+from PySide2.QtCore import QObject, Signal, Slot, QTimer
 import random
+from collections import deque
+import numpy as np
+from helpers import gcode_helpers
+from helpers import log_helpers
+from helpers import print_time_helpers
+from pathlib import Path
 
 
 class GCodeSender(QObject):
 
     print_text_signal = Signal(str)
     percentage_progress_signal = Signal(int)
+    state_changed_signal = Signal(str)
+    etc_updated_signal = Signal(float)
+
+    # states of the job: a job runs in its own thread from start() until it is completed or stopped
+    IDLE = 'idle'
+    STREAMING = 'streaming'
+    PAUSED = 'paused'
+    STOPPING = 'stopping'
 
     def __init__(self):
         QObject.__init__(self)
@@ -31,9 +46,63 @@ class GCodeSender(QObject):
         self.__wiper_recoat_feedrate_mm_min = 1800
         self.__building_plate_recoat_offset_mm = 1
         self.__building_plate_recoat_feedrate_mm_min = 300
-        self.__pause_toggle = False
+        self.__state = self.IDLE
+        self.__state_lock = threading.Lock()
+        # set while the job can run, cleared while paused
+        self.__resume_event = threading.Event()
+        self.__resume_event.set()
+        self.__stop_event = threading.Event()
+        self.__job_thread = None
+        # the replies of the controller are read by a reader thread while the serial port is open
+        self.__replies = queue.Queue()
+        self.__reader_thread = None
+        self.__reply_timeout_s = 0.1
+        # time given to a stopped job to send its last commands when the connection is closed
+        self.__stop_timeout_s = 5.0
+        self.__write_lock = threading.Lock()
+        # in streaming mode the commands are sent with line numbers without waiting for each reply, as long as the
+        # characters not yet acknowledged fit in the receive buffer of the controller
+        self.__streaming_mode = False
+        self.__rx_buffer_size = 127
+        self.__stream_line_number = 0
+        self.__stream_pending = deque()
+        self.__stream_in_flight = deque()
+        self.__stream_in_flight_chars = 0
+        self.__stream_stale_chars = 0
+        self.__stream_resends = 0
+        # with pipelined recoating the motor commands of a job run in a motor thread, while the motors move the
+        # following serial commands are read and framed in a lookahead buffer and written as soon as the motors stop
+        self.__pipelined_recoating = True
+        self.__lookahead_size = 4096
+        self.__lookahead = []
+        self.__motor_commands = queue.Queue()
+        self.__motor_thread = None
+        self.__pending_motor_commands = 0
+        self.__motor_lock = threading.Lock()
+        self.__motors_idle_event = threading.Event()
+        self.__motors_idle_event.set()
+        # the messages of any thread are shown in the console as a block at a fixed refresh rate, the progress is
+        # emitted only when it changes. Every message is written to the rotating file log
+        base_path = Path(__file__).parent
+        self.__console_log = log_helpers.ConsoleLogBuffer(capacity=500, verbosity=log_helpers.LOG_LINES,
+                                                          logger=log_helpers.get_rotating_file_logger('gcode_sender', str((base_path / '../resources/GCODE_SENDER.log').resolve())))
+        self.__progress_percentage = 0
+        self.__emitted_progress_percentage = -1
+        # estimated time of each layer of the loaded job, row 0 are the commands before the first layer. While the job
+        # runs the remaining time is scaled by the ratio of the elapsed time to the estimate of the completed layers
+        self.__layer_times_ms = None
+        self.__remaining_time_ms = 0
+        self.__emitted_remaining_time_ms = -1
+        self.__console_refresh_ms = 100
+        self.__console_timer = QTimer(self)
+        self.__console_timer.timeout.connect(self.__flush_console)
+        self.__console_timer.start(self.__console_refresh_ms)
         self.__ser = serial.Serial(timeout=5, write_timeout=0)
-        self.__loaded_gcode = []
+        # text or binary job reader, the commands are read from the file while streaming
+        self.__job_file = None
+        self.__job_file_path = ''
+        self.__checkpoint_path = ''
+        self.__owns_job_file = True
         self.__number_of_lines = 0
         self.__baudrates_list = (115200, 57600, 38400, 28800, 19200, 14400, 9600, 4800, 2400, 1200, 600, 300)
         self.__baudrate = self.__baudrates_list[0]
@@ -46,8 +115,6 @@ class GCodeSender(QObject):
         if len(self.__available_ports) > 0:
             self.__com_port = self.__available_ports[0]
 
-        self.__threadpool = QThreadPool()
-
     def __del__(self):
         self.close_connection()
 
@@ -84,6 +151,52 @@ class GCodeSender(QObject):
         self.__wiper_recoat_feedrate_mm_min = value
 
     @Slot()
+    def get_streaming_mode(self):
+        return self.__streaming_mode
+
+    @Slot(bool)
+    def set_streaming_mode(self, value):
+        self.__streaming_mode = value
+
+    @Slot()
+    def get_rx_buffer_size(self):
+        return self.__rx_buffer_size
+
+    @Slot(int)
+    def set_rx_buffer_size(self, value):
+        self.__rx_buffer_size = value
+
+    @Slot()
+    def get_pipelined_recoating(self):
+        return self.__pipelined_recoating
+
+    @Slot(bool)
+    def set_pipelined_recoating(self, value):
+        self.__pipelined_recoating = value
+
+    @Slot()
+    def get_console_verbosity(self):
+        return self.__console_log.verbosity
+
+    @Slot(int)
+    def set_console_verbosity(self, value):
+        self.__console_log.verbosity = value
+
+    def __log(self, text, level=log_helpers.LOG_STATUS):
+        self.__console_log.append(text, level)
+
+    @Slot()
+    def __flush_console(self):
+        block = self.__console_log.take_block()
+        if block is not None:
+            self.print_text_signal.emit(block)
+        if self.__progress_percentage != self.__emitted_progress_percentage:
+            self.__emitted_progress_percentage = self.__progress_percentage
+            self.percentage_progress_signal.emit(self.__progress_percentage)
+        if self.__remaining_time_ms != self.__emitted_remaining_time_ms:
+            self.__emitted_remaining_time_ms = self.__remaining_time_ms
+            self.etc_updated_signal.emit(self.__remaining_time_ms)
+
     def get_motor_ports_connected(self):
         return self.__motor_ports_connected
 
@@ -132,11 +245,11 @@ class GCodeSender(QObject):
         self.__wiper_node = value
 
     def home_motors(self):
-        self.print_text_signal.emit("..Homing Build plate..")
+        self.__log("..Homing Build plate..")
         self.__motor.home_motor(self.__building_plate_node, self.__building_plate_port, wait_for_motor=True)
-        self.print_text_signal.emit("..Homing Wiper..")
+        self.__log("..Homing Wiper..")
         self.__motor.home_motor(self.__wiper_node, self.__wiper_port, wait_for_motor=True)
-        self.print_text_signal.emit("..Done Homing..")
+        self.__log("..Done Homing..")
 
     def motor_connect(self):
         is_connected, self.__motor_ports_connected, self.__motor_nodes_count_list, self.__motor_nodes_id_list = self.__motor.connect_motor()
@@ -147,190 +260,552 @@ class GCodeSender(QObject):
         self.__motor.set_node_parameters(node=self.__building_plate_node, spindle_pitch_microns=4000, steps_per_revolution=6400, axis_orientation=-1)
         self.__motor.set_node_parameters(node=self.__wiper_node, spindle_pitch_microns=4000, steps_per_revolution=6400, axis_orientation=1)
         if self.__motor.is_connected:
-            self.print_text_signal.emit("Connection to ClearPath Motors established!")
+            self.__log("Connection to ClearPath Motors established!")
         else:
-            self.print_text_signal.emit("... problems connecting to ClearPath Motors!")
+            self.__log("... problems connecting to ClearPath Motors!")
+
+    def get_state(self):
+        return self.__state
+
+    def __set_state(self, state):
+        self.__state = state
+        self.state_changed_signal.emit(state)
 
+    # pausing clears the resume event, the job thread stops before its next line and waits on the event
     def pause(self):
-        self.__pause_toggle = not self.__pause_toggle
-        print("pausing")
-        # self.execute_gcode_command("S1")
-        if self.__pause_toggle:
-            self.print_text_signal.emit("Program Paused")
-        else:
-            self.print_text_signal.emit("Program Unpaused")
+        with self.__state_lock:
+            if self.__state == self.STREAMING:
+                self.__resume_event.clear()
+                self.__set_state(self.PAUSED)
+                self.__log("Program Paused")
+            elif self.__state == self.PAUSED:
+                self.__resume_event.set()
+                self.__set_state(self.STREAMING)
+                self.__log("Program Unpaused")
+
+    # the job thread stops before its next line, or at its next reply wait when it is waiting for the controller
+    @Slot()
+    def stop(self):
+        with self.__state_lock:
+            if self.__state in (self.STREAMING, self.PAUSED):
+                self.__set_state(self.STOPPING)
+                self.__stop_event.set()
+                self.__resume_event.set()
 
     def disconnect(self):
+        self.stop()
         self.__ser.close()
-        self.print_text_signal.emit("Serial Connection is Closed")
+        self.__log("Serial Connection is Closed")
 
     def start(self):
-        worker = Worker(self.__start)
-        self.__threadpool.start(worker)
-        # self.__start()
-
-    def __start(self):
-        self.print_text_signal.emit("Starting Printing Process!")
-        self.__pause_toggle = False
-        pause_command_to_send = False
-        for line_idx, line in enumerate(self.__loaded_gcode):
-            if self.__pause_toggle:
-                self.execute_gcode_command("S1")
-                pause_command_to_send = True
-            while self.__pause_toggle:
-                useless_command = 1
-                # print("I am paused!")
-                # time.sleep(1)
-            if pause_command_to_send:
-                self.execute_gcode_command("S1")
-                pause_command_to_send = False
-
-            line = self.remove_comment(line).strip()
-            # line = line.strip()  # Strip all EOL characters for streaming
-            progress_percentage = (line_idx + 1) / self.__number_of_lines * 100
-            self.percentage_progress_signal.emit(int(progress_percentage))
-            if not line.isspace() and len(line) > 0:
-                self.print_text_signal.emit('Executing Line: ' + line)
-                self.execute_gcode_command(line)
+        self.resume_from_layer(0)
+
+    # the job is resumed from the first layer not completed in the checkpoint of the loaded job
+    @Slot()
+    def resume(self):
+        checkpoint = self.__read_checkpoint()
+        if checkpoint is None:
+            self.__log("No checkpoint found for the loaded job!")
+            return
+        if self.__job_file is not None and checkpoint['completed_layers'] >= self.__job_file.number_of_layers():
+            self.__log("The job of the checkpoint is completed!")
+            return
+        self.resume_from_layer(checkpoint['completed_layers'])
+
+    def get_checkpoint_layer(self):
+        checkpoint = self.__read_checkpoint()
+        if checkpoint is None:
+            return 0
+        return checkpoint['completed_layers']
+
+    def get_progress(self):
+        return self.__progress_percentage
+
+    def get_remaining_time(self):
+        return self.__remaining_time_ms
+
+    def get_number_of_layers(self):
+        if self.__job_file is None:
+            return 0
+        return self.__job_file.number_of_layers()
+
+    @Slot(int)
+    def resume_from_layer(self, layer_idx):
+        if self.__job_file is None:
+            self.__log("No GCode file loaded!")
+            return
+        if layer_idx < 0 or (layer_idx > 0 and layer_idx >= self.__job_file.number_of_layers()):
+            self.__log("Invalid layer: %i" % layer_idx)
+            return
+        with self.__state_lock:
+            if self.__state != self.IDLE:
+                self.__log("A job is already running!")
+                return
+            self.__stop_event.clear()
+            self.__resume_event.set()
+            self.__set_state(self.STREAMING)
+        self.__job_thread = threading.Thread(target=self.__run_job, args=(layer_idx,), daemon=True)
+        self.__job_thread.start()
+
+    # a checkpoint is saved every time all the commands of a layer are acknowledged
+    def __run_job(self, first_layer=0):
+        if first_layer > 0:
+            self.__log("Resuming Printing Process from Layer %i!" % first_layer)
+        else:
+            self.__log("Starting Printing Process!")
+        try:
+            job_lines = self.__job_file.commands(first_layer)
+            self.__number_of_lines = self.__job_file.number_of_commands(first_layer)
+            layer_command_counts = self.__job_file.layer_command_counts()[first_layer:]
+            layer_ends = self.__number_of_lines - int(layer_command_counts.sum()) + np.cumsum(layer_command_counts)
+            completed_layers = first_layer
+            job_start_time = time.perf_counter()
+            self.__update_remaining_time(first_layer, completed_layers, 0)
+            self.__start_motor_thread()
+            if self.__streaming_mode:
+                self.__start_stream()
+            # the frames of the serial commands are built a batch at a time, in streaming mode with the line numbers
+            # that follow M110
+            framed_lines = gcode_helpers.framed_commands(job_lines, 1 if self.__streaming_mode else None)
+            for line_idx, (line, line_number, frame) in enumerate(framed_lines):
+                if not self.__resume_event.is_set():
+                    self.__flush_lookahead()
+                    self.__drain_stream()
+                    self.execute_gcode_command("S1")
+                    pause_start_time = time.perf_counter()
+                    self.__resume_event.wait()
+                    # the pause is not part of the print time
+                    job_start_time += time.perf_counter() - pause_start_time
+                    # a stopped job unpauses the controller too, before its stop sequence
+                    self.execute_gcode_command("S1")
+                if self.__stop_event.is_set():
+                    break
+                progress_percentage = (line_idx + 1) / self.__number_of_lines * 100
+                self.__progress_percentage = int(progress_percentage)
+                if len(line) > 0:
+                    self.__log('Executing Line: ' + line, log_helpers.LOG_LINES)
+                    self.__execute_job_command(line, line_number, frame)
+                if completed_layers - first_layer < len(layer_ends) and line_idx + 1 >= layer_ends[completed_layers - first_layer]:
+                    self.__flush_lookahead()
+                    self.__drain_stream()
+                    if self.__stop_event.is_set():
+                        break
+                    while completed_layers - first_layer < len(layer_ends) and line_idx + 1 >= layer_ends[completed_layers - first_layer]:
+                        completed_layers += 1
+                    self.__save_checkpoint(completed_layers, line_idx + 1)
+                    self.__update_remaining_time(first_layer, completed_layers, time.perf_counter() - job_start_time)
+            framed_lines.close()
+            job_lines.close()
+            self.__flush_lookahead()
+            self.__drain_stream()
+            if self.__stop_event.is_set():
+                self.__log("Printing Process Stopped!")
+            elif self.__streaming_mode:
+                self.__log("Lines resent: %i" % self.__stream_resends)
+            if not self.__stop_event.is_set():
+                self.__remaining_time_ms = 0
+        finally:
+            self.__stop_motor_thread()
+            self.__lookahead = []
+            with self.__state_lock:
+                self.__set_state(self.IDLE)
+
+    def __update_remaining_time(self, first_layer, completed_layers, elapsed_time_s):
+        layer_times_ms = self.__layer_times_ms
+        if layer_times_ms is None:
+            return
+        remaining_time_ms = float(layer_times_ms[completed_layers + 1:].sum())
+        estimated_time_ms = float(layer_times_ms[0] + layer_times_ms[first_layer + 1:completed_layers + 1].sum())
+        if elapsed_time_s > 0 and estimated_time_ms > 0:
+            remaining_time_ms *= elapsed_time_s * 1000 / estimated_time_ms
+        self.__remaining_time_ms = round(remaining_time_ms / 1000) * 1000
+
+    # the print time of the loaded job is estimated in a thread, the commands of a large job take a while to read
+    def __start_time_estimate(self):
+        self.__layer_times_ms = None
+        self.__remaining_time_ms = 0
+        threading.Thread(target=self.__estimate_print_time, args=(self.__job_file,), daemon=True).start()
+
+    def __estimate_print_time(self, job_file):
+        model = print_time_helpers.PrintTimeModel(baudrate=self.__baudrate, streaming_mode=self.__streaming_mode,
+                                                  wiper_recoat_offset_mm=self.__wiper_recoat_offset_mm,
+                                                  wiper_recoat_feedrate_mm_min=self.__wiper_recoat_feedrate_mm_min,
+                                                  building_plate_recoat_offset_mm=self.__building_plate_recoat_offset_mm,
+                                                  building_plate_recoat_feedrate_mm_min=self.__building_plate_recoat_feedrate_mm_min)
+        try:
+            estimate = print_time_helpers.estimate_job(job_file, model)
+        except Exception as e:
+            print(e)
+            if job_file is self.__job_file:
+                self.__log("Problems estimating the print time!")
+            return
+        if job_file is not self.__job_file:
+            return
+        self.__layer_times_ms = estimate['layers']['total_ms']
+        if self.get_state() == self.IDLE:
+            self.__remaining_time_ms = round(estimate['total_ms'] / 1000) * 1000
+        self.__log("Estimated print time: %s" % print_time_helpers.format_duration(estimate['total_ms']))
+
+    # the serial commands read while the motors move wait in the lookahead buffer, in streaming mode they are framed
+    # and queued as pending frames. A motor command starts when all the previous serial commands are acknowledged
+    def __execute_job_command(self, command, line_number=None, frame=None):
+        if command[0:1] == "C":
+            self.__flush_lookahead()
+            self.__drain_stream()
+            self.__submit_motor_command(command)
+            if not self.__pipelined_recoating:
+                self.__wait_for_motors()
+        elif not self.__motors_idle_event.is_set() or len(self.__lookahead) > 0:
+            if self.__streaming_mode and self.__ser.is_open:
+                self.__stream_line_number += 1
+                self.__queue_stream_frame(command, frame if line_number == self.__stream_line_number else None)
+            self.__lookahead.append((command, frame))
+            if len(self.__lookahead) >= self.__lookahead_size or self.__motors_idle_event.is_set():
+                self.__flush_lookahead()
+        elif self.__streaming_mode:
+            self.__stream_gcode_command(command, line_number, frame)
+        else:
+            self.execute_gcode_command(command, frame=frame)
+
+    def __flush_lookahead(self):
+        if len(self.__lookahead) == 0:
+            return
+        self.__wait_for_motors()
+        if self.__streaming_mode:
+            self.__pump_stream()
+        else:
+            for command, frame in self.__lookahead:
+                if self.__stop_event.is_set():
+                    break
+                self.execute_gcode_command(command, frame=frame)
+        self.__lookahead = []
+
+    def __start_motor_thread(self):
+        self.__motor_thread = threading.Thread(target=self.__run_motor_commands, daemon=True)
+        self.__motor_thread.start()
+
+    def __stop_motor_thread(self):
+        if self.__motor_thread is not None:
+            self.__motor_commands.put(None)
+            self.__motor_thread.join()
+            self.__motor_thread = None
+
+    def __submit_motor_command(self, command):
+        with self.__motor_lock:
+            self.__pending_motor_commands += 1
+            self.__motors_idle_event.clear()
+        self.__motor_commands.put(command)
+
+    # the commands left when the job is stopped are skipped
+    def __run_motor_commands(self):
+        while True:
+            command = self.__motor_commands.get()
+            if command is None:
+                return
+            if not self.__stop_event.is_set():
+                try:
+                    self.__execute_motor_command(command)
+                except Exception as e:
+                    print(e)
+                    self.__log("Problems executing the motor command " + command)
+            with self.__motor_lock:
+                self.__pending_motor_commands -= 1
+                if self.__pending_motor_commands == 0:
+                    self.__motors_idle_event.set()
+
+    def __wait_for_motors(self):
+        while not self.__motors_idle_event.wait(self.__reply_timeout_s):
+            if self.__stop_event.is_set() and self.__motor_commands.empty():
+                return
+
+    def __save_checkpoint(self, completed_layers, line_idx):
+        try:
+            gcode_helpers.write_job_checkpoint(self.__checkpoint_path, {'job_file': self.__job_file_path, 'completed_layers': int(completed_layers),
+                                                                      'number_of_layers': self.__job_file.number_of_layers(), 'line': int(line_idx)})
+        except Exception as e:
+            print(e)
+            self.__log("Problems saving the job checkpoint!")
+
+    # the line numbers restart from 0 with M110, every following frame is "N<number> <command>*<checksum>"
+    def __start_stream(self):
+        self.__stream_line_number = 0
+        self.__stream_pending.clear()
+        self.__stream_in_flight.clear()
+        self.__stream_in_flight_chars = 0
+        self.__stream_stale_chars = 0
+        self.__stream_resends = 0
+        if self.__ser.is_open:
+            self.__write_stream_frame("M110")
+
+    # writes the command as soon as it fits in the free space of the controller receive buffer, the replies that
+    # arrived in the meantime are handled first. Motor commands wait for all the serial commands to be acknowledged
+    def __stream_gcode_command(self, command, line_number=None, frame=None):
+        if command[0:1] == "C":
+            self.__drain_stream()
+            self.__execute_motor_command(command)
+        elif self.__ser.is_open:
+            self.__stream_line_number += 1
+            self.__write_stream_frame(command, frame if line_number == self.__stream_line_number else None)
+        else:
+            self.__log("Serial connection NOT established!")
+            self.__log("-- Input will be ignored --")
+
+    def __write_stream_frame(self, command, frame=None):
+        self.__queue_stream_frame(command, frame)
+        self.__pump_stream()
+
+    # the frame built in advance is used as it is, it must have the current line number
+    def __queue_stream_frame(self, command, frame=None):
+        if frame is None:
+            frame = gcode_helpers.encode_frames([command], self.__stream_line_number)[0]
+        self.__stream_pending.append((self.__stream_line_number, frame))
+
+    # writes the pending frames while they fit in the free space of the receive buffer, the replies are read when
+    # they are available or when the buffer is full
+    def __pump_stream(self):
+        while not self.__replies.empty():
+            self.__read_stream_reply()
+        while len(self.__stream_pending) > 0 and not self.__stop_event.is_set():
+            line_number, msg = self.__stream_pending[0]
+            if len(self.__stream_in_flight) > 0 and self.__stream_in_flight_chars + len(msg) > self.__rx_buffer_size:
+                self.__read_stream_reply()
+                continue
+            self.__stream_pending.popleft()
+            self.__write_serial(msg)
+            self.__stream_in_flight.append((line_number, msg))
+            self.__stream_in_flight_chars += len(msg)
+
+    # every frame gets one reply in order: "ok" acknowledges the oldest frame in flight, "resend" (optionally with the
+    # line number) asks for that frame again. The controller drops the frames received after a corrupted one, so all
+    # the frames in flight from that line on go back in front of the pending ones. The dropped frames keep their space
+    # in the receive buffer until the controller replies to the first frame written after the resend
+    def __read_stream_reply(self):
+        received_msg = self.__read_reply()
+        if len(received_msg) == 0:
+            return
+        self.__log("Received: " + received_msg, log_helpers.LOG_LINES)
+        self.__stream_in_flight_chars -= self.__stream_stale_chars
+        self.__stream_stale_chars = 0
+        if received_msg.startswith('ok'):
+            if len(self.__stream_in_flight) > 0:
+                line_number, msg = self.__stream_in_flight.popleft()
+                self.__stream_in_flight_chars -= len(msg)
+        elif received_msg.lower().startswith('resend') and len(self.__stream_in_flight) > 0:
+            digits = ''.join(filter(str.isdigit, received_msg))
+            resend_line_number = int(digits) if len(digits) > 0 else self.__stream_in_flight[0][0]
+            while len(self.__stream_in_flight) > 1 and self.__stream_in_flight[0][0] < resend_line_number:
+                line_number, msg = self.__stream_in_flight.popleft()
+                self.__stream_in_flight_chars -= len(msg)
+            self.__stream_in_flight_chars -= len(self.__stream_in_flight[0][1])
+            self.__stream_stale_chars = self.__stream_in_flight_chars
+            self.__stream_resends += len(self.__stream_in_flight)
+            self.__stream_pending.extendleft(reversed(self.__stream_in_flight))
+            self.__stream_in_flight.clear()
+
+    # writes all the pending frames and waits for the replies of all the frames in flight
+    def __drain_stream(self):
+        while len(self.__stream_pending) + len(self.__stream_in_flight) > 0 and self.__ser.is_open and not self.__stop_event.is_set():
+            if len(self.__stream_pending) > 0:
+                self.__pump_stream()
+            else:
+                self.__read_stream_reply()
 
     def __execute_motor_command(self, command):
         if not self.__motor.is_connected:
-            self.print_text_signal.emit("...Motors are NOT connected!")
+            self.__log("...Motors are NOT connected!")
             return
         command = command.replace(" ", "")  # remove all whitespace for better reading
         # Homing
         if command[1] == "0":
-            self.print_text_signal.emit("...Homing motor...")
+            self.__log("...Homing motor...")
             self.home_motors()
         # Move building plate
         elif command[1] == "1":
-            self.print_text_signal.emit("...Moving Z stage...")
+            self.__log("...Moving Z stage...")
             is_relative = True
             movement_type = command[2]
             if movement_type == "A":
                 is_relative = False
             elif movement_type is not "R":
-                self.print_text_signal.emit("...Invalid Motor Command!")
+                self.__log("...Invalid Motor Command!")
                 return
             new_pos = float(command[3:])
             self.__motor.move_motor(distance_mm=new_pos, feed_rate_mm_min=300, is_relative=is_relative,
                                     node=self.__building_plate_node, wait_for_motor=True)
-            self.print_text_signal.emit("Build Height is " + str(self.__motor.print_motor_position(self.__building_plate_node, 0)) + " mm")
+            self.__log("Build Height is " + str(self.__motor.print_motor_position(self.__building_plate_node, 0)) + " mm")
         # Move wiper
         elif command[1] == "2":
-            self.print_text_signal.emit("...Moving Wiper...")
+            self.__log("...Moving Wiper...")
             is_relative = True
             movement_type = command[2]
             if movement_type == "A":
                 is_relative = False
             elif movement_type is not "R":
-                self.print_text_signal.emit("...Invalid Motor Command!")
+                self.__log("...Invalid Motor Command!")
                 return
             new_pos = float(command[3:])
             self.__motor.move_motor(distance_mm=new_pos, feed_rate_mm_min=300, is_relative=is_relative, node=self.__wiper_node, wait_for_motor=True)
-            self.print_text_signal.emit("Wiper position: " + str(self.__motor.print_motor_position(self.__wiper_node, 0)) + " mm")
+            self.__log("Wiper position: " + str(self.__motor.print_motor_position(self.__wiper_node, 0)) + " mm")
             #     return
         # Recoating
         elif command[1] == "3":
-            self.print_text_signal.emit("...Recoating...")
+            self.__log("...Recoating...")
             self.__motor.move_motor(distance_mm=self.__wiper_recoat_offset_mm, feed_rate_mm_min=self.__wiper_recoat_feedrate_mm_min, is_relative=False, node=self.__wiper_node, wait_for_motor=True)
             self.__motor.move_motor(distance_mm=self.__building_plate_recoat_offset_mm, feed_rate_mm_min=self.__building_plate_recoat_feedrate_mm_min, is_relative=True, node=self.__building_plate_node, wait_for_motor=True)
             self.__motor.move_motor(distance_mm=0, feed_rate_mm_min=self.__wiper_recoat_feedrate_mm_min, is_relative=False, node=self.__wiper_node, wait_for_motor=True)
             self.__motor.move_motor(distance_mm=-self.__building_plate_recoat_offset_mm, feed_rate_mm_min=self.__building_plate_recoat_feedrate_mm_min, is_relative=True, node=self.__building_plate_node, wait_for_motor=True)
         else:
-            self.print_text_signal.emit("..Not understood, sorry..")
+            self.__log("..Not understood, sorry..")
 
-    @staticmethod
-    def __append_checksum(msg):
-        checksum = 0
-        a1 = array.array('B', msg.encode('ascii'))
-        for idx in range(len(a1)):
-            checksum ^= a1[idx]
-        return (msg + '*' + str(checksum) + '\n').encode('ascii'), checksum
-
-    def execute_gcode_command(self, command, wait_for_serial=True):
-        self.print_text_signal.emit("Send: %s" % command)
+    # frame is the ready to send "<command>*<checksum>\n" when it was built in advance
+    def execute_gcode_command(self, command, wait_for_serial=True, frame=None):
+        self.__log("Send: %s" % command, log_helpers.LOG_LINES)
         if command[0:1] == "C":
             self.__execute_motor_command(command)
         elif self.__ser.is_open:
-            msg, checksum = self.__append_checksum(command)
-            self.__ser.write(msg)  # Send g-code block
+            if frame is None:
+                frame = gcode_helpers.encode_frames([command])[0]
+            self.__write_serial(frame)  # Send g-code block
             if wait_for_serial:
-                self.__wait_for_serial_reply(command)
+                self.__wait_for_serial_reply(frame)
         else:
-            self.print_text_signal.emit("Serial connection NOT established!")
-            self.print_text_signal.emit("-- Input will be ignored --")
+            self.__log("Serial connection NOT established!")
+            self.__log("-- Input will be ignored --")
 
     def emergency_stop(self):
+        self.stop()
         self.execute_gcode_command("S0", wait_for_serial=False)
-        self.print_text_signal.emit("Program was stopped - please restart unit!")
+        self.__log("Program was stopped - please restart unit!")
 
     # Pure functionality
     def connect_serial(self):
         self.__ser.close()
+        # a port like "socket://localhost:<port>" is opened through the pyserial url handlers
+        if '://' in self.__com_port:
+            self.__ser = serial.serial_for_url(self.__com_port, do_not_open=True, timeout=5, write_timeout=0)
+        elif not isinstance(self.__ser, serial.Serial):
+            self.__ser = serial.Serial(timeout=5, write_timeout=0)
         self.__ser.port = self.__com_port
         self.__ser.baudrate = self.__baudrate
         if self.__ser.port == '':
-            self.print_text_signal.emit("A valid port was NOT selected! Select a valid port.")
+            self.__log("A valid port was NOT selected! Select a valid port.")
             return False
         try:
             self.__ser.open()
-            self.print_text_signal.emit("Connecting to Arduino")
+            self.__log("Connecting to Arduino")
             time.sleep(2)  # Wait for  initialization # this line shouldn't be needed
             # self.execute_gcode_command("M999")
             # Wake up
             self.__ser.reset_input_buffer()  # Flush startup text in serial input
-            self.print_text_signal.emit("\nTeensy reporting ready for Phew Phew!\n")
+            self.__start_reader()
+            self.__log("\nTeensy reporting ready for Phew Phew!\n")
         except Exception as e:
             print(e)
             self.__ser.close()
-            self.print_text_signal.emit("Connection to " + self.__ser.port + " NOT established!")
+            self.__log("Connection to " + self.__ser.port + " NOT established!")
             return False
 
-    def __wait_for_serial_reply(self, command):
-        self.__ser.reset_input_buffer()  # Flush startup text in serial input
+    # the replies are queued by the reader thread until the port is closed
+    def __start_reader(self):
+        self.__replies = queue.Queue()
+        self.__reader_thread = threading.Thread(target=self.__read_serial, daemon=True)
+        self.__reader_thread.start()
+
+    def __read_serial(self):
+        while self.__ser.is_open:
+            try:
+                received_msg = self.__ser.readline().decode("utf-8").strip()
+            except:
+                break
+            if len(received_msg) > 0:
+                self.__replies.put(received_msg)
+
+    # next reply of the controller, empty if none arrives within the reply timeout
+    def __read_reply(self):
+        try:
+            return self.__replies.get(timeout=self.__reply_timeout_s)
+        except queue.Empty:
+            return ""
+
+    def __write_serial(self, msg):
+        with self.__write_lock:
+            self.__ser.write(msg)
+
+    # the input buffer is only flushed when connecting, flushing it here could drop the reply to the command just sent
+    def __wait_for_serial_reply(self, frame):
         # Serial read section
         received_msg = ""
-        to_resend = False
-        while received_msg != 'ok':
-            received_msg = self.__ser.readline().decode("utf-8").strip()
+        while received_msg != 'ok' and self.__ser.is_open:
+            # a stopped job does not wait for the reply of its last command
+            if self.__stop_event.is_set() and threading.current_thread() is self.__job_thread:
+                break
+            received_msg = self.__read_reply()
             if len(received_msg) > 0:
-                self.print_text_signal.emit("Received: " + received_msg)
+                self.__log("Received: " + received_msg, log_helpers.LOG_LINES)
             if received_msg == 'resend':
-                to_resend = True
-                break
-        if to_resend:
-            msg, checksum = self.__append_checksum(command)
-            self.__ser.write(msg)  # Send g-code block
-            self.__wait_for_serial_reply(command)
-        # if self.__pause_toggle is True:
-        #     self.execute_gcode_command("S1")
+                self.__write_serial(frame)  # Send g-code block
 
+    # the job is stopped and its thread joined before the motors and the port are closed, so that the job still
+    # reaches the controller while it stops
     @Slot()
     def close_connection(self):
+        self.stop()
+        if self.__job_thread is not None and self.__job_thread is not threading.current_thread():
+            self.__job_thread.join(self.__stop_timeout_s)
+            if self.__job_thread.is_alive():
+                self.__log("The job did not stop within %.1f s!" % self.__stop_timeout_s)
         if self.__motor.is_connected:
             self.__motor.disconnect_motor()
         if self.__ser.isOpen():
-            if self.__pause_toggle:
-                self.pause()
             self.__ser.close()
         print("Connection Closed!")
 
-    def open_file(self, file_path):
+    # a job file already parsed by the caller can be shared by several senders, it is closed by the caller. Senders
+    # printing the same job save their checkpoints next to the job file with different checkpoint names
+    def open_file(self, file_path, job_file=None, checkpoint_name=None):
+        if self.get_state() != self.IDLE:
+            self.__log("A job is running!")
+            return False
+        if self.__job_file is not None:
+            if self.__owns_job_file:
+                self.__job_file.close()
+            self.__job_file = None
+        self.__job_file_path = file_path
+        self.__checkpoint_path = file_path if checkpoint_name is None else checkpoint_name
+        self.__owns_job_file = job_file is None
+        # text files are memory mapped and scanned once for the layers, of binary files only the header and the
+        # layer index are read. The commands are read while streaming
         try:
-            f = open(file_path, 'r')
-            self.__loaded_gcode = f.readlines()
-            self.__loaded_gcode = list(filter(bool, self.__loaded_gcode))
-            self.__number_of_lines = len(self.__loaded_gcode)
-            self.print_text_signal.emit("File name: %s" % file_path)
-            self.print_text_signal.emit("Number of Lines: %s" % self.__number_of_lines)
-            self.percentage_progress_signal.emit(0)
-            f.close()
+            if job_file is None:
+                job_file = gcode_helpers.open_job_file(file_path)
+            self.__job_file = job_file
+            self.__number_of_lines = self.__job_file.number_of_commands()
+            self.__log("File name: %s" % file_path)
+            self.__log("Number of Layers: %s" % self.__job_file.number_of_layers())
+            self.__log("Number of Lines: %s" % self.__number_of_lines)
+            self.__print_checkpoint()
+            self.__progress_percentage = 0
+            self.__start_time_estimate()
         except Exception as e:
             print(e)
-            self.print_text_signal.emit("Problems loading the GCode file!")
+            self.__job_file = None
+            self.__log("Problems loading the job file!")
             return False
 
+    # None when the loaded job has no checkpoint, a corrupt checkpoint is reported and ignored
+    def __read_checkpoint(self):
+        try:
+            return gcode_helpers.read_job_checkpoint(self.__checkpoint_path)
+        except ValueError as e:
+            print(e)
+            self.__log("The job checkpoint is corrupt, it is ignored!")
+            return None
+
+    def __print_checkpoint(self):
+        checkpoint = self.__read_checkpoint()
+        if checkpoint is not None:
+            self.__log("Checkpoint: %i of %i layers completed" % (checkpoint['completed_layers'], self.__job_file.number_of_layers()))
+
     @staticmethod
     def remove_comment(string):
         if string.find(';') == -1:
@@ -356,14 +831,19 @@ class GCodeSender(QObject):
         else:
             self.__com_port = ''
 
+    # any port name or pyserial url, e.g. the url of a ControllerSimulator
+    @Slot(str)
+    def set_comport_url(self, url):
+        self.__com_port = url
+
     def get_comport(self):
         return self.__com_port
 
     @Slot(int)
     def set_baudrate(self, baudrate_idx):
         self.__baudrate = self.__baudrates_list[baudrate_idx]
-        self.print_text_signal.emit("Baudrate changed to %i" % self.__baudrate)
-        self.print_text_signal.emit("Reset the serial connection for this to have any effect!")
+        self.__log("Baudrate changed to %i" % self.__baudrate)
+        self.__log("Reset the serial connection for this to have any effect!")
 
     def get_baudrate(self):
         return self.__baudrate
@@ -371,16 +851,3 @@ class GCodeSender(QObject):
     def get_baudrates_list(self):
         return self.__baudrates_list
 
-
-class Worker(QRunnable):
-    def __init__(self, fn, *args, **kwargs):
-        super(Worker, self).__init__()
-        # Store constructor arguments (re-used for processing)
-        self.fn = fn
-        self.args = args
-        self.kwargs = kwargs
-
-    @Slot()
-    def run(self):
-        result = self.fn(*self.args, **self.kwargs)
-        return result
@@ -1,8 +1,9 @@
 from PySide2.QtWidgets import QProgressBar, QSizePolicy, QPushButton, QWidget, QLabel, QComboBox, QLineEdit, \
-    QGridLayout, QVBoxLayout, QPlainTextEdit, QFileDialog, QGroupBox, QDoubleSpinBox
+    QGridLayout, QVBoxLayout, QPlainTextEdit, QFileDialog, QGroupBox, QDoubleSpinBox, QCheckBox, QSpinBox, QInputDialog
 from PySide2.QtGui import QPalette, QColor
 from PySide2.QtCore import Signal, Slot, QLocale
 from MetalPrinter.gCodeSender import GCodeSender
+from helpers import print_time_helpers
 
 
 class MyQComboBox(QComboBox):
@@ -47,6 +48,7 @@ class GCodeSenderGUI(QWidget):
     def __init_console_widget(self, parent=None):
         self.__console_widget = QPlainTextEdit(parent)
         self.__console_widget.setReadOnly(True)
+        self.__console_widget.setMaximumBlockCount(10000)
         self.__console_widget.setStyleSheet("QPlainTextEdit { background-color : dimgrey}")
         palette = self.__console_widget.palette()
         palette.setColor(QPalette.Text, QColor(255, 255, 255))
@@ -61,6 +63,9 @@ class GCodeSenderGUI(QWidget):
         start_button = QPushButton("Start", self.__bottom_widget)
         start_button.setObjectName("start_button")
         start_button.clicked.connect(self.__g_code_sender.start)
+        resume_button = QPushButton("Resume", self.__bottom_widget)
+        resume_button.setObjectName("resume_button")
+        resume_button.clicked.connect(self.__resume_job)
         load_gcode_button = QPushButton("Load Gcode", self.__bottom_widget)
         load_gcode_button.setObjectName("load_gcode_button")
         load_gcode_button.clicked.connect(self.__load_gcode_file)
@@ -73,13 +78,17 @@ class GCodeSenderGUI(QWidget):
         self.__progress_bar.setObjectName("progress_bar")
         self.__progress_bar.setRange(0, 100)
         self.__g_code_sender.percentage_progress_signal.connect(self.__progress_bar.setValue)
+        self.__etc_label = QLabel("ETC: " + print_time_helpers.format_duration(0), self.__bottom_widget)
+        self.__g_code_sender.etc_updated_signal.connect(self.__update_time_estimate)
         # defining bottom layout
         bottom_layout = QGridLayout(self.__bottom_widget)
         bottom_layout.addWidget(self.__line_sender_edit, 0, 0, 1, 1)
         bottom_layout.addWidget(send_button, 0, 1, 1, 1)
         bottom_layout.addWidget(load_gcode_button, 0, 2, 1, 1)
         bottom_layout.addWidget(start_button, 0, 3, 1, 1)
+        bottom_layout.addWidget(resume_button, 0, 4, 1, 1)
         bottom_layout.addWidget(self.__progress_bar, 1, 0, 1, 4)
+        bottom_layout.addWidget(self.__etc_label, 1, 4, 1, 1)
 
     def __init_right_column_widget(self, parent=None):
         self.__right_column_widget = QWidget(parent)
@@ -114,9 +123,10 @@ class GCodeSenderGUI(QWidget):
         stop_button.clicked.connect(self.__g_code_sender.emergency_stop)
         stop_button.setStyleSheet("QPushButton {background-color: red; border-style: outset; border-width: 6px; "
                                   "border-radius: 10px; border-color: beige; font: bold 20px; padding: 10px;}")
-        pause_button = QPushButton("Pause", self.__right_column_widget)
-        pause_button.setObjectName("pause_button")
-        pause_button.clicked.connect(self.__g_code_sender.pause)
+        self.__pause_button = QPushButton("Pause", self.__right_column_widget)
+        self.__pause_button.setObjectName("pause_button")
+        self.__pause_button.clicked.connect(self.__g_code_sender.pause)
+        self.__g_code_sender.state_changed_signal.connect(self.__update_pause_button)
 
         right_column_layout = QVBoxLayout(self.__right_column_widget)
         right_column_layout.addWidget(stop_button)
@@ -128,7 +138,18 @@ class GCodeSenderGUI(QWidget):
         right_column_layout.addWidget(disconnect_button)
         right_column_layout.addWidget(motor_connect_button)
         right_column_layout.addWidget(home_motors_button)
-        right_column_layout.addWidget(pause_button)
+        right_column_layout.addWidget(self.__pause_button)
+
+    @Slot(str)
+    def __update_pause_button(self, state):
+        if state == self.__g_code_sender.PAUSED:
+            self.__pause_button.setText("Resume")
+        else:
+            self.__pause_button.setText("Pause")
+
+    @Slot(float)
+    def __update_time_estimate(self, etc_ms):
+        self.__etc_label.setText("ETC: " + print_time_helpers.format_duration(etc_ms))
 
     @Slot()
     def __send_single_command(self):
@@ -138,10 +159,22 @@ class GCodeSenderGUI(QWidget):
     @Slot()
     def __load_gcode_file(self):
         file_path = QFileDialog.getOpenFileName(caption='Select GCode File', dir='../',
-                                                  filter="GCode Files (*.g)")
+                                                  filter="GCode Files (*.g);;Binary Job Files (*.mjob)")
         file_path = file_path[0]
         self.__g_code_sender.open_file(file_path)
 
+    # the layer proposed is the first one not completed in the checkpoint of the job
+    @Slot()
+    def __resume_job(self):
+        number_of_layers = self.__g_code_sender.get_number_of_layers()
+        if number_of_layers == 0:
+            self.__g_code_sender.resume_from_layer(0)
+            return
+        layer_idx, ok = QInputDialog.getInt(self, "Resume Job", "Resume from layer:", min(self.__g_code_sender.get_checkpoint_layer(), number_of_layers - 1),
+                                            0, number_of_layers - 1)
+        if ok:
+            self.__g_code_sender.resume_from_layer(layer_idx)
+
     @Slot()
     def __update_ports_list(self):
         self.__g_code_sender.update_port_list()
@@ -195,6 +228,22 @@ class GCodeSenderGUI(QWidget):
         wiper_recoat_feedrate_spin.setSingleStep(0.001)
         wiper_recoat_feedrate_spin.setValue(self.__g_code_sender.get_wiper_recoating_feedrate())
         wiper_recoat_feedrate_spin.valueChanged.connect(self.__g_code_sender.set_wiper_recoat_feedrate)
+        streaming_mode_box = QCheckBox("Streaming mode", gcodesender_settings)
+        streaming_mode_box.setChecked(self.__g_code_sender.get_streaming_mode())
+        streaming_mode_box.toggled.connect(self.__g_code_sender.set_streaming_mode)
+        rx_buffer_size_label = QLabel("Controller receive buffer (bytes):", gcodesender_settings)
+        rx_buffer_size_spin = QSpinBox(gcodesender_settings)
+        rx_buffer_size_spin.setRange(16, 65536)
+        rx_buffer_size_spin.setValue(self.__g_code_sender.get_rx_buffer_size())
+        rx_buffer_size_spin.valueChanged.connect(self.__g_code_sender.set_rx_buffer_size)
+        pipelined_recoating_box = QCheckBox("Read the next layer while recoating", gcodesender_settings)
+        pipelined_recoating_box.setChecked(self.__g_code_sender.get_pipelined_recoating())
+        pipelined_recoating_box.toggled.connect(self.__g_code_sender.set_pipelined_recoating)
+        console_verbosity_label = QLabel("Console messages:", gcodesender_settings)
+        console_verbosity_combo_box = QComboBox(gcodesender_settings)
+        console_verbosity_combo_box.addItems(["Status", "Status and G-code lines"])
+        console_verbosity_combo_box.setCurrentIndex(self.__g_code_sender.get_console_verbosity())
+        console_verbosity_combo_box.currentIndexChanged.connect(self.__g_code_sender.set_console_verbosity)
         motor_layout = QGridLayout(gcodesender_settings)
         motor_layout.addWidget(buildplate_label, 0, 0)
         motor_layout.addWidget(self.buildplate_combo_box, 0, 1)
@@ -208,6 +257,12 @@ class GCodeSenderGUI(QWidget):
         motor_layout.addWidget(wiper_recoat_offset_spin, 4, 1)
         motor_layout.addWidget(wiper_recoat_feedrate_label, 5, 0)
         motor_layout.addWidget(wiper_recoat_feedrate_spin, 5, 1)
+        motor_layout.addWidget(streaming_mode_box, 6, 0)
+        motor_layout.addWidget(rx_buffer_size_label, 7, 0)
+        motor_layout.addWidget(rx_buffer_size_spin, 7, 1)
+        motor_layout.addWidget(console_verbosity_label, 8, 0)
+        motor_layout.addWidget(console_verbosity_combo_box, 8, 1)
+        motor_layout.addWidget(pipelined_recoating_box, 9, 0)
         return gcodesender_settings
 
     @Slot(int)
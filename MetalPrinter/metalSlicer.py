@@ -5,10 +5,16 @@ from PySide2.QtGui import QVector3D, QOpenGLFunctions, \
     QQuaternion, QOpenGLFramebufferObject, QOpenGLFramebufferObjectFormat, QImage, QMatrix4x4, Qt, QVector2D
 from OpenGL import GL
 import struct
+import os
+import shutil
+import tempfile
 from pathlib import Path
 from helpers import geometry_loader
 from helpers import slicer_helpers
-from helpers.slicer_helpers import  MetalSlicingParameters
+from helpers import nesting_helpers
+from helpers import polygon_helpers
+from helpers import gcode_helpers
+from helpers.slicer_helpers import  MetalSlicingParameters, SliceCache, ToolpathStore
 from helpers import my_shaders as ms
 from PyTracer import pyBVH, pyStructs, pyGeometry
 from itertools import compress
@@ -32,14 +38,37 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         self.default_infill_density = self.__default_parameters['infill_density']
         self.default_infill_overlap = self.__default_parameters['infill_overlap']
         self.default_infill_rotation = self.__default_parameters['infill_rotation']
+        self.default_infill_tile_size = self.__default_parameters['infill_tile_size (mm)']
         self.default_infill_laser_power = self.__default_parameters['infill_laser_power']
-        self.default_infill_scan_speed = self.__default_parameters['infill_scan_speed (mm/min)']
+        self.default_infill_scan_speed = self.__default_parameters['infill_scan_speed (mm/s)']
         self.default_infill_duty_cycle = self.__default_parameters['infill_duty_cycle (%)']
         self.default_infill_frequency = self.__default_parameters['infill_frequency (Hz)']
         self.default_contour_laser_power = self.__default_parameters['contour_laser_power']
-        self.default_contour_scan_speed = self.__default_parameters['contour_scan_speed (mm/min)']
+        self.default_contour_scan_speed = self.__default_parameters['contour_scan_speed (mm/s)']
         self.default_contour_duty_cycle = self.__default_parameters['contour_duty_cycle (%)']
         self.default_contour_frequency = self.__default_parameters['contour_frequency (Hz)']
+        self.default_contour_compression_tolerance = self.__default_parameters['contour_compression_tolerance (%)']
+        self.packing_spacing_mm = self.__default_parameters['packing_spacing (mm)']
+        self.packing_rotation_step = self.__default_parameters['packing_rotation_step (deg)']
+        self.laser_compensation = self.__default_parameters['laser_compensation']
+        self.contour_shells = self.__default_parameters['contour_shells']
+        self.contour_join_styles = ['round', 'miter']
+        self.contour_join_style = self.__default_parameters['contour_join_style']
+        self.optimize_scan_path = self.__default_parameters['optimize_scan_path']
+        self.scan_path_two_opt = self.__default_parameters['scan_path_2opt']
+        # processes formatting the layers of the G-code job, 0 uses all the cores and 1 formats them in this process
+        self.gcode_writer_processes = self.__default_parameters['gcode_writer_processes']
+        # jobs with at least this number of layers keep their toolpaths in spill files instead of memory
+        self.toolpath_spill_layers = self.__default_parameters['toolpath_spill_layers']
+        self.toolpath_spill_directory = None
+        self.spill_toolpaths = False
+        # (jump length before, jump length after) of each layer of the last written job, in mm
+        self.scan_path_jump_lengths = []
+        # when set the job is written while slicing, one layer as soon as all the geometries are sliced
+        self.stream_job_while_slicing = self.__default_parameters['stream_job_while_slicing']
+        self.__job_stream = None
+        self.__job_stream_file = None
+        self.__job_stream_geometry_idxs = []
         self.__number_of_decimals = 4
         # shader variables
         self.program_id = None
@@ -139,13 +168,30 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         self.slice_width = self.building_area_width_mm
         self.slice_height = self.building_area_width_mm
         self.slice_thickness_microns = self.__default_parameters['slice_thickness (microns)']  # microns
+        self.adaptive_layers = self.__default_parameters['adaptive_layers']
+        self.min_slice_thickness_microns = self.__default_parameters['min_slice_thickness (microns)']
+        self.max_slice_thickness_microns = self.__default_parameters['max_slice_thickness (microns)']
+        self.cusp_height_microns = self.__default_parameters['cusp_height (microns)']
+        self.layers_height_mm = []  # bottom height of each layer
+        self.layers_thickness_mm = []
         self.contour_strategies = ['Geometric', 'Image-Based', 'None']
         self.contour_strategy_idx = 0
-        self.infill_strategies = ['Parallel Lines', 'ZigZag', 'None']
+        # the contour runs can be simplified with Douglas-Peucker and written with G2/G3 arcs where they follow a circle
+        self.contour_compressions = ['None', 'Simplify', 'Simplify + Arcs']
+        self.contour_compression_idx = 0
+        self.infill_strategies = ['Parallel Lines', 'ZigZag', 'None', 'Island', 'Stripes']
+        # infill is computed with 2D scan lines over the layer section, the legacy per-ray BVH queries are kept for comparison
+        self.use_ray_casting_infill = self.__default_parameters['use_ray_casting_infill']
         self.infill_strategy_idx = 0
         self.current_slice = 0
         self.number_of_slices = 0
         self.is_slicing = False
+        self.slice_cache = SliceCache()
+        self.section_segments_memo = {}
+        self.hatch_templates = {}  # scan line templates of the ray casting infill, per (geometry, angle, rays)
+        self.tile_grids = {}  # tiles of the island and stripes infill, per (geometry, tile size, pattern)
+        self.slicing_time_budget_ms = 30  # cached layers are consumed in the same frame until this budget is exceeded
+        self.cached_layers_count = 0
         self.global_bbox_min = QVector3D(0.0, 0.0, 0.0)
         self.global_bbox_max = QVector3D(0.0, 0.0, 0.0)
 
@@ -202,9 +248,10 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
                                         self.default_infill_density, self.default_infill_overlap,
                                         self.default_infill_rotation, self.default_contour_laser_power,
                                         self.default_contour_scan_speed, self.default_contour_duty_cycle,
-                                        self.default_contour_frequency)
-        self.contour_vertices_list.append({'vertices': [], 'vertices_per_layer': [], 'layer_thickness': 0})
-        self.infill_vertices_list.append({'vertices': [], 'vertices_per_layer': [], 'layer_thickness': 0})
+                                        self.default_contour_frequency, self.default_infill_tile_size,
+                                        self.default_contour_compression_tolerance)
+        self.contour_vertices_list.append(ToolpathStore(ToolpathStore.CONTOUR))
+        self.infill_vertices_list.append(ToolpathStore(ToolpathStore.INFILL))
         self.slicing_parameters_list.append(params)
 
     @Slot()
@@ -270,10 +317,133 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         self.quad_normal_matrix = self.quad_model_matrix.normalMatrix()
         self.quad_normal_matrix_array = np.asarray(self.quad_normal_matrix.data(), np.float32)
 
+    @Slot(float)
+    def set_packing_spacing(self, value):
+        self.packing_spacing_mm = value
+
+    @Slot()
+    def pack_geometries(self):
+        if self.geometries_loaded == 0:
+            return []
+        footprints = []
+        rotation_angles = []
+        for geometry_idx in range(self.geometries_loaded):
+            current_geometry = self.geometries_list[geometry_idx]
+            transformation_matrix = current_geometry.rotation_matrix * current_geometry.scale_matrix
+            transformation_matrix = np.array(transformation_matrix.data(), dtype=np.float64).reshape(4, 4).transpose()
+            footprints.append(nesting_helpers.compute_footprint(current_geometry.get_vertices_list(), transformation_matrix))
+            # changing the y rotation turns the geometry around the vertical axis only when there is no x rotation
+            if current_geometry.get_x_rot() == 0 and self.packing_rotation_step > 0:
+                rotation_angles.append([int(angle) for angle in np.arange(0, 360, self.packing_rotation_step)])
+            else:
+                rotation_angles.append([0])
+        placements = nesting_helpers.pack_footprints(footprints, self.building_area_width_mm, self.building_area_height_mm,
+                                                     self.packing_spacing_mm, rotation_angles)
+        not_placed = []
+        for geometry_idx in range(self.geometries_loaded):
+            current_geometry = self.geometries_list[geometry_idx]
+            if placements[geometry_idx] is None:
+                not_placed.append(geometry_idx)
+                continue
+            angle, x_offset, z_offset = placements[geometry_idx]
+            if angle != 0:
+                y_rotation = (current_geometry.get_y_rot() + angle + 180) % 360 - 180
+                current_geometry.set_y_rotation(y_rotation)
+            current_geometry.set_x_pos(x_offset - self.building_area_width_mm * 0.5)
+            current_geometry.set_z_pos(z_offset - self.building_area_height_mm * 0.5)
+        return not_placed
+
+    @Slot(bool)
+    def set_laser_compensation(self, value):
+        self.laser_compensation = value
+
+    @Slot(int)
+    def set_contour_shells(self, value):
+        self.contour_shells = value
+
+    @Slot(int)
+    def set_contour_join_style_idx(self, idx):
+        self.contour_join_style = self.contour_join_styles[idx]
+
+    @Slot(bool)
+    def set_optimize_scan_path(self, value):
+        self.optimize_scan_path = value
+
+    @Slot(bool)
+    def set_use_ray_casting_infill(self, value):
+        self.use_ray_casting_infill = value
+
+    @Slot(bool)
+    def set_stream_job_while_slicing(self, value):
+        self.stream_job_while_slicing = value
+
+    # offsets of the contour shells towards the inside of the geometry, with laser compensation the outer shell is
+    # moved by half of the laser width so that the melted track stays inside the geometric boundary
+    def __get_contour_offsets_mm__(self):
+        laser_width_mm = self.laser_width_microns / 1000
+        base_offset = laser_width_mm * 0.5 if self.laser_compensation else 0.0
+        return [base_offset + shell_idx * laser_width_mm for shell_idx in range(max(self.contour_shells, 1))]
+
+    # the infill starts at the inner edge of the innermost shell, a single uncompensated shell is centred on the
+    # boundary and the infill keeps filling the whole section
+    def __get_infill_offset_mm__(self):
+        laser_width_mm = self.laser_width_microns / 1000
+        if self.laser_compensation:
+            return max(self.contour_shells, 1) * laser_width_mm
+        if self.contour_shells > 1:
+            return (self.contour_shells - 0.5) * laser_width_mm
+        return 0.0
+
     @Slot(float)
     def set_slice_thickness(self, value):
         self.slice_thickness_microns = value
 
+    @Slot(bool)
+    def set_adaptive_layers(self, value):
+        self.adaptive_layers = value
+
+    @Slot(float)
+    def set_min_slice_thickness(self, value):
+        self.min_slice_thickness_microns = value
+
+    @Slot(float)
+    def set_max_slice_thickness(self, value):
+        self.max_slice_thickness_microns = value
+
+    @Slot(float)
+    def set_cusp_height(self, value):
+        self.cusp_height_microns = value
+
+    def __compute_layers_schedule__(self):
+        slice_height_offset_mm = self.slice_thickness_microns * self.slice_height_offset / 1000
+        if self.adaptive_layers:
+            triangles = []
+            for geometry_idx in range(self.geometries_loaded):
+                current_geometry = self.geometries_list[geometry_idx]
+                transformation_matrix = np.array(current_geometry.get_model_matrix().data(), dtype=np.float64).reshape(4, 4).transpose()
+                vertices = current_geometry.get_vertices_list().reshape(-1, 3)
+                triangles.append(vertices.dot(transformation_matrix[:3, :3].transpose()) + transformation_matrix[0:3, 3])
+            triangles = np.vstack(triangles)
+            layers_thickness = slicer_helpers.compute_adaptive_layer_thicknesses(triangles, self.global_bbox_height_mm,
+                                                                                 self.min_slice_thickness_microns / 1000.0,
+                                                                                 self.max_slice_thickness_microns / 1000.0,
+                                                                                 self.cusp_height_microns / 1000.0)
+            layers_height = np.cumsum(layers_thickness) - layers_thickness
+            # drop the last layers if their slicing plane is above the geometries
+            is_inside = layers_height + layers_thickness * self.slice_height_offset < self.global_bbox_height_mm
+            layers_thickness = layers_thickness[is_inside]
+            layers_height = layers_height[is_inside]
+        else:
+            number_of_slices = int(np.ceil(1000 * (self.global_bbox_height_mm - slice_height_offset_mm) / self.slice_thickness_microns))
+            layers_thickness = np.full(max(number_of_slices, 0), self.slice_thickness_microns / 1000.0)
+            layers_height = self.slice_thickness_microns * np.arange(max(number_of_slices, 0)) / 1000.0
+        self.layers_thickness_mm = layers_thickness.tolist()
+        self.layers_height_mm = layers_height.tolist()
+        self.number_of_slices = len(self.layers_thickness_mm)
+
+    def __get_slice_height__(self, slice_idx):
+        return self.layers_height_mm[slice_idx] + self.layers_thickness_mm[slice_idx] * self.slice_height_offset
+
     def __compute_global_bbox__(self):
         is_defined = False
         for idx in range(self.geometries_loaded):
@@ -292,32 +462,67 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         self.global_bbox_height_mm = self.global_bbox_max.y() - self.global_bbox_min.y()
 
     @Slot()
-    def prepare_for_slicing(self, directory='./'):
+    def prepare_for_slicing(self, directory='./', job_file_name=None):
         if self.geometries_loaded == 0:
             return
         for idx in range(self.geometries_loaded):
             current_geometry = self.geometries_list[idx]
             current_geometry.refine_bbox()
-            self.contour_vertices_list[idx] = {'vertices': [], 'vertices_per_layer': [], 'layer_thickness': self.slice_thickness_microns / 1000.0}
-            self.infill_vertices_list[idx] = {'vertices': [], 'vertices_per_layer': [], 'layer_thickness': self.slice_thickness_microns / 1000.0}
         self.__compute_global_bbox__()
         self.is_slicing = True
         self.current_slice = 0
-        slice_height_offset_mm = self.slice_thickness_microns * self.slice_height_offset / 1000
-        self.number_of_slices = int(np.ceil(1000 * (self.global_bbox_height_mm - slice_height_offset_mm) / self.slice_thickness_microns))
+        self.__compute_layers_schedule__()
+        self.spill_toolpaths = 0 < self.toolpath_spill_layers <= self.number_of_slices
+        self.__reset_toolpath_stores__(self.slice_thickness_microns / 1000.0)
+        self.slice_cache.trim(self.number_of_slices)
+        self.section_segments_memo = {}
+        self.hatch_templates = {}
+        self.tile_grids = {}
+        self.cached_layers_count = 0
         self.slice_width = int(np.ceil(1000 * self.global_bbox_width_mm / self.laser_width_microns))
         self.slice_height = int(np.ceil(1000 * self.global_bbox_depth_mm / self.laser_width_microns))
         self.save_directory_name = directory
+        self.__close_job_stream__()
+        if job_file_name:
+            self.__open_job_stream__(job_file_name)
         self.__initialize_slicer_opengl__()
 
+    # new empty toolpath stores for all the geometries, backed by spill files when spill_toolpaths is set
+    def __reset_toolpath_stores__(self, layer_thickness=0):
+        if self.spill_toolpaths and self.toolpath_spill_directory is None:
+            self.toolpath_spill_directory = tempfile.mkdtemp(prefix='metal_toolpaths_')
+        for idx in range(self.geometries_loaded):
+            self.contour_vertices_list[idx].release()
+            self.infill_vertices_list[idx].release()
+            contour_spill_path = None
+            infill_spill_path = None
+            if self.spill_toolpaths:
+                contour_spill_path = os.path.join(self.toolpath_spill_directory, 'geometry_%i_contour' % idx)
+                infill_spill_path = os.path.join(self.toolpath_spill_directory, 'geometry_%i_infill' % idx)
+            self.contour_vertices_list[idx] = ToolpathStore(ToolpathStore.CONTOUR, layer_thickness, contour_spill_path)
+            self.infill_vertices_list[idx] = ToolpathStore(ToolpathStore.INFILL, layer_thickness, infill_spill_path)
+
+    # removes the spill files of the toolpaths and their directory, the stores are left empty
+    @Slot()
+    def release_toolpath_stores(self):
+        self.spill_toolpaths = False
+        self.__reset_toolpath_stores__()
+        if self.toolpath_spill_directory is not None:
+            try:
+                shutil.rmtree(self.toolpath_spill_directory)
+            except OSError as e:
+                print("Toolpath spill directory not removed:", e)
+            self.toolpath_spill_directory = None
+
     @Slot()
     def interrupt_slicing(self):
         if self.is_slicing:
             self.makeCurrent()
             self.is_slicing = False
-            for idx in range(self.geometries_loaded):
-                self.contour_vertices_list[idx] = {'vertices': [], 'vertices_per_layer': [], 'layer_thickness': 0}
-                self.infill_vertices_list[idx] = {'vertices': [], 'vertices_per_layer': [], 'layer_thickness': 0}
+            self.spill_toolpaths = False
+            # the layers already written stay in the job file
+            self.__close_job_stream__()
+            self.__reset_toolpath_stores__()
             GL.glDisable(GL.GL_STENCIL_TEST)
             GL.glEnable(GL.GL_DEPTH_TEST)
             GL.glDisable(GL.GL_BLEND)
@@ -390,7 +595,10 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
                 GL.glUniformMatrix4fv(self.show_slices_projection_matrix_location, 1, GL.GL_TRUE, self.perspective_matrix_array)
                 GL.glUniform1fv(self.show_slices_slice_height_offset_location, 1, self.slice_height_offset)
                 line_width = self.laser_width_microns / 1000.0 * 0.5 * (self.slice_planar_thickness_percentage / 100.0)
-                line_thickness = self.slice_thickness_microns / 1000.0 * (self.slice_vertical_thickness_percentage / 100.0)
+                if len(self.layers_thickness_mm) > 0:
+                    line_thickness = min(self.layers_thickness_mm) * (self.slice_vertical_thickness_percentage / 100.0)
+                else:
+                    line_thickness = self.slice_thickness_microns / 1000.0 * (self.slice_vertical_thickness_percentage / 100.0)
                 GL.glUniform1fv(self.show_slices_planar_thickness_location, 1, line_width)
                 GL.glUniform1fv(self.show_slices_vertical_thickness_location, 1, line_thickness)
                 for geometry_idx in range(self.geometries_loaded):
@@ -403,24 +611,14 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
                     GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.contour_buffer_id_list[geometry_idx])
                     GL.glEnableVertexAttribArray(self.show_slices_position_location)
                     GL.glVertexAttribPointer(self.show_slices_position_location, 3, GL.GL_FLOAT, GL.GL_FALSE, 0, None)
-                    try:
-                        offset = int(sum(self.contour_vertices_list[geometry_idx]['vertices_per_layer'][0:self.bottom_displayed_slice]) / 3)
-                        number_of_points = int(sum(self.contour_vertices_list[geometry_idx]['vertices_per_layer'][self.bottom_displayed_slice:self.top_displayed_slice]) / 3)
-                    except:
-                        offset = 0
-                        number_of_points = 0
+                    offset, number_of_points = self.contour_vertices_list[geometry_idx].get_points_range(self.bottom_displayed_slice, self.top_displayed_slice)
                     GL.glDrawArrays(GL.GL_LINES, offset, number_of_points)
                     # DRAW INFILL
                     GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.infill_buffer_id_list[geometry_idx])
                     GL.glUniform3fv(self.show_slices_color_location, 1, np.array([1.0, 1.0, 0.0], np.float32))
                     GL.glEnableVertexAttribArray(self.show_slices_position_location)
                     GL.glVertexAttribPointer(self.show_slices_position_location, 3, GL.GL_FLOAT, GL.GL_FALSE, 0, None)
-                    try:
-                        offset = int(sum(self.infill_vertices_list[geometry_idx]['vertices_per_layer'][0:self.bottom_displayed_slice]) / 3)
-                        number_of_points = int(sum(self.infill_vertices_list[geometry_idx]['vertices_per_layer'][self.bottom_displayed_slice:self.top_displayed_slice]) / 3)
-                    except:
-                        offset = 0
-                        number_of_points = 0
+                    offset, number_of_points = self.infill_vertices_list[geometry_idx].get_points_range(self.bottom_displayed_slice, self.top_displayed_slice)
                     GL.glDrawArrays(GL.GL_LINES, offset, number_of_points)
                 GL.glDisable(GL.GL_CULL_FACE)
 
@@ -447,36 +645,98 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         self.camera_matrix_array = np.asarray(self.camera_matrix.copyDataTo(), np.float32)
 
     def slice_next_layer(self):
-        if self.geometries_loaded > 0:
+        time = QTime()
+        time.start()
+        while self.geometries_loaded > 0 and self.current_slice < self.number_of_slices:
+            is_cached = True
             for geometry_idx in range(self.geometries_loaded):
-                        self.__get_slice_contour(geometry_idx)
-                        self.__get_slice_infill(geometry_idx)
+                is_cached = self.__get_slice_contour(geometry_idx) and is_cached
+                is_cached = self.__get_slice_infill(geometry_idx) and is_cached
+            if is_cached:
+                self.cached_layers_count += 1
+            if self.__job_stream is not None:
+                self.__write_job_stream_layer__(self.current_slice)
             self.current_slice += 1
+            if not is_cached or time.elapsed() > self.slicing_time_budget_ms:
+                break
         if self.current_slice == self.number_of_slices:
+            self.__close_job_stream__()
             self.__load_slices_buffers__()
             self.__reset_default_opengl_buffer__()
             self.is_slicing = False
             self.update_slice_counts.emit(self.current_slice, self.number_of_slices)
 
+    def __get_contour_hash__(self, geometry_idx):
+        current_geometry = self.geometries_list[geometry_idx]
+        current_parameters = self.slicing_parameters_list[geometry_idx]
+        key = (current_parameters.get_contour_parameters_hash(), current_geometry.get_model_matrix_array().tobytes(),
+               self.__get_slice_height__(self.current_slice), self.laser_width_microns,
+               tuple(self.__get_contour_offsets_mm__()), self.contour_join_style)
+        if self.contour_strategies[current_parameters.get_contour_strategy_idx()] == 'Image-Based':
+            key += (self.global_bbox_min.toTuple(), self.global_bbox_max.toTuple())
+        return hash(key)
+
+    def __get_infill_hash__(self, geometry_idx):
+        current_geometry = self.geometries_list[geometry_idx]
+        current_parameters = self.slicing_parameters_list[geometry_idx]
+        key = (current_parameters.get_infill_parameters_hash(), current_geometry.get_model_matrix_array().tobytes(),
+               self.__get_slice_height__(self.current_slice), self.laser_width_microns, self.current_slice,
+               self.__get_infill_offset_mm__(), self.contour_join_style, self.use_ray_casting_infill)
+        return hash(key)
+
+    def __get_infill_boundary_hash__(self, geometry_idx):
+        current_geometry = self.geometries_list[geometry_idx]
+        key = (current_geometry.get_model_matrix_array().tobytes(), self.__get_slice_height__(self.current_slice),
+               self.__get_infill_offset_mm__(), self.contour_join_style)
+        return hash(key)
+
     def __get_slice_contour(self, geometry_idx):
+        geometry_key = id(self.geometries_list[geometry_idx])
+        contour_hash = self.__get_contour_hash__(geometry_idx)
+        cached_vertices = self.slice_cache.get(geometry_key, 'contour', self.current_slice, contour_hash)
+        if cached_vertices is not None:
+            self.contour_vertices_list[geometry_idx].append_layer(cached_vertices, self.__get_slice_height__(self.current_slice))
+            return True
         strategy_idx = self.slicing_parameters_list[geometry_idx].get_contour_strategy_idx()
         if self.contour_strategies[strategy_idx] == 'Geometric':
             self.__compute_slice_plane_contour(geometry_idx)
         elif self.contour_strategies[strategy_idx] == 'Image-Based':
             self.__get_image_based_contour(geometry_idx)
         elif self.contour_strategies[strategy_idx] == 'None':
-            self.contour_vertices_list[geometry_idx]['vertices'].append(np.array([], dtype=np.float32))
-            self.contour_vertices_list[geometry_idx]['vertices_per_layer'].append(0)
+            self.contour_vertices_list[geometry_idx].append_layer(np.array([], dtype=np.float32), self.__get_slice_height__(self.current_slice))
+        if self.contour_strategies[strategy_idx] != 'None' and self.__get_contour_offsets_mm__() != [0.0]:
+            self.__offset_slice_contour__(geometry_idx)
+        if not self.spill_toolpaths:
+            self.slice_cache.set(geometry_key, 'contour', self.current_slice, contour_hash,
+                                 self.contour_vertices_list[geometry_idx].get_layer_vertices(-1))
+        return False
 
     def __get_slice_infill(self, geometry_idx):
+        geometry_key = id(self.geometries_list[geometry_idx])
+        infill_hash = self.__get_infill_hash__(geometry_idx)
+        cached_vertices = self.slice_cache.get(geometry_key, 'infill', self.current_slice, infill_hash)
+        if cached_vertices is not None:
+            self.infill_vertices_list[geometry_idx].append_layer(cached_vertices, self.__get_slice_height__(self.current_slice))
+            return True
         strategy_idx = self.slicing_parameters_list[geometry_idx].get_infill_strategy_idx()
         if self.infill_strategies[strategy_idx] == 'Parallel Lines':
-            self.__get_parallel_lines_infill(geometry_idx)
+            if self.use_ray_casting_infill:
+                self.__get_parallel_lines_infill(geometry_idx)
+            else:
+                self.__get_scanline_infill(geometry_idx, zigzag=False)
         elif self.infill_strategies[strategy_idx] == 'ZigZag':
-            self.__get_zigzag_infill(geometry_idx)
+            if self.use_ray_casting_infill:
+                self.__get_zigzag_infill(geometry_idx)
+            else:
+                self.__get_scanline_infill(geometry_idx, zigzag=True)
+        elif self.infill_strategies[strategy_idx] in ('Island', 'Stripes'):
+            self.__get_scanline_infill(geometry_idx, tile_pattern=self.__get_tile_pattern__(geometry_idx))
         elif self.infill_strategies[strategy_idx] == 'None':
-            self.infill_vertices_list[geometry_idx]['vertices'].append(np.array([], dtype=np.float32))
-            self.infill_vertices_list[geometry_idx]['vertices_per_layer'].append(0)
+            self.infill_vertices_list[geometry_idx].append_layer(np.array([], dtype=np.float32), self.__get_slice_height__(self.current_slice))
+        if not self.spill_toolpaths:
+            self.slice_cache.set(geometry_key, 'infill', self.current_slice, infill_hash,
+                                 self.infill_vertices_list[geometry_idx].get_layer_vertices(-1))
+        return False
 
     def __get_image_based_contour(self, geometry_idx):
         self.slicer_fbo.bind()
@@ -519,7 +779,7 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
     def __set_slicer_uniform_variables__(self, geometry_idx=0):
         self.local_bbox_min = self.geometries_list[geometry_idx].get_transformed_min_bbox()
         self.local_bbox_max = self.geometries_list[geometry_idx].get_transformed_max_bbox()
-        slicer_height = self.slice_thickness_microns * (self.current_slice + self.slice_height_offset) / 1000.0
+        slicer_height = self.__get_slice_height__(self.current_slice)
         self.local_bbox_width = self.local_bbox_max.x() - self.local_bbox_min.x()
         self.local_bbox_depth = self.local_bbox_max.z() - self.local_bbox_min.z()
         self.ortho_matrix.setToIdentity()
@@ -590,7 +850,7 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         quad_model_matrix.rotate(90, 1, 0, 0)
         quad_model_matrix_array = np.asarray(quad_model_matrix.copyDataTo(), np.float32)
         GL.glUniformMatrix4fv(self.marching_squares_model_matrix_location, 1, GL.GL_TRUE, quad_model_matrix_array)
-        GL.glUniform1fv(self.marching_squares_slice_height_location, 1, self.slice_thickness_microns * (self.current_slice + self.slice_height_offset) / 1000.0)
+        GL.glUniform1fv(self.marching_squares_slice_height_location, 1, self.__get_slice_height__(self.current_slice))
         GL.glUniform2iv(self.marching_squares_image_size_location, 1, np.array([self.local_slice_width+1, self.local_slice_height+1], np.int32))
         GL.glUniform2fv(self.marching_squares_bbox_size_location, 1, np.array([self.local_bbox_width, self.local_bbox_depth], np.float32))
         GL.glUniform2fv(self.marching_squares_bbox_origin_location, 1, np.array([self.local_bbox_max.x(), self.local_bbox_min.z()], np.float32))
@@ -633,11 +893,9 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         second_segments[1::2] = fourth_points
         segments = np.concatenate((first_segments, second_segments), axis=0).ravel()
         if len(segments) > 0:
-            self.contour_vertices_list[geometry_idx]['vertices'].append(segments)
-            self.contour_vertices_list[geometry_idx]['vertices_per_layer'].append(len(segments))
+            self.contour_vertices_list[geometry_idx].append_layer(segments, self.__get_slice_height__(self.current_slice))
         else:
-            self.contour_vertices_list[geometry_idx]['vertices'].append(np.array([], dtype=np.float32))
-            self.contour_vertices_list[geometry_idx]['vertices_per_layer'].append(0)
+            self.contour_vertices_list[geometry_idx].append_layer(np.array([], dtype=np.float32), self.__get_slice_height__(self.current_slice))
 
     def __compute_distance_field__(self):
         self.glViewport(0, 0, self.slice_width, self.slice_height)
@@ -865,8 +1123,17 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
     def __compute_slice_plane_contour(self, geometry_idx):
         time = QTime()
         time.start()
+        slice_contour = self.__compute_slice_plane_segments__(geometry_idx)
+        self.contour_vertices_list[geometry_idx].append_layer(slice_contour, self.__get_slice_height__(self.current_slice))
+        print('plane contour time:', time.elapsed())
+
+    def __compute_slice_plane_segments__(self, geometry_idx):
+        # the section is shared by the contour and the infill of the same layer
+        memo = self.section_segments_memo.get(geometry_idx)
+        if memo is not None and memo[0] == self.current_slice:
+            return memo[1]
         current_geometry = self.geometries_list[geometry_idx]
-        slice_height = self.slice_thickness_microns * (self.current_slice + self.slice_height_offset) / 1000.0
+        slice_height = self.__get_slice_height__(self.current_slice)
         transformation_matrix = current_geometry.get_model_matrix()
         inverse_matrix, _ = transformation_matrix.inverted()
         normal_matrix = np.array(inverse_matrix.normalMatrix().data(), dtype=np.float32).reshape(3, 3).transpose()
@@ -878,39 +1145,134 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         slice_plane_info = pyStructs.PlaneIntersectionInfo()
         current_geometry.get_bvh().plane_all_intersections(slice_plane, slice_plane_info)
         if len(slice_plane_info.intersections) > 0:
-            slice_contour = (np.array(slice_plane_info.intersections, dtype=np.float32).dot(transformation_matrix[:3, :3].transpose())
-                             + np.array(transformation_matrix[0:3, 3])).ravel()
-            self.contour_vertices_list[geometry_idx]['vertices'].append(slice_contour)
-            self.contour_vertices_list[geometry_idx]['vertices_per_layer'].append(len(slice_contour))
-        print('plane contour time:', time.elapsed())
+            section = (np.array(slice_plane_info.intersections, dtype=np.float32).dot(transformation_matrix[:3, :3].transpose())
+                       + np.array(transformation_matrix[0:3, 3])).ravel()
+        else:
+            section = np.array([], dtype=np.float32)
+        self.section_segments_memo[geometry_idx] = (self.current_slice, section)
+        return section
 
     def __sort_slice_contour(self, geometry_idx, use_old_sort=False):
         slices_contour = self.contour_vertices_list[geometry_idx]
+        time = QTime()
+        time.start()
+        for slice_idx in range(slices_contour.number_of_layers()):
+            self.__sort_slice_contour_layer__(slices_contour, slice_idx, use_old_sort)
         if use_old_sort:
-            time = QTime()
-            time.start()
-            ordered_slices = np.empty(slices_contour['vertices'].size)
-            slice_start_idx = 0
-            for slice_idx, slice_length in enumerate(slices_contour['vertices_per_layer']):
-                slice_contour = slices_contour['vertices'][slice_start_idx : slice_start_idx + slice_length].reshape(-1, 3)
-                segments = [[slice_contour[idx * 2], slice_contour[idx * 2 + 1]] for idx in range(int(len(slice_contour) / 2))]
-                ordered_slices[slice_start_idx: slice_start_idx + slice_length] = slicer_helpers.sort_segments_list(segments)
-                slice_start_idx += slice_length
             print("Old Sort:", time.elapsed())
         else:
-            time = QTime()
-            time.start()
-            ordered_slices = np.empty(slices_contour['vertices'].size)
-            slice_start_idx = 0
-            for slice_idx, slice_length in enumerate(slices_contour['vertices_per_layer']):
-                slice_contour = slices_contour['vertices'][slice_start_idx : slice_start_idx + slice_length].reshape(-1, 3)
-
-                segments = [[slice_contour[idx * 2], slice_contour[idx * 2 + 1]] for idx in range(int(len(slice_contour) / 2))]
-                ordered_slices[slice_start_idx: slice_start_idx + slice_length] = slicer_helpers.merge_sort_segments_list(segments)
-                slice_start_idx += slice_length
             print("New Sort:", time.elapsed())
-        self.contour_vertices_list[geometry_idx]['vertices'] = ordered_slices
-        # current_parameters.contour_vertices = (ordered_slices, slices_contour[1], slices_contour[2])
+
+    def __sort_slice_contour_layer__(self, slices_contour, slice_idx, use_old_sort=False):
+        if slices_contour.get_layer_size(slice_idx) == 0:
+            return
+        slice_contour = slices_contour.get_layer_points(slice_idx)
+        segments = [[slice_contour[idx * 2], slice_contour[idx * 2 + 1]] for idx in range(int(len(slice_contour) / 2))]
+        if use_old_sort:
+            ordered_slice = slicer_helpers.sort_segments_list(segments)
+        else:
+            ordered_slice = slicer_helpers.merge_sort_segments_list(segments)
+        slices_contour.set_layer_points(slice_idx, np.asarray(ordered_slice, dtype=np.float32).reshape(-1, 2))
+
+    def __get_slice_section_loops__(self, section):
+        segments = np.asarray(section, dtype=np.float64).reshape(-1, 2, 3)[:, :, [0, 2]]
+        return polygon_helpers.assemble_loops(segments, tolerance=10.0 ** (-self.__number_of_decimals))
+
+    def __loops_to_slice_vertices__(self, loops):
+        edges = polygon_helpers.loops_to_edges(loops).reshape(-1, 2)
+        vertices = np.empty((edges.shape[0], 3), dtype=np.float32)
+        vertices[:, 0] = edges[:, 0]
+        vertices[:, 1] = self.__get_slice_height__(self.current_slice)
+        vertices[:, 2] = edges[:, 1]
+        return vertices.ravel()
+
+    def __offset_slice_contour__(self, geometry_idx):
+        time = QTime()
+        time.start()
+        loops = self.__get_slice_section_loops__(self.contour_vertices_list[geometry_idx].get_layer_vertices(-1))
+        shells = []
+        for offset in self.__get_contour_offsets_mm__():
+            shells += polygon_helpers.offset_loops(loops, offset, join_style=self.contour_join_style)
+        slice_contour = self.__loops_to_slice_vertices__(shells)
+        self.contour_vertices_list[geometry_idx].replace_last_layer(slice_contour)
+        print('contour offset time:', time.elapsed())
+
+    def __get_slice_section_edges__(self, geometry_idx):
+        # the section segments of the closed contour loops form the edge table of the layer,
+        # when the infill has to stay away from the contour shells the loops are offset and cached per layer
+        section = self.__compute_slice_plane_segments__(geometry_idx)
+        infill_offset = self.__get_infill_offset_mm__()
+        if infill_offset == 0:
+            return np.asarray(section, dtype=np.float64).reshape(-1, 2, 3)[:, :, [0, 2]]
+        geometry_key = id(self.geometries_list[geometry_idx])
+        boundary_hash = self.__get_infill_boundary_hash__(geometry_idx)
+        edges = self.slice_cache.get(geometry_key, 'infill_boundary', self.current_slice, boundary_hash)
+        if edges is None:
+            loops = polygon_helpers.offset_loops(self.__get_slice_section_loops__(section), infill_offset, join_style=self.contour_join_style)
+            edges = polygon_helpers.loops_to_edges(loops)
+            self.slice_cache.set(geometry_key, 'infill_boundary', self.current_slice, boundary_hash, edges)
+        return edges
+
+    def __get_scanline_infill(self, geometry_idx, zigzag=False, tile_pattern=None):
+        time = QTime()
+        time.start()
+        current_geometry = self.geometries_list[geometry_idx]
+        current_parameters = self.slicing_parameters_list[geometry_idx]
+        density = current_parameters.get_infill_density() / 100.0
+        overlap = current_parameters.get_infill_overlap() / 100.0
+        if density < 1:
+            overlap = 0
+        bbox_min = current_geometry.get_transformed_min_bbox()
+        bbox_max = current_geometry.get_transformed_max_bbox()
+        bbox_center = np.array([bbox_max.x() + bbox_min.x(), bbox_max.z() + bbox_min.z()]) * 0.5
+        bbox_diagonal = QVector3D(bbox_max.x() - bbox_min.x(), 0, bbox_max.z() - bbox_min.z()).length()
+        rot_angle = current_parameters.get_infill_rotation_angle() * self.current_slice % 360
+        number_of_lines = int(np.ceil(bbox_diagonal / (self.laser_width_microns - self.laser_width_microns * overlap) * 1000 * density))
+        edges = self.__get_slice_section_edges__(geometry_idx)
+        tile_size = current_parameters.get_infill_tile_size()
+        if tile_pattern:
+            # the tiles are anchored on the bounding box center, so the grid is the same in every layer
+            grid_key = (geometry_idx, tile_size, tile_pattern)
+            if grid_key not in self.tile_grids:
+                self.tile_grids[grid_key] = polygon_helpers.tile_grid(bbox_diagonal, tile_size, pattern=tile_pattern)
+            segments, _ = polygon_helpers.tiled_fill(edges, bbox_center, bbox_diagonal, number_of_lines, rot_angle,
+                                                     self.tile_grids[grid_key])
+            points = segments.reshape(-1, 2)
+        else:
+            segments, lines = polygon_helpers.scanline_fill(edges, bbox_center, bbox_diagonal, number_of_lines, rot_angle)
+            if zigzag:
+                points = polygon_helpers.zigzag_path(segments, lines)
+            else:
+                points = segments.reshape(-1, 2)
+        infill_vertices = np.empty((points.shape[0], 3), dtype=np.float32)
+        infill_vertices[:, 0] = points[:, 0]
+        infill_vertices[:, 1] = self.__get_slice_height__(self.current_slice)
+        infill_vertices[:, 2] = points[:, 1]
+        infill_vertices = infill_vertices.ravel()
+        self.infill_vertices_list[geometry_idx].append_layer(infill_vertices, self.__get_slice_height__(self.current_slice))
+        print('scan line infill time:', time.elapsed())
+
+    # origins (at height 0) and direction of the scan lines in the model space of the geometry. The template is
+    # shared by all the layers with the same hatch angle, each layer only shifts the origins along the model space
+    # image of the vertical axis, which the rotation around the vertical axis leaves unchanged
+    def __get_hatch_template__(self, geometry_idx, rot_angle, number_of_rays, bbox_center, bbox_diagonal, inverse_matrix):
+        template_key = (geometry_idx, rot_angle, number_of_rays)
+        if template_key not in self.hatch_templates:
+            rotation_matrix = QMatrix4x4()
+            rotation_matrix.rotate(rot_angle, 0.0, 1.0, 0.0)
+            rotation_matrix = np.array(rotation_matrix.data(), dtype=np.float32).reshape(4, 4).transpose()
+            rays_origin_offset = bbox_diagonal / number_of_rays
+            rays_origins = np.zeros((number_of_rays, 4), dtype=np.float32)
+            rays_origins[:, 0] = (- bbox_diagonal * 0.5) + rays_origin_offset * (np.arange(number_of_rays) + 0.5)
+            rays_origins[:, 2] = (- bbox_diagonal * 0.5) - 1.0
+            rays_origins[:, 3] = 1.0
+            rays_origins = rays_origins.dot(rotation_matrix.transpose()) + np.array([bbox_center.x(), 0, bbox_center.z(), 0], dtype=np.float32)
+            rays_origins = rays_origins.dot(inverse_matrix.transpose())[:, 0:3]
+            ray_direction = inverse_matrix.dot(rotation_matrix.dot(np.array([0.0, 0.0, 1.0, 0.0], dtype=np.float32)))[0:3]
+            self.hatch_templates[template_key] = (rays_origins, inverse_matrix[0:3, 1], ray_direction)
+        rays_origins, height_direction, ray_direction = self.hatch_templates[template_key]
+        rays_origins = rays_origins + np.float32(self.__get_slice_height__(self.current_slice)) * height_direction
+        return rays_origins, ray_direction
 
     def __get_parallel_lines_infill(self, geometry_idx):
         current_geometry = self.geometries_list[geometry_idx]
@@ -928,23 +1290,13 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         bbox_center = QVector3D(bbox_max.x() + bbox_min.x(), 0, bbox_max.z() + bbox_min.z()) * 0.5
         bbox_diagonal = QVector3D(bbox_max.x() - bbox_min.x(), 0, bbox_max.z() - bbox_min.z()).length()
         rot_angle = current_parameters.get_infill_rotation_angle()  * self.current_slice % 360
-        rotation_matrix = QMatrix4x4()
-        rotation_matrix.rotate(rot_angle, 0.0, 1.0, 0.0)
-        rotation_matrix = np.array(rotation_matrix.data(), dtype=np.float32).reshape(4, 4).transpose()
         number_of_rays = int(np.ceil(bbox_diagonal / (self.laser_width_microns - self.laser_width_microns * overlap)* 1000 * density))
         if number_of_rays == 0:
             intersection_points = np.array([], dtype=np.float32)
-            self.infill_vertices_list[geometry_idx]['vertices'].append(intersection_points)
-            self.infill_vertices_list[geometry_idx]['vertices_per_layer'].append(len(intersection_points))
+            self.infill_vertices_list[geometry_idx].append_layer(intersection_points, self.__get_slice_height__(self.current_slice))
             return
-        rays_origin_offset = bbox_diagonal / number_of_rays
-        ray_origin_x = (- bbox_diagonal * 0.5) + rays_origin_offset * 0.5
-        ray_origin_y = self.slice_thickness_microns * (self.current_slice + self.slice_height_offset) / 1000.0
-        ray_origin_z = (- bbox_diagonal * 0.5) - 1.0
-        rays_origins = [rotation_matrix.dot(np.array([ray_origin_x + rays_origin_offset * idx, ray_origin_y, ray_origin_z, 1.0], dtype=np.float32))
-                        + np.array([bbox_center.x(), 0, bbox_center.z(), 0], dtype=np.float32)for idx in range(number_of_rays)]
-        rays_origins = [inverse_matrix.dot(rays_origins[idx])[0:3] for idx in range(number_of_rays)]
-        ray_direction = inverse_matrix.dot(rotation_matrix.dot(np.array([0.0, 0.0, 1.0, 0.0], dtype=np.float32)))[0:3]
+        rays_origins, ray_direction = self.__get_hatch_template__(geometry_idx, rot_angle, number_of_rays, bbox_center,
+                                                                  bbox_diagonal, inverse_matrix)
         rays = [pyStructs.Ray(rays_origins[idx], ray_direction) for idx in range(number_of_rays)]
         rays_info = [pyStructs.RayIntersectionInfo() for _ in range(number_of_rays)]
         _ = [current_geometry.get_bvh().all_intersections(rays[idx], rays_info[idx]) for idx in range(number_of_rays)]
@@ -955,8 +1307,7 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
             intersection_points = (intersection_points.dot(transformation_matrix[:3, :3].transpose()) + np.array(transformation_matrix[0:3, 3])).ravel()
         except:
             intersection_points = np.array([], dtype=np.float32)
-        self.infill_vertices_list[geometry_idx]['vertices'].append(intersection_points)
-        self.infill_vertices_list[geometry_idx]['vertices_per_layer'].append(len(intersection_points))
+        self.infill_vertices_list[geometry_idx].append_layer(intersection_points, self.__get_slice_height__(self.current_slice))
 
     def __get_zigzag_infill(self, geometry_idx):
         current_geometry = self.geometries_list[geometry_idx]
@@ -965,9 +1316,7 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         inverse_matrix, _ = transformation_matrix.inverted()
         inverse_matrix = np.array(inverse_matrix.data(), dtype=np.float32).reshape(4, 4).transpose()
         transformation_matrix = np.array(transformation_matrix.data(), dtype=np.float32).reshape(4, 4).transpose()
-        rotation_matrix = QMatrix4x4()
-        rotation_matrix.rotate(current_parameters.get_infill_rotation_angle() * self.current_slice  % 360, 0.0, 1.0, 0.0)
-        rotation_matrix = np.array(rotation_matrix.data(), dtype=np.float32).reshape(4, 4).transpose()
+        rot_angle = current_parameters.get_infill_rotation_angle() * self.current_slice % 360
         density = current_parameters.get_infill_density() / 100.0
         overlap = current_parameters.get_infill_overlap()  / 100.0
         if density < 1:
@@ -979,17 +1328,10 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
         number_of_rays = int(np.ceil(bbox_diagonal / (self.laser_width_microns - self.laser_width_microns * overlap)* 1000 * density))
         if number_of_rays == 0:
             intersection_points = np.array([], dtype=np.float32)
-            self.infill_vertices_list[geometry_idx]['vertices'].append(intersection_points)
-            self.infill_vertices_list[geometry_idx]['vertices_per_layer'].append(len(intersection_points))
+            self.infill_vertices_list[geometry_idx].append_layer(intersection_points, self.__get_slice_height__(self.current_slice))
             return
-        rays_origin_offset = bbox_diagonal / number_of_rays
-        ray_origin_x = (- bbox_diagonal * 0.5) + rays_origin_offset * 0.5
-        ray_origin_y = self.slice_thickness_microns * (self.current_slice + self.slice_height_offset) / 1000.0
-        ray_origin_z = (- bbox_diagonal * 0.5) - 1.0
-        rays_origins = [rotation_matrix.dot(np.array([ray_origin_x + rays_origin_offset * idx, ray_origin_y, ray_origin_z, 1.0], dtype=np.float32))
-                        + np.array([bbox_center.x(), 0, bbox_center.z(), 0], dtype=np.float32)for idx in range(number_of_rays)]
-        rays_origins = [inverse_matrix.dot(rays_origins[idx])[0:3] for idx in range(number_of_rays)]
-        ray_direction = inverse_matrix.dot(rotation_matrix.dot(np.array([0.0, 0.0, 1.0, 0.0], dtype=np.float32)))[0:3]
+        rays_origins, ray_direction = self.__get_hatch_template__(geometry_idx, rot_angle, number_of_rays, bbox_center,
+                                                                  bbox_diagonal, inverse_matrix)
         rays = [pyStructs.Ray(rays_origins[idx], ray_direction) for idx in range(number_of_rays)]
         rays_info = [pyStructs.RayIntersectionInfo() for _ in range(number_of_rays)]
         _ = [current_geometry.get_bvh().all_intersections(rays[idx], rays_info[idx]) for idx in range(number_of_rays)]
@@ -1008,124 +1350,255 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
                 transformation_matrix[0:3, 3])).ravel()
         except:
             intersection_points = np.array([], dtype=np.float32)
-        self.infill_vertices_list[geometry_idx]['vertices'].append(intersection_points)
-        self.infill_vertices_list[geometry_idx]['vertices_per_layer'].append(len(intersection_points))
+        self.infill_vertices_list[geometry_idx].append_layer(intersection_points, self.__get_slice_height__(self.current_slice))
 
     def __load_slices_buffers__(self):
         for geometry_idx in range(self.geometries_loaded):
-            contour_vertices = self.contour_vertices_list[geometry_idx]['vertices']
-            rounded_vertices = np.array([round(x, self.__number_of_decimals) for x in np.hstack(contour_vertices)])
-            self.contour_vertices_list[geometry_idx]['vertices'] = rounded_vertices
-            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.contour_buffer_id_list[geometry_idx])
-            GL.glBufferData(GL.GL_ARRAY_BUFFER, rounded_vertices.nbytes, rounded_vertices, GL.GL_STATIC_DRAW)
-
-            infill_vertices = self.infill_vertices_list[geometry_idx]['vertices']
-            rounded_vertices = np.array([round(x, self.__number_of_decimals) for x in np.hstack(infill_vertices)])
-            self.infill_vertices_list[geometry_idx]['vertices'] = rounded_vertices
-            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.infill_buffer_id_list[geometry_idx])
-            GL.glBufferData(GL.GL_ARRAY_BUFFER, rounded_vertices.nbytes, rounded_vertices, GL.GL_STATIC_DRAW)
+            self.__load_toolpath_buffer__(self.contour_vertices_list[geometry_idx], self.contour_buffer_id_list[geometry_idx])
+            self.__load_toolpath_buffer__(self.infill_vertices_list[geometry_idx], self.infill_buffer_id_list[geometry_idx])
+
+    # the toolpath is uploaded a chunk of layers at a time, so that spilled toolpaths are never fully loaded in memory
+    def __load_toolpath_buffer__(self, toolpath_store, buffer_id):
+        toolpath_store.flush()
+        toolpath_store.quantize(self.__number_of_decimals)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffer_id)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, toolpath_store.number_of_points() * 12, None, GL.GL_STATIC_DRAW)
+        for first_layer, last_layer in toolpath_store.get_layer_chunks():
+            first_point, _ = toolpath_store.get_points_range(first_layer, last_layer)
+            vertices = toolpath_store.get_vertices(first_layer, last_layer)
+            GL.glBufferSubData(GL.GL_ARRAY_BUFFER, first_point * 12, vertices.nbytes, vertices)
 
     def write_slice_job_to_file(self, file_name="./job.g"):
         file = QFile(file_name)
         file_info = QFileInfo(file)
         if file.open(QIODevice.WriteOnly | QIODevice.Text):
-            sliced_geometry_idxs = []
-            for geometry_idx in range(self.geometries_loaded):
-                if len(self.contour_vertices_list[geometry_idx]['vertices']) > 0 or len(self.infill_vertices_list[geometry_idx]['vertices']) > 0:
-                    sliced_geometry_idxs.append(geometry_idx)
-
+            sliced_geometry_idxs = self.__get_sliced_geometry_idxs__()
             if len(sliced_geometry_idxs) == 0:
                 return
-            decimals = "%%.%if" % self.__number_of_decimals
             stream = QTextStream(file)
-            contour_vertices_written = []
-            infill_vertices_written = []
-            layer_thickness = self.contour_vertices_list[sliced_geometry_idxs[0]]['layer_thickness']
             for geometry_idx in sliced_geometry_idxs:
                 self.__sort_slice_contour(geometry_idx, use_old_sort=False)
-                contour_vertices_written.append(0)
-                infill_vertices_written.append(0)
-            stream << ";Galvo Scanner System\n"
-            stream << ";Gcode altered for SLM\n"
-            stream << ";Filename: %s\n" % file_info.fileName()
-            stream << ";Laser Spot Size " + decimals % (self.laser_width_microns / 1000) + " mm\n"
-            stream << ";Layer Thickness " + decimals % layer_thickness + " mm\n"
-            stream << ";Sliced %s\n" % QDate.currentDate().toString("dd.MM.yyyy")
-            for geometry_idx in sliced_geometry_idxs:
-                current_geometry = self.geometries_list[geometry_idx]
-                current_parameters = self.slicing_parameters_list[geometry_idx]
-                stream << "\n"
-                stream << ";Geometry %i: %s\n" % (geometry_idx, current_geometry.get_geometry_name())
-                stream << ";Contour Strategy: %s\n" % self.contour_strategies[current_parameters.get_contour_strategy_idx()]
-                stream << ";Contour: Feedrate (mm/s) " + decimals % (current_parameters.get_contour_scan_speed()) + ", Frequency (Hz) %i, Power (W) %i, Duty Cycle (%%) %i\n" % (current_parameters.get_contour_frequency(), current_parameters.get_contour_laser_power(), current_parameters.get_contour_duty_cycle())
-                stream << ";Infill Strategy: %s\n" % self.infill_strategies[current_parameters.get_infill_strategy_idx()]
-                stream << ";Infill Density: %i\n" % current_parameters.get_infill_density()
-                stream << ";Infill Overlap: %i\n" % current_parameters.get_infill_overlap()
-                stream << ";Infill Rotation Angle: %i\n" % current_parameters.get_infill_rotation_angle()
-                stream << ";Infill: Feedrate (mm/s) " + decimals % (current_parameters.get_infill_scan_speed()) + ", Frequency (Hz) %i, Power (W) %i, Duty Cycle (%%) %i\n" % (current_parameters.get_infill_frequency(), current_parameters.get_infill_laser_power(), current_parameters.get_infill_duty_cycle())
-            stream << "\n"
-            stream << "G92; Setting Absolute Coordinates\n"
-            stream << "\n"
-            stream << ";Homing Routine\n"
-            stream << "M10\n"
-            stream << "C0\n"
-            stream << "\n"
-            stream << ";Movement Start\n"
-            for slice_idx in range(self.number_of_slices):
-                stream << ";Slice %i \n" % slice_idx
-                stream << ";Recoating routine \n"
-                stream << "M10\n"
-                stream << "M4 V2 T11000 D683 F490\n"
-                stream << "M7 R3\n"
-                stream << "C1 R" + decimals % layer_thickness + "\n"
-                stream << "C3\n"
-                for geometry_idx in sliced_geometry_idxs:
-                    current_parameters = self.slicing_parameters_list[geometry_idx]
-                    if len(self.infill_vertices_list[geometry_idx]['vertices_per_layer']) > slice_idx:
-                        stream << ";Start Infill (Geometry %i)\n" % geometry_idx
-                        stream << ";Infill Strategy: %s\n" % self.infill_strategies[
-                            current_parameters.get_infill_strategy_idx()]
-                        stream << ";Infill Density: %i\n" % current_parameters.get_infill_density()
-                        stream << ";Infill Overlap: %i\n" % current_parameters.get_infill_overlap()
-                        stream << ";Infill Rotation Angle: %i\n" % (current_parameters.get_infill_rotation_angle() * slice_idx % 360)
-                        stream << ";Set Feedrate, Frequency, and Power\n"
-                        stream << "G1 F" + decimals % (current_parameters.get_infill_scan_speed()) + " H%i P%i\n" % (current_parameters.get_infill_frequency(), current_parameters.get_infill_laser_power())
-                        number_of_infill_vertices_to_write = self.infill_vertices_list[geometry_idx]['vertices_per_layer'][slice_idx]
-                        infill_vertices = self.infill_vertices_list[geometry_idx]['vertices'][infill_vertices_written[geometry_idx]:infill_vertices_written[geometry_idx] + number_of_infill_vertices_to_write]
-                        infill_segments = int(len(infill_vertices) / 6)
-                        last_end_point = None
-                        for segment_idx in range(infill_segments):
-                            start_point = infill_vertices[segment_idx * 6: segment_idx * 6 + 3]
-                            end_point = infill_vertices[segment_idx * 6 + 3: segment_idx * 6 + 6]
-                            if (last_end_point == start_point).all():
-                                stream << "G1 X" + decimals % end_point[0] + " Y" + decimals % end_point[2] + " D%i\n" % current_parameters.get_infill_duty_cycle()
-                            else:
-                                stream << "G1 X" + decimals % start_point[0] + " Y" + decimals % start_point[2] + "\n"
-                                stream << "G1 X" + decimals % end_point[0] + " Y" + decimals % end_point[2] + " D%i\n" % current_parameters.get_infill_duty_cycle()
-                            last_end_point = end_point
-                        infill_vertices_written[geometry_idx] += len(infill_vertices)
-                    if len(self.contour_vertices_list[geometry_idx]['vertices_per_layer']) > slice_idx:
-                        stream << ";Start Contour (Geometry %i)\n" % geometry_idx
-                        stream << ";Contour Strategy: %s\n" % self.contour_strategies[current_parameters.get_contour_strategy_idx()]
-                        stream << ";Set Feedrate, Frequency, and Power\n"
-                        stream << "G1 F" + decimals % (current_parameters.get_contour_scan_speed()) + " H%i P%i\n" % (current_parameters.get_contour_frequency(), current_parameters.get_contour_laser_power())
-                        number_of_contour_vertices_to_write = self.contour_vertices_list[geometry_idx]['vertices_per_layer'][slice_idx]
-                        contour_vertices = self.contour_vertices_list[geometry_idx]['vertices'][contour_vertices_written[geometry_idx]:contour_vertices_written[geometry_idx] + number_of_contour_vertices_to_write]
-                        contour_segments = int(len(contour_vertices) / 6)
-                        last_end_point = None
-                        for segment_idx in range(contour_segments):
-                            start_point = contour_vertices[segment_idx * 6: segment_idx * 6 + 3]
-                            end_point = contour_vertices[segment_idx * 6 + 3: segment_idx * 6 + 6]
-                            if (last_end_point == start_point).all():
-                                stream << "G1 X" + decimals % end_point[0] + " Y" + decimals % end_point[2] + " D%i\n" % current_parameters.get_contour_duty_cycle()
-                            else:
-                                stream << "G1 X" + decimals % start_point[0] + " Y" + decimals % start_point[2] + "\n"
-                                stream << "G1 X" + decimals % end_point[0] + " Y" + decimals % end_point[2] + " D%i\n" % current_parameters.get_contour_duty_cycle()
-                            last_end_point = end_point
-                        contour_vertices_written[geometry_idx] += len(contour_vertices)
+            stream << self.__get_job_header__(sliced_geometry_idxs, file_info.fileName())
+            self.scan_path_jump_lengths = []
+            tasks = (self.__get_layer_task__(slice_idx, sliced_geometry_idxs) for slice_idx in range(self.number_of_slices))
+            if self.gcode_writer_processes == 1 or self.number_of_slices < 2:
+                for task in tasks:
+                    layer_gcode, jump_lengths = gcode_helpers.layer_gcode(task)
+                    stream << layer_gcode
+                    self.scan_path_jump_lengths.append(tuple(jump_lengths))
+            else:
+                # the layers are formatted in a process pool and written in order after the header
+                stream.flush()
+                self.scan_path_jump_lengths = gcode_helpers.write_layers_parallel(tasks, file.write, self.gcode_writer_processes or None)
             file.close()
+            self.__print_jump_lengths__()
         print(file_name)
 
+    # G-code header of the job: printer and geometries parameters, then the homing routine
+    def __get_job_header__(self, sliced_geometry_idxs, file_name):
+        decimals = "%%.%if" % self.__number_of_decimals
+        layer_thickness = self.contour_vertices_list[sliced_geometry_idxs[0]].layer_thickness
+        lines = [";Galvo Scanner System\n",
+                 ";Gcode altered for SLM\n",
+                 ";Filename: %s\n" % file_name,
+                 ";Laser Spot Size " + decimals % (self.laser_width_microns / 1000) + " mm\n"]
+        if self.adaptive_layers:
+            lines.append(";Layer Thickness Adaptive " + decimals % min(self.layers_thickness_mm) + " - " + decimals % max(self.layers_thickness_mm) + " mm\n")
+        else:
+            lines.append(";Layer Thickness " + decimals % layer_thickness + " mm\n")
+        lines.append(";Sliced %s\n" % QDate.currentDate().toString("dd.MM.yyyy"))
+        for geometry_idx in sliced_geometry_idxs:
+            current_geometry = self.geometries_list[geometry_idx]
+            current_parameters = self.slicing_parameters_list[geometry_idx]
+            lines.append("\n")
+            lines.append(";Geometry %i: %s\n" % (geometry_idx, current_geometry.get_geometry_name()))
+            lines.append(";Contour Strategy: %s\n" % self.contour_strategies[current_parameters.get_contour_strategy_idx()])
+            if self.contour_compressions[current_parameters.get_contour_compression_idx()] != 'None':
+                lines.append(";Contour Compression: %s, Tolerance (mm) " % self.contour_compressions[current_parameters.get_contour_compression_idx()]
+                             + decimals % self.__get_contour_compression_tolerances__(geometry_idx)[0] + "\n")
+            lines.append(";Contour: Feedrate (mm/s) " + decimals % (current_parameters.get_contour_scan_speed()) + ", Frequency (Hz) %i, Power (W) %i, Duty Cycle (%%) %i\n" % (current_parameters.get_contour_frequency(), current_parameters.get_contour_laser_power(), current_parameters.get_contour_duty_cycle()))
+            lines.append(";Infill Strategy: %s\n" % self.infill_strategies[current_parameters.get_infill_strategy_idx()])
+            lines.append(";Infill Density: %i\n" % current_parameters.get_infill_density())
+            lines.append(";Infill Overlap: %i\n" % current_parameters.get_infill_overlap())
+            lines.append(";Infill Rotation Angle: %i\n" % current_parameters.get_infill_rotation_angle())
+            if self.infill_strategies[current_parameters.get_infill_strategy_idx()] in ('Island', 'Stripes'):
+                lines.append(";Infill Tile Size (mm) " + decimals % current_parameters.get_infill_tile_size() + "\n")
+            lines.append(";Infill: Feedrate (mm/s) " + decimals % (current_parameters.get_infill_scan_speed()) + ", Frequency (Hz) %i, Power (W) %i, Duty Cycle (%%) %i\n" % (current_parameters.get_infill_frequency(), current_parameters.get_infill_laser_power(), current_parameters.get_infill_duty_cycle()))
+        lines += ["\n", gcode_helpers.preamble_gcode()]
+        return "".join(lines)
+
+    def __print_jump_lengths__(self):
+        if len(self.scan_path_jump_lengths) == 0:
+            return
+        total_jump_lengths = np.sum(np.reshape(self.scan_path_jump_lengths, (-1, 2)), axis=0)
+        print("Jump length (mm) before ordering: %.2f, after ordering: %.2f" % (total_jump_lengths[0], total_jump_lengths[1]))
+
+    # the header of the job is written before slicing, then each layer is appended by __write_job_stream_layer__ as
+    # soon as it is sliced, so slicing and writing overlap and the layers written so far can already be sent
+    def __open_job_stream__(self, file_name):
+        self.__job_stream_geometry_idxs = list(range(self.geometries_loaded))
+        self.scan_path_jump_lengths = []
+        if file_name.endswith('.mjob'):
+            self.__job_stream = gcode_helpers.BinaryJobWriter(file_name, self.__get_binary_job_header__(self.__job_stream_geometry_idxs),
+                                                              self.__number_of_decimals)
+        else:
+            self.__job_stream_file = QFile(file_name)
+            if not self.__job_stream_file.open(QIODevice.WriteOnly | QIODevice.Text):
+                self.__job_stream_file = None
+                return
+            self.__job_stream = QTextStream(self.__job_stream_file)
+            self.__job_stream << self.__get_job_header__(self.__job_stream_geometry_idxs, QFileInfo(self.__job_stream_file).fileName())
+            self.__job_stream.flush()
+        print(file_name)
+
+    def __write_job_stream_layer__(self, slice_idx):
+        # same rounding and contour order of the toolpaths written after slicing
+        for geometry_idx in self.__job_stream_geometry_idxs:
+            self.contour_vertices_list[geometry_idx].quantize(self.__number_of_decimals, slice_idx, slice_idx + 1)
+            self.infill_vertices_list[geometry_idx].quantize(self.__number_of_decimals, slice_idx, slice_idx + 1)
+            self.__sort_slice_contour_layer__(self.contour_vertices_list[geometry_idx], slice_idx)
+        if self.__job_stream_file is None:
+            jump_lengths = [0.0, 0.0]
+            blocks = self.__get_layer_blocks__(slice_idx, self.__job_stream_geometry_idxs, jump_lengths)
+            self.__job_stream.write_layer(slice_idx, float(self.layers_thickness_mm[slice_idx]), blocks)
+        else:
+            layer_gcode, jump_lengths = gcode_helpers.layer_gcode(self.__get_layer_task__(slice_idx, self.__job_stream_geometry_idxs))
+            self.__job_stream << layer_gcode
+            self.__job_stream.flush()
+        self.scan_path_jump_lengths.append(tuple(jump_lengths))
+
+    def __close_job_stream__(self):
+        if self.__job_stream is None:
+            return
+        if self.__job_stream_file is None:
+            self.__job_stream.close()
+        else:
+            self.__job_stream.flush()
+            self.__job_stream_file.close()
+        self.__job_stream = None
+        self.__job_stream_file = None
+        self.__print_jump_lengths__()
+
+    # infill and contour blocks of every geometry in the layer, as (geometry index, block type, (N, 2) points),
+    # with the segments of each block in scan order
+    def __get_layer_blocks__(self, slice_idx, sliced_geometry_idxs, jump_lengths):
+        layer_stores = self.__get_layer_stores__(slice_idx, sliced_geometry_idxs)
+        ordered_blocks = gcode_helpers.order_layer_blocks([toolpath_store.get_layer_points(slice_idx) for _, toolpath_store in layer_stores],
+                                                          self.optimize_scan_path, self.scan_path_two_opt, jump_lengths,
+                                                          [self.__keeps_scan_order__(geometry_idx, toolpath_store) for geometry_idx, toolpath_store in layer_stores])
+        blocks = []
+        for (geometry_idx, toolpath_store), points in zip(layer_stores, ordered_blocks):
+            # the binary job only holds segments, so its contours are simplified but never fitted with arcs
+            if toolpath_store.segment_type == ToolpathStore.CONTOUR:
+                points = gcode_helpers.simplify_segments(points, self.__get_contour_compression_tolerances__(geometry_idx)[0])
+            blocks.append((geometry_idx, toolpath_store.segment_type, points))
+        return blocks
+
+    # (simplify tolerance, arc tolerance) in mm of the contour G-code of the geometry, 0 when the stage is disabled
+    def __get_contour_compression_tolerances__(self, geometry_idx):
+        current_parameters = self.slicing_parameters_list[geometry_idx]
+        compression = self.contour_compressions[current_parameters.get_contour_compression_idx()]
+        tolerance = current_parameters.get_contour_compression_tolerance() / 100.0 * self.laser_width_microns / 1000.0
+        if compression == 'Simplify':
+            return tolerance, 0.0
+        elif compression == 'Simplify + Arcs':
+            return tolerance, tolerance
+        return 0.0, 0.0
+
+    # tiled infill pattern of the geometry, None when its strategy is not tiled. Tiles narrower than a track cannot
+    # hold their hatch lines and fall back to parallel lines
+    def __get_tile_pattern__(self, geometry_idx):
+        current_parameters = self.slicing_parameters_list[geometry_idx]
+        strategy = self.infill_strategies[current_parameters.get_infill_strategy_idx()]
+        if strategy in ('Island', 'Stripes') and current_parameters.get_infill_tile_size() >= self.laser_width_microns / 1000:
+            return strategy
+        return None
+
+    # island and stripes infill are scanned tile by tile with their own scan directions, the scan path optimization
+    # would mix the tiles and flip the hatch lines
+    def __keeps_scan_order__(self, geometry_idx, toolpath_store):
+        return toolpath_store.segment_type == ToolpathStore.INFILL and self.__get_tile_pattern__(geometry_idx) is not None
+
+    # (geometry index, toolpath store) of the blocks of the layer, infill then contour of every geometry
+    def __get_layer_stores__(self, slice_idx, sliced_geometry_idxs):
+        layer_stores = []
+        for geometry_idx in sliced_geometry_idxs:
+            for toolpath_store in (self.infill_vertices_list[geometry_idx], self.contour_vertices_list[geometry_idx]):
+                if toolpath_store.number_of_layers() > slice_idx:
+                    layer_stores.append((geometry_idx, toolpath_store))
+        return layer_stores
+
+    # task of gcode_helpers.layer_gcode for a layer: the infill and contour blocks of every geometry with their
+    # comments, laser parameters and duty cycle. The points are copied, so the task can be sent to another process
+    def __get_layer_task__(self, slice_idx, sliced_geometry_idxs):
+        decimals = "%%.%if" % self.__number_of_decimals
+        blocks = []
+        for geometry_idx, toolpath_store in self.__get_layer_stores__(slice_idx, sliced_geometry_idxs):
+            current_parameters = self.slicing_parameters_list[geometry_idx]
+            if toolpath_store.segment_type == ToolpathStore.INFILL:
+                lines = [";Start Infill (Geometry %i)\n" % geometry_idx,
+                         ";Infill Strategy: %s\n" % self.infill_strategies[current_parameters.get_infill_strategy_idx()],
+                         ";Infill Density: %i\n" % current_parameters.get_infill_density(),
+                         ";Infill Overlap: %i\n" % current_parameters.get_infill_overlap(),
+                         ";Infill Rotation Angle: %i\n" % (current_parameters.get_infill_rotation_angle() * slice_idx % 360),
+                         ";Set Feedrate, Frequency, and Power\n",
+                         "G1 F" + decimals % (current_parameters.get_infill_scan_speed()) + " H%i P%i\n" % (current_parameters.get_infill_frequency(), current_parameters.get_infill_laser_power())]
+                duty_cycle = current_parameters.get_infill_duty_cycle()
+                tolerances = (0.0, 0.0)
+            else:
+                lines = [";Start Contour (Geometry %i)\n" % geometry_idx,
+                         ";Contour Strategy: %s\n" % self.contour_strategies[current_parameters.get_contour_strategy_idx()],
+                         ";Set Feedrate, Frequency, and Power\n",
+                         "G1 F" + decimals % (current_parameters.get_contour_scan_speed()) + " H%i P%i\n" % (current_parameters.get_contour_frequency(), current_parameters.get_contour_laser_power())]
+                duty_cycle = current_parameters.get_contour_duty_cycle()
+                tolerances = self.__get_contour_compression_tolerances__(geometry_idx)
+            blocks.append(("".join(lines), duty_cycle, np.array(toolpath_store.get_layer_points(slice_idx))) + tolerances +
+                          (self.__keeps_scan_order__(geometry_idx, toolpath_store),))
+        return (slice_idx, float(self.layers_thickness_mm[slice_idx]), blocks, self.__number_of_decimals,
+                self.optimize_scan_path, self.scan_path_two_opt)
+
+    def __get_sliced_geometry_idxs__(self):
+        sliced_geometry_idxs = []
+        for geometry_idx in range(self.geometries_loaded):
+            if self.contour_vertices_list[geometry_idx].number_of_layers() > 0 or self.infill_vertices_list[geometry_idx].number_of_layers() > 0:
+                sliced_geometry_idxs.append(geometry_idx)
+        return sliced_geometry_idxs
+
+    # binary version of the job (see gcode_helpers.BinaryJobWriter), with the same layers and moves of the G-code job
+    def write_binary_job_to_file(self, file_name="./job.mjob"):
+        sliced_geometry_idxs = self.__get_sliced_geometry_idxs__()
+        if len(sliced_geometry_idxs) == 0:
+            return
+        for geometry_idx in sliced_geometry_idxs:
+            self.__sort_slice_contour(geometry_idx, use_old_sort=False)
+        writer = gcode_helpers.BinaryJobWriter(file_name, self.__get_binary_job_header__(sliced_geometry_idxs), self.__number_of_decimals)
+        self.scan_path_jump_lengths = []
+        for slice_idx in range(self.number_of_slices):
+            jump_lengths = [0.0, 0.0]
+            blocks = self.__get_layer_blocks__(slice_idx, sliced_geometry_idxs, jump_lengths)
+            writer.write_layer(slice_idx, float(self.layers_thickness_mm[slice_idx]), blocks)
+            self.scan_path_jump_lengths.append(tuple(jump_lengths))
+        writer.close()
+        print(file_name)
+
+    def __get_binary_job_header__(self, sliced_geometry_idxs):
+        geometries = {}
+        for geometry_idx in sliced_geometry_idxs:
+            current_parameters = self.slicing_parameters_list[geometry_idx]
+            geometries[str(geometry_idx)] = {
+                'name': self.geometries_list[geometry_idx].get_geometry_name(),
+                'contour_strategy': self.contour_strategies[current_parameters.get_contour_strategy_idx()],
+                'infill_strategy': self.infill_strategies[current_parameters.get_infill_strategy_idx()],
+                'parameters': current_parameters.get_parameters_dict()
+            }
+        header = {
+            'laser_width_microns': self.laser_width_microns,
+            'layers_thickness_mm': [float(thickness) for thickness in self.layers_thickness_mm],
+            'sliced': QDate.currentDate().toString("dd.MM.yyyy"),
+            'geometries': geometries
+        }
+        return header
+
     def load_geometry(self, filename, swapyz=True):
         time = QTime()
         time.start()
@@ -1332,11 +1805,14 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
     def remove_geometry(self):
         if self.geometries_loaded > 0:
             self.geometries_loaded -= 1
+            self.slice_cache.remove_geometry(id(self.geometries_list[self.current_geometry_idx]))
             del self.slicing_parameters_list[self.current_geometry_idx]
             GL.glDeleteBuffers(1, [self.contour_buffer_id_list[self.current_geometry_idx]])
             GL.glDeleteBuffers(1, [self.infill_buffer_id_list[self.current_geometry_idx]])
             del self.contour_buffer_id_list[self.current_geometry_idx]
             del self.infill_buffer_id_list[self.current_geometry_idx]
+            self.contour_vertices_list[self.current_geometry_idx].release()
+            self.infill_vertices_list[self.current_geometry_idx].release()
             del self.contour_vertices_list[self.current_geometry_idx]
             del self.infill_vertices_list[self.current_geometry_idx]
 
@@ -1353,17 +1829,34 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
             'building_area_width (mm)': 100,
             'building_area_height (mm)': 100,
             'slice_thickness (microns)': 10,
+            'adaptive_layers': False,
+            'min_slice_thickness (microns)': 10,
+            'max_slice_thickness (microns)': 50,
+            'cusp_height (microns)': 5,
             'infill_density': 100,
             'infill_overlap': 0,
             'infill_rotation': 0,
+            'infill_tile_size (mm)': 5,
             'infill_duty_cycle (%)': 100,
-            'infill_scan_speed (mm/min)': 10,
+            'infill_scan_speed (mm/s)': 10,
             'infill_laser_power': 100,
             'infill_frequency (Hz)': 100000,
             'contour_duty_cycle (%)': 100,
-            'contour_scan_speed (mm/min)': 10,
+            'contour_scan_speed (mm/s)': 10,
             'contour_laser_power': 100,
-            'contour_frequency (Hz)': 100000
+            'contour_frequency (Hz)': 100000,
+            'contour_compression_tolerance (%)': 10,
+            'packing_spacing (mm)': 2,
+            'packing_rotation_step (deg)': 90,
+            'laser_compensation': False,
+            'contour_shells': 1,
+            'contour_join_style': 'round',
+            'optimize_scan_path': True,
+            'stream_job_while_slicing': False,
+            'use_ray_casting_infill': False,
+            'scan_path_2opt': True,
+            'gcode_writer_processes': 0,
+            'toolpath_spill_layers': 2000
         }
         base_path = Path(__file__).parent
         settings_path = str((base_path / '../resources/PRINTER_SETTINGS.json').resolve())
@@ -1375,6 +1868,10 @@ class MetalSlicer(QOpenGLWidget, QOpenGLFunctions):
                     if key in file_data["metal_printer_settings"]:
                         new_value = file_data["metal_printer_settings"][key]
                         self.__default_parameters[key] = new_value
+                # the scan speeds were saved with a mm/min label, their values were always the mm/s of "G1 F"
+                for key in ('infill_scan_speed', 'contour_scan_speed'):
+                    if key + ' (mm/min)' in file_data["metal_printer_settings"] and key + ' (mm/s)' not in file_data["metal_printer_settings"]:
+                        self.__default_parameters[key + ' (mm/s)'] = file_data["metal_printer_settings"][key + ' (mm/min)']
             settings_file.close()
 
     @Slot()
@@ -2,7 +2,7 @@ import sys
 from PySide2.QtWidgets import QVBoxLayout, QSpinBox, QWidget, QGroupBox, QSlider, QLabel, \
     QGridLayout, QDoubleSpinBox, QCheckBox, QPushButton, QFileDialog, QHBoxLayout, QMessageBox, QComboBox, QSizePolicy
 from PySide2.QtCore import Signal, Slot, Qt, QFileInfo
-from PySide2.QtGui import QGuiApplication
+from PySide2.QtGui import QGuiApplication, QCloseEvent
 from MetalPrinter.metalSlicer import MetalSlicer
 from PyTracer import pyGeometry
 
@@ -248,6 +248,41 @@ class MetalSlicerGUI(QWidget):
         thickness_edit.setSingleStep(0.1)
         thickness_edit.setValue(self.__slicer_widget.slice_thickness_microns)
         thickness_edit.valueChanged.connect(self.__slicer_widget.set_slice_thickness)
+        adaptive_layers_box = QCheckBox("Adaptive Layers", self.__slicer_options_widget)
+        adaptive_layers_box.setChecked(self.__slicer_widget.adaptive_layers)
+        adaptive_layers_box.toggled.connect(self.__slicer_widget.set_adaptive_layers)
+        adaptive_layers_box.toggled.connect(thickness_edit.setDisabled)
+        min_thickness_edit = QDoubleSpinBox(self.__slicer_options_widget)
+        min_thickness_edit.setPrefix("Min: ")
+        min_thickness_edit.setSuffix(str('\u03BCm'))
+        min_thickness_edit.setMaximum(1000000)
+        min_thickness_edit.setMinimum(0.1)
+        min_thickness_edit.setDecimals(1)
+        min_thickness_edit.setSingleStep(0.1)
+        min_thickness_edit.setValue(self.__slicer_widget.min_slice_thickness_microns)
+        min_thickness_edit.valueChanged.connect(self.__slicer_widget.set_min_slice_thickness)
+        max_thickness_edit = QDoubleSpinBox(self.__slicer_options_widget)
+        max_thickness_edit.setPrefix("Max: ")
+        max_thickness_edit.setSuffix(str('\u03BCm'))
+        max_thickness_edit.setMaximum(1000000)
+        max_thickness_edit.setMinimum(0.1)
+        max_thickness_edit.setDecimals(1)
+        max_thickness_edit.setSingleStep(0.1)
+        max_thickness_edit.setValue(self.__slicer_widget.max_slice_thickness_microns)
+        max_thickness_edit.valueChanged.connect(self.__slicer_widget.set_max_slice_thickness)
+        cusp_height_label = QLabel("Cusp Height", self.__slicer_options_widget)
+        cusp_height_edit = QDoubleSpinBox(self.__slicer_options_widget)
+        cusp_height_edit.setSuffix(str('\u03BCm'))
+        cusp_height_edit.setMaximum(1000000)
+        cusp_height_edit.setMinimum(0.1)
+        cusp_height_edit.setDecimals(1)
+        cusp_height_edit.setSingleStep(0.1)
+        cusp_height_edit.setValue(self.__slicer_widget.cusp_height_microns)
+        cusp_height_edit.valueChanged.connect(self.__slicer_widget.set_cusp_height)
+        for widget in (min_thickness_edit, max_thickness_edit, cusp_height_edit):
+            widget.setEnabled(self.__slicer_widget.adaptive_layers)
+            adaptive_layers_box.toggled.connect(widget.setEnabled)
+        thickness_edit.setDisabled(self.__slicer_widget.adaptive_layers)
         laser_width_label = QLabel("Laser Width", self.__slicer_options_widget)
         laser_width_edit = QDoubleSpinBox(self.__slicer_options_widget)
         laser_width_edit.setSuffix(str('\u03BCm'))
@@ -271,10 +306,52 @@ class MetalSlicerGUI(QWidget):
         building_area_edit_y.setMinimum(0)
         building_area_edit_y.setValue(self.__slicer_widget.building_area_height_mm)
         building_area_edit_y.valueChanged.connect(self.__slicer_widget.set_building_area_height)
+        packing_spacing_label = QLabel("Geometries Spacing", self.__slicer_options_widget)
+        packing_spacing_edit = QDoubleSpinBox(self.__slicer_options_widget)
+        packing_spacing_edit.setSuffix(str(' mm'))
+        packing_spacing_edit.setMaximum(1000)
+        packing_spacing_edit.setMinimum(0)
+        packing_spacing_edit.setDecimals(2)
+        packing_spacing_edit.setSingleStep(0.1)
+        packing_spacing_edit.setValue(self.__slicer_widget.packing_spacing_mm)
+        packing_spacing_edit.valueChanged.connect(self.__slicer_widget.set_packing_spacing)
+        laser_compensation_box = QCheckBox("Laser Compensation", self.__slicer_options_widget)
+        laser_compensation_box.setChecked(self.__slicer_widget.laser_compensation)
+        laser_compensation_box.toggled.connect(self.__slicer_widget.set_laser_compensation)
+        contour_shells_label = QLabel("Contour Shells", self.__slicer_options_widget)
+        contour_shells_edit = QSpinBox(self.__slicer_options_widget)
+        contour_shells_edit.setMaximum(100)
+        contour_shells_edit.setMinimum(1)
+        contour_shells_edit.setValue(self.__slicer_widget.contour_shells)
+        contour_shells_edit.valueChanged.connect(self.__slicer_widget.set_contour_shells)
+        contour_join_label = QLabel("Shell Corners", self.__slicer_options_widget)
+        contour_join_combo = QComboBox(self.__slicer_options_widget)
+        for join_style in self.__slicer_widget.contour_join_styles:
+            contour_join_combo.addItem(join_style.capitalize())
+        if self.__slicer_widget.contour_join_style in self.__slicer_widget.contour_join_styles:
+            contour_join_combo.setCurrentIndex(self.__slicer_widget.contour_join_styles.index(self.__slicer_widget.contour_join_style))
+        contour_join_combo.currentIndexChanged.connect(self.__slicer_widget.set_contour_join_style_idx)
+        optimize_scan_path_box = QCheckBox("Optimize Scan Path", self.__slicer_options_widget)
+        optimize_scan_path_box.setChecked(self.__slicer_widget.optimize_scan_path)
+        optimize_scan_path_box.toggled.connect(self.__slicer_widget.set_optimize_scan_path)
+        stream_job_box = QCheckBox("Write Job While Slicing", self.__slicer_options_widget)
+        stream_job_box.setChecked(self.__slicer_widget.stream_job_while_slicing)
+        stream_job_box.toggled.connect(self.__slicer_widget.set_stream_job_while_slicing)
+        ray_casting_box = QCheckBox("Ray Casting Infill (Legacy)", self.__slicer_options_widget)
+        ray_casting_box.setChecked(self.__slicer_widget.use_ray_casting_infill)
+        ray_casting_box.toggled.connect(self.__slicer_widget.set_use_ray_casting_infill)
         building_area_width_row = 0
         building_area_height_row = building_area_width_row + 1
         thickness_label_row = 2
         pixel_size_row = thickness_label_row + 1
+        packing_spacing_row = pixel_size_row + 1
+        adaptive_layers_row = packing_spacing_row + 1
+        cusp_height_row = adaptive_layers_row + 1
+        laser_compensation_row = cusp_height_row + 1
+        contour_shells_row = laser_compensation_row + 1
+        contour_join_row = contour_shells_row + 1
+        optimize_scan_path_row = contour_join_row + 1
+        ray_casting_row = optimize_scan_path_row + 1
         contour_strategy_row = 4
         infill_strategy_row = contour_strategy_row + 1
         infill_density_row = infill_strategy_row + 1
@@ -290,6 +367,21 @@ class MetalSlicerGUI(QWidget):
         slice_layout.addWidget(building_area_height_label, building_area_height_row, 0)
         slice_layout.addWidget(building_area_edit_y, building_area_height_row, 1)
         slice_layout.addWidget(building_area_edit_y, building_area_height_row, 1)
+        slice_layout.addWidget(packing_spacing_label, packing_spacing_row, 0)
+        slice_layout.addWidget(packing_spacing_edit, packing_spacing_row, 1)
+        slice_layout.addWidget(adaptive_layers_box, adaptive_layers_row, 0)
+        slice_layout.addWidget(min_thickness_edit, adaptive_layers_row, 1)
+        slice_layout.addWidget(max_thickness_edit, adaptive_layers_row, 2)
+        slice_layout.addWidget(cusp_height_label, cusp_height_row, 0)
+        slice_layout.addWidget(cusp_height_edit, cusp_height_row, 1)
+        slice_layout.addWidget(laser_compensation_box, laser_compensation_row, 0)
+        slice_layout.addWidget(contour_shells_label, contour_shells_row, 0)
+        slice_layout.addWidget(contour_shells_edit, contour_shells_row, 1)
+        slice_layout.addWidget(contour_join_label, contour_join_row, 0)
+        slice_layout.addWidget(contour_join_combo, contour_join_row, 1)
+        slice_layout.addWidget(optimize_scan_path_box, optimize_scan_path_row, 0)
+        slice_layout.addWidget(stream_job_box, optimize_scan_path_row, 1)
+        slice_layout.addWidget(ray_casting_box, ray_casting_row, 0)
         self.__slicer_options_widget.setLayout(slice_layout)
 
     def __init_slices_display_options_widget(self):
@@ -414,6 +506,18 @@ class MetalSlicerGUI(QWidget):
             self.contour_combo.addItem(strategy)
         self.contour_combo.setCurrentIndex(self.__slicer_widget.contour_strategy_idx)
         self.contour_combo.currentIndexChanged.connect(self.set_contour_strategy_idx)
+        contour_compression_label = QLabel("Contour Compression", self.__geometry_specific_slicer_options_widget)
+        self.contour_compression_combo = QComboBox(self.__geometry_specific_slicer_options_widget)
+        for compression in self.__slicer_widget.contour_compressions:
+            self.contour_compression_combo.addItem(compression)
+        self.contour_compression_combo.setCurrentIndex(self.__slicer_widget.contour_compression_idx)
+        self.contour_compression_combo.currentIndexChanged.connect(self.set_contour_compression_idx)
+        self.contour_compression_tolerance_spin = QDoubleSpinBox(self.__geometry_specific_slicer_options_widget)
+        self.contour_compression_tolerance_spin.setSuffix(str('%'))
+        self.contour_compression_tolerance_spin.setMinimum(0)
+        self.contour_compression_tolerance_spin.setMaximum(100)
+        self.contour_compression_tolerance_spin.setValue(self.__slicer_widget.default_contour_compression_tolerance)
+        self.contour_compression_tolerance_spin.valueChanged.connect(self.set_contour_compression_tolerance)
         infill_label = QLabel("Infill Strategy", self.__geometry_specific_slicer_options_widget)
         self.infill_combo = QComboBox(self.__geometry_specific_slicer_options_widget)
         for strategy in self.__slicer_widget.infill_strategies:
@@ -444,16 +548,24 @@ class MetalSlicerGUI(QWidget):
         self.infill_rotation_spin.setValue(self.__slicer_widget.default_infill_rotation)
         self.infill_rotation_spin.setSingleStep(1)
         self.infill_rotation_spin.valueChanged.connect(self.set_infill_rotation_angle)
+        infill_tile_size_label = QLabel("Infill Tile Size (mm)", self.__geometry_specific_slicer_options_widget)
+        self.infill_tile_size_spin = QDoubleSpinBox(self.__geometry_specific_slicer_options_widget)
+        self.infill_tile_size_spin.setMinimum(0)
+        self.infill_tile_size_spin.setMaximum(1000)
+        self.infill_tile_size_spin.setValue(self.__slicer_widget.default_infill_tile_size)
+        self.infill_tile_size_spin.valueChanged.connect(self.set_infill_tile_size)
         contour_strategy_row = 0
         contour_power_row = contour_strategy_row + 1
         contour_scan_speed_row = contour_power_row + 1
         contour_duty_cycle_row = contour_scan_speed_row + 1
         contour_frequency_row = contour_duty_cycle_row + 1
-        infill_strategy_row = contour_frequency_row + 1
+        contour_compression_row = contour_frequency_row + 1
+        infill_strategy_row = contour_compression_row + 1
         infill_density_row = infill_strategy_row + 1
         infill_overlap_row = infill_density_row + 1
         infill_rotation_row = infill_overlap_row + 1
-        infill_power_row = infill_rotation_row + 1
+        infill_tile_size_row = infill_rotation_row + 1
+        infill_power_row = infill_tile_size_row + 1
         infill_scan_speed_row = infill_power_row + 1
         infill_duty_cycle_row = infill_scan_speed_row + 1
         infill_frequency_row = infill_duty_cycle_row + 1
@@ -468,6 +580,9 @@ class MetalSlicerGUI(QWidget):
         slice_layout.addWidget(self.contour_duty_cycle_spin, contour_duty_cycle_row, 1)
         slice_layout.addWidget(contour_frequency_label, contour_frequency_row, 0)
         slice_layout.addWidget(self.contour_frequency_spin, contour_frequency_row, 1)
+        slice_layout.addWidget(contour_compression_label, contour_compression_row, 0)
+        slice_layout.addWidget(self.contour_compression_combo, contour_compression_row, 1)
+        slice_layout.addWidget(self.contour_compression_tolerance_spin, contour_compression_row, 2)
         slice_layout.addWidget(infill_power_label, infill_power_row, 0)
         slice_layout.addWidget(self.infill_power_spin, infill_power_row, 1)
         slice_layout.addWidget(infill_scan_speed_label, infill_scan_speed_row, 0)
@@ -484,6 +599,8 @@ class MetalSlicerGUI(QWidget):
         slice_layout.addWidget(self.infill_overlap_spin, infill_overlap_row, 1)
         slice_layout.addWidget(infill_rotation_angle_label, infill_rotation_row, 0)
         slice_layout.addWidget(self.infill_rotation_spin, infill_rotation_row, 1)
+        slice_layout.addWidget(infill_tile_size_label, infill_tile_size_row, 0)
+        slice_layout.addWidget(self.infill_tile_size_spin, infill_tile_size_row, 1)
         self.__geometry_specific_slicer_options_widget.setLayout(slice_layout)
 
     def __init_buttons_options_widget(self):
@@ -500,11 +617,14 @@ class MetalSlicerGUI(QWidget):
         remove_geometry_button.clicked.connect(self.remove_geometry)
         save_scene_button = QPushButton("Save Scene")
         save_scene_button.clicked.connect(self.save_current_scene)
+        arrange_geometries_button = QPushButton("Arrange Geometries")
+        arrange_geometries_button.clicked.connect(self.arrange_geometries)
         self.slices_label = QLabel(f'Slicing progress: {0:.0f}/{0:.0f}', self.__buttons_options_widget)
         slice_layout = QHBoxLayout()
         slice_layout.addWidget(load_geometry_button)
         slice_layout.addWidget(remove_geometry_button)
         slice_layout.addWidget(save_scene_button)
+        slice_layout.addWidget(arrange_geometries_button)
         slice_layout.addWidget(slice_geometry_button)
         slice_layout.addWidget(slice_interrupt_button)
         slice_layout.addWidget(save_job_button)
@@ -546,15 +666,32 @@ class MetalSlicerGUI(QWidget):
         if len(file_name[0]) > 0:
             self.__slicer_widget.save_current_scene(file_name[0])
 
+    @Slot()
+    def arrange_geometries(self):
+        not_placed = self.__slicer_widget.pack_geometries()
+        self.update_geometry_transformations(self.geometry_list.currentIndex())
+        if len(not_placed) > 0:
+            names = [self.__slicer_widget.get_geometry(idx).get_geometry_name() for idx in not_placed]
+            QMessageBox.warning(self, "AMLab Software", "Geometries not fitting the building area:\n" + "\n".join(names))
+
     @Slot()
     def start_slicing_process(self):
-        self.__slicer_widget.prepare_for_slicing()
+        job_file_name = None
+        if self.__slicer_widget.stream_job_while_slicing:
+            file_name = QFileDialog.getSaveFileName(caption='Select Job File Name', dir='../', parent=self, filter="Files (*.g);;Binary Job Files (*.mjob)")
+            if len(file_name[0]) == 0:
+                return
+            job_file_name = file_name[0]
+        self.__slicer_widget.prepare_for_slicing(job_file_name=job_file_name)
 
     @Slot()
     def save_print_job_to_file(self):
-        file_name = QFileDialog.getSaveFileName(caption='Select Job File Name', dir='../', parent=self, filter="Files (*.g)")
+        file_name = QFileDialog.getSaveFileName(caption='Select Job File Name', dir='../', parent=self, filter="Files (*.g);;Binary Job Files (*.mjob)")
         if len(file_name[0]) > 0:
-            self.__slicer_widget.write_slice_job_to_file(file_name[0])
+            if file_name[0].endswith('.mjob'):
+                self.__slicer_widget.write_binary_job_to_file(file_name[0])
+            else:
+                self.__slicer_widget.write_slice_job_to_file(file_name[0])
 
     @Slot(float, float, float)
     def update_size_label(self, width, depth, height):
@@ -628,6 +765,9 @@ class MetalSlicerGUI(QWidget):
             infill_idx = parameters.get_infill_strategy_idx()
             contour_idx = parameters.get_contour_strategy_idx()
             infill_rotation_angle = parameters.get_infill_rotation_angle()
+            infill_tile_size = parameters.get_infill_tile_size()
+            contour_compression_idx = parameters.get_contour_compression_idx()
+            contour_compression_tolerance = parameters.get_contour_compression_tolerance()
             self.__geometry_specific_slicer_options_widget.blockSignals(True)
             self.contour_scan_speed_spin.setValue(contour_scan_speed)
             self.contour_power_spin.setValue(contour_laser_power)
@@ -640,8 +780,11 @@ class MetalSlicerGUI(QWidget):
             self.infill_density_spin.setValue(infill_density)
             self.infill_overlap_spin.setValue(infill_overlap)
             self.infill_rotation_spin.setValue(infill_rotation_angle)
+            self.infill_tile_size_spin.setValue(infill_tile_size)
             self.infill_combo.setCurrentIndex(infill_idx)
             self.contour_combo.setCurrentIndex(contour_idx)
+            self.contour_compression_combo.setCurrentIndex(contour_compression_idx)
+            self.contour_compression_tolerance_spin.setValue(contour_compression_tolerance)
             self.__geometry_specific_slicer_options_widget.blockSignals(False)
 
     @Slot(str, int)
@@ -736,6 +879,12 @@ class MetalSlicerGUI(QWidget):
         if slicing_parameters:
             slicing_parameters.set_infill_rotation_angle(value)
 
+    @Slot(float)
+    def set_infill_tile_size(self, value):
+        slicing_parameters = self.__slicer_widget.get_current_parameters()
+        if slicing_parameters:
+            slicing_parameters.set_infill_tile_size(value)
+
     @Slot(float)
     def set_contour_scan_speed(self, value):
         slicing_parameters = self.__slicer_widget.get_current_parameters()
@@ -766,12 +915,30 @@ class MetalSlicerGUI(QWidget):
         if slicing_parameters:
             slicing_parameters.set_contour_strategy_idx(value)
 
+    @Slot(int)
+    def set_contour_compression_idx(self, value):
+        slicing_parameters = self.__slicer_widget.get_current_parameters()
+        if slicing_parameters:
+            slicing_parameters.set_contour_compression_idx(value)
+
+    @Slot(float)
+    def set_contour_compression_tolerance(self, value):
+        slicing_parameters = self.__slicer_widget.get_current_parameters()
+        if slicing_parameters:
+            slicing_parameters.set_contour_compression_tolerance(value)
+
     @Slot(int)
     def set_infill_strategy_idx(self, value):
         slicing_parameters = self.__slicer_widget.get_current_parameters()
         if slicing_parameters:
             slicing_parameters.set_infill_strategy_idx(value)
 
+    @Slot()
+    def closeEvent(self, event: QCloseEvent):
+        self.__slicer_widget.interrupt_slicing()
+        self.__slicer_widget.release_toolpath_stores()
+        event.accept()
+
 class MyQComboBox(QComboBox):
 
     combo_box_clicked = Signal()
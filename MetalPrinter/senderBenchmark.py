@@ -0,0 +1,90 @@
+import sys
+import os
+import time
+import json
+import argparse
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from PySide2.QtCore import QCoreApplication
+from MetalPrinter.gCodeSender import GCodeSender
+from MetalPrinter.controllerSimulator import ControllerSimulatorProcess
+from helpers import log_helpers
+
+
+# streams a job file through the G-code sender to a ControllerSimulator and reports the throughput seen by the
+# controller: lines per second, reply latency percentiles and resent lines. The simulator runs in its own process and
+# simulates a serial line of baud_rate with round_trip_latency_s
+def run_benchmark(job_file, streaming_mode=True, rx_buffer_size=127, command_latency_s=0.0005, error_rate=0.0, seed=0,
+                  baud_rate=115200, round_trip_latency_s=0.001):
+    application = QCoreApplication.instance()
+    if application is None:
+        application = QCoreApplication(sys.argv)
+    simulator = ControllerSimulatorProcess(rx_buffer_size=rx_buffer_size, command_latency_s=command_latency_s,
+                                           error_rate=error_rate, seed=seed, baud_rate=baud_rate,
+                                           round_trip_latency_s=round_trip_latency_s)
+    simulator.start()
+    sender = GCodeSender()
+    try:
+        sender.set_console_verbosity(log_helpers.LOG_STATUS)
+        sender.set_streaming_mode(streaming_mode)
+        sender.set_rx_buffer_size(rx_buffer_size)
+        sender.set_comport_url(simulator.get_url())
+        if sender.connect_serial() is False:
+            raise RuntimeError("Connection to the simulated controller NOT established!")
+        if sender.open_file(job_file) is False:
+            raise RuntimeError("Problems loading the job file %s!" % job_file)
+        simulator.reset_statistics()
+        start_time = time.perf_counter()
+        sender.start()
+        while sender.get_state() != GCodeSender.IDLE:
+            application.processEvents()
+            time.sleep(0.01)
+        elapsed_time_s = time.perf_counter() - start_time
+    finally:
+        sender.close_connection()
+        simulator.stop()
+    results = simulator.get_statistics()
+    results['job_file'] = job_file
+    results['streaming_mode'] = streaming_mode
+    results['rx_buffer_size'] = rx_buffer_size
+    results['command_latency_ms'] = command_latency_s * 1000
+    results['error_rate'] = error_rate
+    results['baud_rate'] = baud_rate
+    results['round_trip_latency_ms'] = round_trip_latency_s * 1000
+    results['elapsed_time_s'] = elapsed_time_s
+    results['lines_per_second'] = results['acknowledged_lines'] / elapsed_time_s if elapsed_time_s > 0 else 0
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streams job files through the G-code sender to a simulated controller")
+    parser.add_argument('job_files', nargs='+')
+    parser.add_argument('--stop-and-wait', action='store_true', help="send a line only after the reply to the previous one")
+    parser.add_argument('--rx-buffer-size', type=int, default=127)
+    parser.add_argument('--command-latency-ms', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--baud-rate', type=int, default=115200, help="baud rate of the simulated serial line, 0 for no transfer time")
+    parser.add_argument('--round-trip-latency-ms', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="print the results as json lines")
+    parser.add_argument('--min-lines-per-second', type=float, default=0, help="exit with an error below this throughput")
+    args = parser.parse_args(argv)
+    is_slow = False
+    for job_file in args.job_files:
+        results = run_benchmark(job_file, streaming_mode=not args.stop_and_wait, rx_buffer_size=args.rx_buffer_size,
+                                command_latency_s=args.command_latency_ms / 1000, error_rate=args.error_rate, seed=args.seed,
+                                baud_rate=args.baud_rate, round_trip_latency_s=args.round_trip_latency_ms / 1000)
+        if args.json:
+            print(json.dumps(results))
+        else:
+            print("%s (%s)" % (job_file, "streaming" if results['streaming_mode'] else "stop and wait"))
+            print("  lines: %i in %.2f s, %.0f lines/s" % (results['acknowledged_lines'], results['elapsed_time_s'], results['lines_per_second']))
+            print("  latency (ms): p50 %.3f, p95 %.3f, p99 %.3f" % (results['latency_p50_ms'], results['latency_p95_ms'], results['latency_p99_ms']))
+            print("  resend requests: %i, dropped frames: %i, lost bytes: %i, max receive buffer fill: %i" %
+                  (results['resend_requests'], results['dropped_frames'], results['lost_bytes'], results['max_rx_fill']))
+        if results['lines_per_second'] < args.min_lines_per_second:
+            is_slow = True
+    return 1 if is_slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,593 @@
+import os
+import json
+import mmap
+import queue
+import struct
+import threading
+import numpy as np
+from collections import deque
+from multiprocessing import Pool
+from helpers import scan_path_helpers
+from helpers import polygon_helpers
+
+BINARY_JOB_MAGIC = b'MJOB'
+BINARY_JOB_VERSION = 1
+# block types of the binary job, same values of ToolpathStore.CONTOUR and ToolpathStore.INFILL
+CONTOUR_BLOCK = 0
+INFILL_BLOCK = 1
+RECOATING_COMMANDS = ("M10", "M4 V2 T11000 D683 F490", "M7 R3")
+PREAMBLE_COMMANDS = ("G92", "M10", "C0")
+# the text job is scanned in chunks of bytes, the commands are handed to the sender in batches of lines
+TEXT_JOB_SCAN_CHUNK_SIZE = 64 * 1024 * 1024
+TEXT_JOB_BATCH_SIZE = 1024
+TEXT_JOB_QUEUED_BATCHES = 16
+JOB_CHECKPOINT_EXTENSION = '.checkpoint'
+
+
+# G-code of a block of (N, 2) segment end points. A segment starting where the previous one ends is printed with a
+# single marking move, the others need a jump move to their start point first. The jump mask is computed for the
+# whole block and all the lines are formatted with a single format operation.
+def format_segments(points, number_of_decimals, duty_cycle):
+    segments = np.asarray(points).reshape(-1, 2, 2)
+    if len(segments) == 0:
+        return ""
+    jumps = jump_mask(segments)
+    # each segment emits its start point (only after a jump) and its end point
+    emitted = np.empty((len(segments), 2), dtype=bool)
+    emitted[:, 0] = jumps
+    emitted[:, 1] = True
+    coordinates = unsigned_zeros(segments.reshape(-1, 2)[emitted.ravel()], number_of_decimals)
+    is_mark = np.zeros((len(segments), 2), dtype=bool)
+    is_mark[:, 1] = True
+    is_mark = is_mark[emitted]
+    jump_format = "G1 X%%.%if Y%%.%if\n" % (number_of_decimals, number_of_decimals)
+    mark_format = "G1 X%%.%if Y%%.%if D%i\n" % (number_of_decimals, number_of_decimals, duty_cycle)
+    line_formats = np.where(is_mark, mark_format, jump_format)
+    return "".join(line_formats.tolist()) % tuple(coordinates.ravel().tolist())
+
+
+# G-code of a block of (N, 2) segment end points like format_segments, with every run of connected segments reduced
+# before it is written: the parts of the run that follow a circle within arc_tolerance become G2 (clockwise) and G3
+# (counterclockwise) moves, with the offset of the center from their start point in I and J, and the rest of the run
+# is simplified with Douglas-Peucker within simplify_tolerance. A tolerance of 0 disables the corresponding stage
+def format_polylines(points, number_of_decimals, duty_cycle, simplify_tolerance=0.0, arc_tolerance=0.0):
+    if simplify_tolerance <= 0 and arc_tolerance <= 0:
+        return format_segments(points, number_of_decimals, duty_cycle)
+    segments = np.asarray(points, dtype=np.float64).reshape(-1, 2, 2)
+    if len(segments) == 0:
+        return ""
+    decimals = "%%.%if" % number_of_decimals
+    jump_format = "G1 X" + decimals + " Y" + decimals + "\n"
+    mark_format = "G1 X" + decimals + " Y" + decimals + " D%i\n" % duty_cycle
+    arc_format = "%s X" + decimals + " Y" + decimals + " I" + decimals + " J" + decimals + " D%i\n" % duty_cycle
+    run_starts = np.nonzero(jump_mask(segments))[0]
+    run_ends = np.append(run_starts[1:], len(segments))
+    lines = []
+    for run_start, run_end in zip(run_starts, run_ends):
+        polyline = unsigned_zeros(np.concatenate((segments[run_start:run_end, 0], segments[run_end - 1:run_end, 1])),
+                                  number_of_decimals)
+        lines.append(jump_format % tuple(polyline[0]))
+        if arc_tolerance > 0:
+            pieces = polygon_helpers.fit_arcs(polyline, arc_tolerance)
+        else:
+            pieces = [(0, len(polyline) - 1, None, False)]
+        for first, last, center, counterclockwise in pieces:
+            if center is None:
+                line_points = polyline[first:last + 1]
+                if simplify_tolerance > 0:
+                    line_points = line_points[polygon_helpers.simplify_polyline(line_points, simplify_tolerance)]
+                lines.append((mark_format * (len(line_points) - 1)) % tuple(line_points[1:].ravel().tolist()))
+            else:
+                center_offset = unsigned_zeros(center - polyline[first], number_of_decimals)
+                lines.append(arc_format % ("G3" if counterclockwise else "G2", polyline[last][0], polyline[last][1],
+                                           center_offset[0], center_offset[1]))
+    return "".join(lines)
+
+
+# (N, 2) segment end points with every run of connected segments simplified with Douglas-Peucker within tolerance
+def simplify_segments(points, tolerance):
+    segments = np.asarray(points).reshape(-1, 2, 2)
+    if tolerance <= 0 or len(segments) == 0:
+        return np.asarray(points).reshape(-1, 2)
+    run_starts = np.nonzero(jump_mask(segments))[0]
+    run_ends = np.append(run_starts[1:], len(segments))
+    simplified = []
+    for run_start, run_end in zip(run_starts, run_ends):
+        polyline = np.concatenate((segments[run_start:run_end, 0], segments[run_end - 1:run_end, 1]))
+        polyline = polyline[polygon_helpers.simplify_polyline(polyline, tolerance)]
+        simplified.append(np.stack((polyline[:-1], polyline[1:]), axis=1).reshape(-1, 2))
+    return np.concatenate(simplified)
+
+
+# values formatted as zero with number_of_decimals digits are replaced by 0.0, so that the small negative values and
+# the negative zeros are not written as "-0.000"
+def unsigned_zeros(values, number_of_decimals):
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.abs(values) < 0.5 * 10.0 ** -number_of_decimals, 0.0, values)
+
+
+# True for the (N, 2, 2) segments that do not start where the previous one ends
+def jump_mask(segments):
+    jumps = np.ones(len(segments), dtype=bool)
+    jumps[1:] = np.any(segments[1:, 0] != segments[:-1, 1], axis=1)
+    return jumps
+
+
+# commands that restore the machine state of a layer when a job is resumed after the preamble: absolute positioning,
+# build plate position after the homing and the laser parameters of the last block before the layer
+def resume_commands(build_plate_position, laser_command):
+    commands = ["G92", "C1 A%.6f" % build_plate_position]
+    if laser_command is not None:
+        commands.append(laser_command)
+    return commands
+
+
+# the checkpoint of a job is saved next to the job file, it is replaced atomically so that a fault while writing
+# leaves the previous checkpoint
+def write_job_checkpoint(job_file_name, checkpoint):
+    file_name = job_file_name + JOB_CHECKPOINT_EXTENSION
+    with open(file_name + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(file_name + '.tmp', file_name)
+
+
+# None when the job has no checkpoint, a checkpoint that cannot be read or has no number of completed layers raises
+# ValueError instead of restarting the job from the first layer
+def read_job_checkpoint(job_file_name):
+    file_name = job_file_name + JOB_CHECKPOINT_EXTENSION
+    if not os.path.exists(file_name):
+        return None
+    try:
+        with open(file_name, 'r') as f:
+            checkpoint = json.load(f)
+        if not isinstance(checkpoint, dict) or not isinstance(checkpoint['completed_layers'], int):
+            raise ValueError("completed_layers is not a number of layers")
+    except (OSError, ValueError, KeyError) as e:
+        raise ValueError("Corrupt job checkpoint %s: %s" % (file_name, e))
+    return checkpoint
+
+
+# serial frames "<command>*<checksum>\n", numbered "N<number> <command>*<checksum>\n" from first_line_number on. The
+# checksum is the XOR of the bytes before '*', reduced for all the frames at once over their concatenated bytes
+def encode_frames(commands, first_line_number=None):
+    if len(commands) == 0:
+        return []
+    if first_line_number is not None:
+        commands = ["N%i %s" % (line_number, command) for line_number, command in enumerate(commands, first_line_number)]
+    data = np.frombuffer(''.join(commands).encode('ascii'), dtype=np.uint8)
+    lengths = np.fromiter(map(len, commands), dtype=np.int64, count=len(commands))
+    checksums = np.zeros(len(commands), dtype=np.uint8)
+    if len(data) > 0:
+        checksums = np.bitwise_xor.reduceat(data, np.minimum(np.cumsum(lengths) - lengths, len(data) - 1))
+        checksums[lengths == 0] = 0
+    return [("%s*%i\n" % frame).encode('ascii') for frame in zip(commands, checksums.tolist())]
+
+
+# (command, line number, frame) of the commands of a job, framed a batch at a time. The motor commands and the empty
+# lines have no frame, the serial commands are numbered from first_line_number on when it is given
+def framed_commands(commands, first_line_number=None, batch_size=1024):
+    line_number = first_line_number
+    batch = []
+    for command in commands:
+        batch.append(command)
+        if len(batch) == batch_size:
+            framed_batch, line_number = __frame_batch(batch, line_number)
+            for framed_command in framed_batch:
+                yield framed_command
+            batch = []
+    framed_batch, line_number = __frame_batch(batch, line_number)
+    for framed_command in framed_batch:
+        yield framed_command
+
+
+def __frame_batch(batch, line_number):
+    is_serial = [len(command) > 0 and command[0:1] != "C" for command in batch]
+    frames = iter(encode_frames([command for command, serial in zip(batch, is_serial) if serial], line_number))
+    framed_batch = []
+    for command, serial in zip(batch, is_serial):
+        if serial:
+            framed_batch.append((command, line_number, next(frames)))
+            if line_number is not None:
+                line_number += 1
+        else:
+            framed_batch.append((command, None, None))
+    return framed_batch, line_number
+
+
+# G-code written after the header of the job: absolute coordinates and homing routine. The text and the binary jobs
+# send the same PREAMBLE_COMMANDS
+def preamble_gcode():
+    lines = [PREAMBLE_COMMANDS[0] + "; Setting Absolute Coordinates\n", "\n", ";Homing Routine\n"]
+    lines += [command + "\n" for command in PREAMBLE_COMMANDS[1:]]
+    lines += ["\n", ";Movement Start\n"]
+    return "".join(lines)
+
+
+# recoating routine of a layer, then the build plate is lowered by the layer thickness
+def recoating_commands(layer_thickness, number_of_decimals):
+    return list(RECOATING_COMMANDS) + ["C1 R" + ("%%.%if" % number_of_decimals) % layer_thickness, "C3"]
+
+
+# ";Slice" marker and recoating routine that open the G-code of a layer
+def recoating_gcode(slice_idx, layer_thickness, number_of_decimals):
+    lines = [";Slice %i \n" % slice_idx, ";Recoating routine \n"]
+    lines += [command + "\n" for command in recoating_commands(layer_thickness, number_of_decimals)]
+    return "".join(lines)
+
+
+# reorders the segments of each (N, 2) points block of a layer to shorten the jumps of the galvo, every block starting
+# from the end of the previous one. The blocks flagged in keep_order (e.g. island and stripes infill, whose tile order and
+# scan directions are part of the strategy) are scanned as they are. jump_lengths accumulates the jump length of the
+# layer before and after the ordering
+def order_layer_blocks(blocks_points, optimize_scan_path=True, two_opt=True, jump_lengths=None, keep_order=None):
+    galvo_position = None
+    ordered_blocks = []
+    for block_idx, points in enumerate(blocks_points):
+        segments = np.asarray(points, dtype=np.float64).reshape(-1, 2, 2)
+        if jump_lengths is not None:
+            jump_lengths[0] += scan_path_helpers.jump_length(segments, galvo_position)
+        if optimize_scan_path and not (keep_order is not None and keep_order[block_idx]):
+            segments = scan_path_helpers.order_segments(segments, galvo_position, two_opt=two_opt)
+        if jump_lengths is not None:
+            jump_lengths[1] += scan_path_helpers.jump_length(segments, galvo_position)
+        if len(segments) > 0:
+            galvo_position = segments[-1, 1]
+        ordered_blocks.append(segments.reshape(-1, 2))
+    return ordered_blocks
+
+
+# G-code of a layer. task is (slice index, layer thickness, blocks, number of decimals, optimize scan path, 2-opt),
+# blocks is a list of (G-code header of the block, duty cycle, (N, 2) points, simplify tolerance, arc tolerance, keep
+# order), see format_polylines for the tolerances and order_layer_blocks for keep order. Returns the G-code and the jump
+# length of the layer before and after the ordering. The layer only depends on its task, so layers can be formatted in
+# any order and in other processes
+def layer_gcode(task):
+    slice_idx, layer_thickness, blocks, number_of_decimals, optimize_scan_path, two_opt = task
+    jump_lengths = [0.0, 0.0]
+    ordered_blocks = order_layer_blocks([block[2] for block in blocks], optimize_scan_path, two_opt, jump_lengths,
+                                        [block[5] for block in blocks])
+    lines = [recoating_gcode(slice_idx, layer_thickness, number_of_decimals)]
+    for (block_header, duty_cycle, _, simplify_tolerance, arc_tolerance, _), points in zip(blocks, ordered_blocks):
+        lines.append(block_header)
+        lines.append(format_polylines(points, number_of_decimals, duty_cycle, simplify_tolerance, arc_tolerance))
+    return "".join(lines), jump_lengths
+
+
+def encoded_layer_gcode(task):
+    gcode, jump_lengths = layer_gcode(task)
+    return gcode.encode('utf-8'), jump_lengths
+
+
+# formats the layer tasks in a pool of processes and passes the G-code bytes of each layer to write in layer order.
+# At most max_pending layers are submitted ahead of the next one to write, which bounds the memory held by the tasks
+# and by the formatted layers waiting for the previous ones. Returns the jump lengths of each layer
+def write_layers_parallel(tasks, write, processes=None, max_pending=None):
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 4 * processes
+    jump_lengths = []
+    pending = deque()
+    with Pool(processes) as pool:
+        for task in tasks:
+            if len(pending) >= max_pending:
+                gcode, layer_jump_lengths = pending.popleft().get()
+                write(gcode)
+                jump_lengths.append(tuple(layer_jump_lengths))
+            pending.append(pool.apply_async(encoded_layer_gcode, (task,)))
+        while len(pending) > 0:
+            gcode, layer_jump_lengths = pending.popleft().get()
+            write(gcode)
+            jump_lengths.append(tuple(layer_jump_lengths))
+    return jump_lengths
+
+
+# Binary job file, little endian:
+#   magic, version (uint16), number of decimals (uint8), header length (uint32), header (utf-8 json)
+#   layers: slice index (uint32), layer thickness (float64), number of blocks (uint16), then for each block
+#           geometry index (uint16), block type (uint8), number of points (uint32), points as int32 (x, y) pairs
+#           in fixed point with number of decimals digits
+#   index: for each layer its offset in the file (uint64) and its number of serial commands (uint32)
+#   footer: index offset (uint64), number of layers (uint32), magic
+# The header holds the laser parameters of each geometry, the layers can be written while they are produced and the
+# index at the end allows to seek any layer without reading the others.
+class BinaryJobWriter():
+
+    def __init__(self, file_name, header, number_of_decimals=4):
+        self.number_of_decimals = number_of_decimals
+        self.__header = header
+        self.__scale = 10 ** number_of_decimals
+        self.__file = open(file_name, 'wb')
+        self.__index = []
+        header_data = json.dumps(header).encode('utf-8')
+        self.__file.write(BINARY_JOB_MAGIC + struct.pack('<HBI', BINARY_JOB_VERSION, number_of_decimals, len(header_data)))
+        self.__file.write(header_data)
+
+    # blocks is a list of (geometry index, block type, (N, 2) segment end points)
+    def write_layer(self, slice_idx, layer_thickness, blocks):
+        number_of_commands = len(recoating_commands(layer_thickness, 0))
+        chunks = [struct.pack('<IdH', slice_idx, layer_thickness, len(blocks))]
+        for geometry_idx, block_type, points in blocks:
+            points = np.round(np.asarray(points, dtype=np.float64).reshape(-1, 2) * self.__scale).astype('<i4')
+            chunks.append(struct.pack('<HBI', geometry_idx, block_type, len(points)))
+            chunks.append(points.tobytes())
+            number_of_commands += 1 + len(points) // 2 + int(np.count_nonzero(jump_mask(points.reshape(-1, 2, 2))))
+        self.__index.append((self.__file.tell(), number_of_commands))
+        self.__file.write(b''.join(chunks))
+
+    def close(self):
+        index_offset = self.__file.tell()
+        self.__file.write(np.array(self.__index, dtype=[('offset', '<u8'), ('commands', '<u4')]).tobytes())
+        self.__file.write(struct.pack('<QI', index_offset, len(self.__index)) + BINARY_JOB_MAGIC)
+        self.__file.close()
+
+
+class BinaryJobReader():
+
+    def __init__(self, file_name):
+        # the layers are read with a seek and a read, a reader can be shared by the threads of several senders
+        self.__file_lock = threading.Lock()
+        self.file_name = file_name
+        self.__file = open(file_name, 'rb')
+        magic = self.__file.read(4)
+        version, self.number_of_decimals, header_length = struct.unpack('<HBI', self.__file.read(7))
+        if magic != BINARY_JOB_MAGIC or version != BINARY_JOB_VERSION:
+            self.__file.close()
+            raise ValueError("Not a binary job file: %s" % file_name)
+        self.header = json.loads(self.__file.read(header_length).decode('utf-8'))
+        self.__file.seek(-16, 2)
+        index_offset, number_of_layers, magic = struct.unpack('<QI4s', self.__file.read(16))
+        if magic != BINARY_JOB_MAGIC:
+            self.__file.close()
+            raise ValueError("Incomplete binary job file: %s" % file_name)
+        self.__file.seek(index_offset)
+        self.__index = np.frombuffer(self.__file.read(number_of_layers * 12), dtype=[('offset', '<u8'), ('commands', '<u4')])
+
+    def number_of_layers(self):
+        return len(self.__index)
+
+    def number_of_commands(self, first_layer=0):
+        number_of_commands = len(PREAMBLE_COMMANDS) + int(self.__index['commands'][first_layer:].sum())
+        if 0 < first_layer < self.number_of_layers():
+            number_of_commands += len(resume_commands(*self.layer_state(first_layer)))
+        return number_of_commands
+
+    def layer_command_counts(self):
+        return self.__index['commands']
+
+    # build plate position and laser parameters in effect before the commands of the layer. The plate is moved
+    # down by the thickness of every layer after the homing of the preamble
+    def layer_state(self, layer_idx):
+        build_plate_position = 0.0
+        laser_command = None
+        for previous_layer_idx in range(layer_idx):
+            slice_idx, layer_thickness, block_types = self.__read_layer_header(previous_layer_idx)
+            build_plate_position += round(layer_thickness, self.number_of_decimals)
+            if len(block_types) > 0:
+                laser_command = self.__laser_command(*block_types[-1])
+        return build_plate_position, laser_command
+
+    # the points of the blocks are skipped
+    def __read_layer_header(self, layer_idx):
+        block_types = []
+        with self.__file_lock:
+            self.__file.seek(int(self.__index['offset'][layer_idx]))
+            slice_idx, layer_thickness, number_of_blocks = struct.unpack('<IdH', self.__file.read(14))
+            for _ in range(number_of_blocks):
+                geometry_idx, block_type, number_of_points = struct.unpack('<HBI', self.__file.read(7))
+                self.__file.seek(number_of_points * 8, 1)
+                block_types.append((geometry_idx, block_type))
+        return slice_idx, layer_thickness, block_types
+
+    def __laser_command(self, geometry_idx, block_type):
+        decimals = "%%.%if" % self.number_of_decimals
+        parameters = self.header['geometries'][str(geometry_idx)]['parameters']
+        prefix = 'contour_' if block_type == CONTOUR_BLOCK else 'infill_'
+        return "G1 F" + decimals % parameters[prefix + 'scan_speed'] + " H%i P%i" % (parameters[prefix + 'frequency'], parameters[prefix + 'laser_power'])
+
+    # slice index, layer thickness and blocks of the layer, the points are decoded to mm
+    def read_layer(self, layer_idx):
+        blocks = []
+        with self.__file_lock:
+            self.__file.seek(int(self.__index['offset'][layer_idx]))
+            slice_idx, layer_thickness, number_of_blocks = struct.unpack('<IdH', self.__file.read(14))
+            for _ in range(number_of_blocks):
+                geometry_idx, block_type, number_of_points = struct.unpack('<HBI', self.__file.read(7))
+                points = np.frombuffer(self.__file.read(number_of_points * 8), dtype='<i4').reshape(-1, 2)
+                blocks.append((geometry_idx, block_type, points / 10 ** self.number_of_decimals))
+        return slice_idx, layer_thickness, blocks
+
+    # serial commands of the layer, the same of the text G-code without comments
+    def layer_commands(self, layer_idx):
+        slice_idx, layer_thickness, blocks = self.read_layer(layer_idx)
+        commands = recoating_commands(layer_thickness, self.number_of_decimals)
+        for geometry_idx, block_type, points in blocks:
+            parameters = self.header['geometries'][str(geometry_idx)]['parameters']
+            prefix = 'contour_' if block_type == CONTOUR_BLOCK else 'infill_'
+            commands.append(self.__laser_command(geometry_idx, block_type))
+            commands += format_segments(points, self.number_of_decimals, parameters[prefix + 'duty_cycle']).splitlines()
+        return commands
+
+    # all the serial commands of the job from first_layer on, read one layer at a time. When the job is resumed the
+    # machine state of first_layer is restored after the preamble
+    def commands(self, first_layer=0):
+        for command in PREAMBLE_COMMANDS:
+            yield command
+        if 0 < first_layer < self.number_of_layers():
+            for command in resume_commands(*self.layer_state(first_layer)):
+                yield command
+        for layer_idx in range(first_layer, self.number_of_layers()):
+            for command in self.layer_commands(layer_idx):
+                yield command
+
+    def close(self):
+        self.__file.close()
+
+
+# binary job reader for the '.mjob' files, text job reader for the others
+def open_job_file(file_name):
+    if file_name.endswith('.mjob'):
+        return BinaryJobReader(file_name)
+    return TextJobReader(file_name)
+
+
+# text G-code job read from a memory map. The file is scanned once for the ";Slice N" markers and the number of
+# command lines of each layer, the commands are read and stripped of the comments by a producer thread while streaming
+class TextJobReader():
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.__file = open(file_name, 'rb')
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            self.__file.close()
+            raise
+        self.__size = len(self.__map)
+        self.__preamble_commands, self.__index, self.__layer_states = self.__scan()
+
+    # a line is a command if it does not start with ';' and it is not empty, the same rule of __produce_commands.
+    # The motor commands and the laser parameters "G1 F H P" are kept to restore the machine state of each layer
+    def __scan(self):
+        data = np.frombuffer(self.__map, dtype=np.uint8)
+        slices, offsets, counts = [], [], np.zeros(1, dtype=np.int64)
+        state_lines = []
+        for first_byte in range(0, self.__size, TEXT_JOB_SCAN_CHUNK_SIZE):
+            line_starts = np.flatnonzero(data[first_byte:first_byte + TEXT_JOB_SCAN_CHUNK_SIZE] == 10) + first_byte + 1
+            if first_byte == 0:
+                line_starts = np.concatenate(([0], line_starts))
+            line_starts = line_starts[line_starts < self.__size]
+            first_chars = data[line_starts]
+            for line_start in line_starts[first_chars == 59]:
+                if self.__map[line_start:line_start + 7] == b';Slice ':
+                    line_end = self.__map.find(b'\n', line_start)
+                    slices.append(int(self.__map[line_start:line_end if line_end >= 0 else self.__size].split()[1]))
+                    offsets.append(line_start)
+            command_starts = line_starts[(first_chars != 59) & (first_chars != 10) & (first_chars != 13)]
+            first_chars = data[command_starts]
+            g_starts = command_starts[(first_chars == 71) & (command_starts + 3 < self.__size)]
+            g_starts = g_starts[(data[g_starts + 1] == 49) & (data[g_starts + 2] == 32) & (data[g_starts + 3] == 70)]
+            for line_start in np.sort(np.concatenate((command_starts[first_chars == 67], g_starts))):
+                line_end = self.__map.find(b'\n', line_start)
+                line = self.__map[line_start:line_end if line_end >= 0 else self.__size]
+                state_lines.append((line_start, line.split(b';', 1)[0].strip().decode('utf-8', 'replace')))
+            # 0 are the commands before the first layer, i the commands of layer i - 1
+            layers = np.searchsorted(np.asarray(offsets, dtype=np.int64), command_starts, side='right')
+            counts = np.pad(counts, (0, len(offsets) + 1 - len(counts)))
+            counts += np.bincount(layers, minlength=len(counts))
+        del data
+        index = np.zeros(len(offsets), dtype=[('slice', '<u4'), ('offset', '<u8'), ('commands', '<u4')])
+        index['slice'] = slices
+        index['offset'] = offsets
+        index['commands'] = counts[1:]
+        return int(counts[0]), index, self.__get_layer_states(offsets, state_lines)
+
+    # build plate position and laser parameters at the start of each layer, C0 homes the plate to 0
+    @staticmethod
+    def __get_layer_states(offsets, state_lines):
+        layer_states = []
+        build_plate_position = 0.0
+        laser_command = None
+        line_idx = 0
+        for offset in offsets:
+            while line_idx < len(state_lines) and state_lines[line_idx][0] < offset:
+                command = state_lines[line_idx][1]
+                motor_command = command.replace(" ", "")
+                if motor_command[0:2] == "C0":
+                    build_plate_position = 0.0
+                elif motor_command[0:2] == "C1":
+                    try:
+                        if motor_command[2] == "A":
+                            build_plate_position = float(motor_command[3:])
+                        elif motor_command[2] == "R":
+                            build_plate_position += float(motor_command[3:])
+                    except:
+                        pass
+                elif command[0:1] == "G":
+                    laser_command = command
+                line_idx += 1
+            layer_states.append((build_plate_position, laser_command))
+        return layer_states
+
+    def number_of_layers(self):
+        return len(self.__index)
+
+    def number_of_commands(self, first_layer=0):
+        number_of_commands = self.__preamble_commands + int(self.__index['commands'][first_layer:].sum())
+        if 0 < first_layer < self.number_of_layers():
+            number_of_commands += len(resume_commands(*self.layer_state(first_layer)))
+        return number_of_commands
+
+    def layer_command_counts(self):
+        return self.__index['commands']
+
+    def slice_numbers(self):
+        return self.__index['slice']
+
+    # offset in the file of the ";Slice N" line of each layer
+    def layer_offsets(self):
+        return self.__index['offset']
+
+    def layer_state(self, layer_idx):
+        return self.__layer_states[layer_idx]
+
+    # the commands before the first layer and all the commands from first_layer on. When the job is resumed the
+    # machine state of first_layer is restored after the preamble
+    def commands(self, first_layer=0):
+        preamble_end = int(self.__index['offset'][0]) if len(self.__index) > 0 else self.__size
+        ranges = [(0, preamble_end, [])]
+        if first_layer < len(self.__index):
+            restored_commands = resume_commands(*self.layer_state(first_layer)) if first_layer > 0 else []
+            ranges.append((int(self.__index['offset'][first_layer]), self.__size, restored_commands))
+        batches = queue.Queue(maxsize=TEXT_JOB_QUEUED_BATCHES)
+        stop_event = threading.Event()
+        producer = threading.Thread(target=self.__produce_commands, args=(ranges, batches, stop_event), daemon=True)
+        producer.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                for command in batch:
+                    yield command
+        finally:
+            stop_event.set()
+            producer.join()
+
+    def __produce_commands(self, ranges, batches, stop_event):
+        batch = []
+        try:
+            for first_byte, last_byte, leading_commands in ranges:
+                batch += leading_commands
+                line_start = first_byte
+                while line_start < last_byte and not stop_event.is_set():
+                    line_end = self.__map.find(b'\n', line_start, last_byte)
+                    if line_end < 0:
+                        line_end = last_byte
+                    line = self.__map[line_start:line_end]
+                    line_start = line_end + 1
+                    if len(line) == 0 or line[0] == 59 or line[0] == 13:
+                        continue
+                    batch.append(line.split(b';', 1)[0].strip().decode('utf-8', 'replace'))
+                    if len(batch) >= TEXT_JOB_BATCH_SIZE:
+                        self.__put_batch(batch, batches, stop_event)
+                        batch = []
+            if len(batch) > 0:
+                self.__put_batch(batch, batches, stop_event)
+        finally:
+            self.__put_batch(None, batches, stop_event)
+
+    @staticmethod
+    def __put_batch(batch, batches, stop_event):
+        while not stop_event.is_set():
+            try:
+                batches.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        self.__map.close()
+        self.__file.close()
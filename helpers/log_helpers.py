@@ -0,0 +1,58 @@
+import logging
+import logging.handlers
+import threading
+from collections import deque
+
+# verbosity of the console messages, every message is written to the file log
+LOG_STATUS = 0
+LOG_LINES = 1
+
+
+# rotating file log shared by all the loggers with the same name
+def get_rotating_file_logger(name, file_name, max_bytes=10 * 1024 * 1024, backup_count=5):
+    logger = logging.getLogger(name)
+    if len(logger.handlers) == 0:
+        try:
+            handler = logging.handlers.RotatingFileHandler(file_name, maxBytes=max_bytes, backupCount=backup_count)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            logger.addHandler(handler)
+        except Exception as e:
+            print(e)
+            logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+    return logger
+
+
+# console messages written by any thread and taken as a single block by the thread that shows them. When more
+# messages than the capacity are written between two blocks, the oldest ones are dropped and counted
+class ConsoleLogBuffer():
+
+    def __init__(self, capacity=500, verbosity=LOG_LINES, logger=None):
+        self.__lines = deque(maxlen=capacity)
+        self.__dropped_lines = 0
+        self.__lock = threading.Lock()
+        self.__logger = logger
+        self.verbosity = verbosity
+
+    def append(self, text, level=LOG_STATUS):
+        if self.__logger is not None:
+            self.__logger.info(text)
+        if level > self.verbosity:
+            return
+        with self.__lock:
+            if len(self.__lines) == self.__lines.maxlen:
+                self.__dropped_lines += 1
+            self.__lines.append(text)
+
+    # the messages since the last block, None when there are none
+    def take_block(self):
+        with self.__lock:
+            if len(self.__lines) == 0:
+                return None
+            lines = list(self.__lines)
+            if self.__dropped_lines > 0:
+                lines.insert(0, "... %i lines not shown, see the log file" % self.__dropped_lines)
+            self.__lines.clear()
+            self.__dropped_lines = 0
+        return '\n'.join(lines)
@@ -0,0 +1,107 @@
+import numpy as np
+from scipy.spatial import ConvexHull
+
+
+# convex hull of the vertices projected on the building plate (x, z plane)
+def compute_footprint(vertices, transformation_matrix=np.identity(3)):
+    points = np.asarray(vertices, dtype=np.float64).reshape(-1, 3).dot(np.asarray(transformation_matrix)[:3, :3].transpose())
+    points = np.unique(points[:, [0, 2]], axis=0)
+    if points.shape[0] < 3:
+        return __bounding_rectangle(points)
+    # degenerate (collinear) footprints make Qhull fail with a QhullError, which is a RuntimeError
+    try:
+        hull = ConvexHull(points)
+    except (RuntimeError, ValueError):
+        return __bounding_rectangle(points)
+    return points[hull.vertices]
+
+
+def footprint_area(footprint):
+    x = footprint[:, 0]
+    z = footprint[:, 1]
+    return 0.5 * np.abs(np.dot(x, np.roll(z, -1)) - np.dot(z, np.roll(x, -1)))
+
+
+# same convention as QMatrix4x4.rotate(angle, 0.0, 1.0, 0.0) applied to the (x, z) coordinates
+def rotate_footprint(footprint, angle):
+    theta = np.radians(angle)
+    cos_theta = np.cos(theta)
+    sin_theta = np.sin(theta)
+    rotation = np.array([[cos_theta, sin_theta], [-sin_theta, cos_theta]])
+    return footprint.dot(rotation.transpose())
+
+
+def __bounding_rectangle(points):
+    if points.shape[0] == 0:
+        return np.zeros((1, 2))
+    p_min = points.min(axis=0)
+    p_max = points.max(axis=0)
+    return np.array([[p_min[0], p_min[1]], [p_max[0], p_min[1]], [p_max[0], p_max[1]], [p_min[0], p_max[1]]])
+
+
+# skyline bottom-left packing of the footprints inside a width x height rectangle with origin in (0, 0).
+# Each footprint is tested with all its rotation candidates (one list of angles per footprint, no rotation if None)
+# and the placement with the lowest top edge is kept. Returns one entry per footprint, either None (does not fit) or (angle, x_offset, z_offset) where the offsets
+# are the translation to apply to the rotated footprint.
+def pack_footprints(footprints, width, height, spacing=0.0, rotation_angles=None):
+    placements = [None] * len(footprints)
+    if rotation_angles is None:
+        rotation_angles = [[0]] * len(footprints)
+    skyline = [[0.0, 0.0, width]]
+    areas = [footprint_area(footprint) for footprint in footprints]
+    for footprint_idx in np.argsort(areas)[::-1]:
+        best = None
+        for angle in rotation_angles[footprint_idx]:
+            rotated = rotate_footprint(footprints[footprint_idx], angle)
+            rotated_min = rotated.min(axis=0)
+            rect_width, rect_height = rotated.max(axis=0) - rotated_min + spacing
+            for segment_idx in range(len(skyline)):
+                x, y = __skyline_fit(skyline, segment_idx, rect_width, width)
+                if y is None or y + rect_height > height:
+                    continue
+                if best is None or (y + rect_height, y, x) < (best[0] + best[1], best[0], best[2]):
+                    best = (y, rect_height, x, rect_width, angle, rotated_min)
+        if best is None:
+            continue
+        y, rect_height, x, rect_width, angle, rotated_min = best
+        __skyline_add(skyline, x, y + rect_height, rect_width)
+        placements[footprint_idx] = (angle, x + 0.5 * spacing - rotated_min[0], y + 0.5 * spacing - rotated_min[1])
+    return placements
+
+
+def __skyline_fit(skyline, segment_idx, rect_width, width):
+    x = skyline[segment_idx][0]
+    if x + rect_width > width + 1e-9:
+        return x, None
+    y = 0.0
+    remaining_width = rect_width
+    idx = segment_idx
+    while remaining_width > 1e-9:
+        if idx >= len(skyline):
+            return x, None
+        y = max(y, skyline[idx][1])
+        remaining_width -= skyline[idx][2]
+        idx += 1
+    return x, y
+
+
+def __skyline_add(skyline, x, y, rect_width):
+    new_skyline = []
+    x_end = x + rect_width
+    for segment_x, segment_y, segment_width in skyline:
+        segment_end = segment_x + segment_width
+        if segment_end <= x or segment_x >= x_end:
+            new_skyline.append([segment_x, segment_y, segment_width])
+            continue
+        if segment_x < x:
+            new_skyline.append([segment_x, segment_y, x - segment_x])
+        if segment_end > x_end:
+            new_skyline.append([x_end, segment_y, segment_end - x_end])
+    new_skyline.append([x, y, rect_width])
+    new_skyline.sort(key=lambda segment: segment[0])
+    skyline[:] = []
+    for segment in new_skyline:
+        if skyline and np.abs(skyline[-1][1] - segment[1]) < 1e-9:
+            skyline[-1][2] += segment[2]
+        else:
+            skyline.append(segment)
@@ -0,0 +1,641 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+# segments is a (N, 2, 2) array of (x, z) segments coming from the contour assembly. Segments sharing an
+# endpoint (up to tolerance) are chained into closed loops, returned as a list of (M, 2) arrays without repeating the first point.
+# Directed segments are only chained from the end of a segment to the start of the next one.
+def assemble_loops(segments, tolerance=1e-5, directed=False):
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+    if segments.shape[0] == 0:
+        return []
+    point_ids = __cluster_points(segments.reshape(-1, 2), tolerance).reshape(-1, 2)
+    valid = point_ids[:, 0] != point_ids[:, 1]
+    segments = segments[valid]
+    point_ids = point_ids[valid]
+    neighbours = {}
+    for segment_idx, (id_0, id_1) in enumerate(point_ids):
+        neighbours.setdefault(id_0, []).append(segment_idx)
+        if not directed:
+            neighbours.setdefault(id_1, []).append(segment_idx)
+    used = np.zeros(len(point_ids), dtype=bool)
+    loops = []
+    for first_segment in range(len(point_ids)):
+        if used[first_segment]:
+            continue
+        used[first_segment] = True
+        loop = [segments[first_segment, 0]]
+        start_id, current_id = point_ids[first_segment]
+        current_point = segments[first_segment, 1]
+        while current_id != start_id:
+            next_segment = None
+            for segment_idx in neighbours.get(current_id, []):
+                if not used[segment_idx]:
+                    next_segment = segment_idx
+                    break
+            if next_segment is None:
+                break
+            used[next_segment] = True
+            loop.append(current_point)
+            if point_ids[next_segment, 0] == current_id:
+                current_id = point_ids[next_segment, 1]
+                current_point = segments[next_segment, 1]
+            else:
+                current_id = point_ids[next_segment, 0]
+                current_point = segments[next_segment, 0]
+        if len(loop) > 2:
+            loops.append(np.array(loop))
+    return loops
+
+
+# ids of the clusters of points closer than tolerance
+def __cluster_points(points, tolerance):
+    pairs = cKDTree(points).query_pairs(tolerance, output_type='ndarray')
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(len(points), len(points)))
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+# edge table of the loops as a (N, 2, 2) array, each loop being implicitly closed
+def loops_to_edges(loops):
+    if len(loops) == 0:
+        return np.zeros((0, 2, 2))
+    starts = np.vstack(loops)
+    ends = np.vstack([np.roll(loop, -1, axis=0) for loop in loops])
+    return np.stack((starts, ends), axis=1)
+
+
+# signed area of each loop, positive for counter-clockwise loops in the (x, z) plane
+def loops_signed_area(loops):
+    return np.array([0.5 * (np.dot(loop[:, 0], np.roll(loop[:, 1], -1)) - np.dot(loop[:, 1], np.roll(loop[:, 0], -1)))
+                     for loop in loops])
+
+
+# Even-odd scan line fill of the region bounded by edges ((N, 2, 2) array of (x, z) segments).
+# The scan lines follow the same layout of the ray casting infill: number_of_lines lines spanning the diagonal of the bounding box,
+# expressed in a frame rotated by angle (same convention as QMatrix4x4.rotate(angle, 0.0, 1.0, 0.0)) and centered in center.
+# Every line runs along the rotated z direction. Returns the (K, 2, 2) filled segments sorted by line and by distance along the line,
+# together with the index of the line of each segment.
+def scanline_fill(edges, center, diagonal, number_of_lines, angle):
+    edges = np.asarray(edges, dtype=np.float64).reshape(-1, 2, 2)
+    if edges.shape[0] == 0 or number_of_lines <= 0:
+        return np.zeros((0, 2, 2)), np.zeros(0, dtype=np.int64)
+    theta = np.radians(angle)
+    cos_theta = np.cos(theta)
+    sin_theta = np.sin(theta)
+    relative = edges - np.asarray(center, dtype=np.float64)
+    u = cos_theta * relative[:, :, 0] - sin_theta * relative[:, :, 1]
+    v = sin_theta * relative[:, :, 0] + cos_theta * relative[:, :, 1]
+    lines_offset = diagonal / number_of_lines
+    lines_origin = - diagonal * 0.5 + lines_offset * 0.5
+    u_min = np.minimum(u[:, 0], u[:, 1])
+    u_max = np.maximum(u[:, 0], u[:, 1])
+    # half-open rule [u_min, u_max) so that a vertex shared by two edges is counted once
+    first_line = np.maximum(np.ceil((u_min - lines_origin) / lines_offset), 0).astype(np.int64)
+    last_line = np.minimum(np.ceil((u_max - lines_origin) / lines_offset) - 1, number_of_lines - 1).astype(np.int64)
+    lines_per_edge = np.maximum(last_line - first_line + 1, 0)
+    total_crossings = lines_per_edge.sum()
+    if total_crossings == 0:
+        return np.zeros((0, 2, 2)), np.zeros(0, dtype=np.int64)
+    edge_idxs = np.repeat(np.arange(edges.shape[0]), lines_per_edge)
+    crossing_lines = first_line[edge_idxs] + np.arange(total_crossings) - np.repeat(np.cumsum(lines_per_edge) - lines_per_edge, lines_per_edge)
+    crossing_u = lines_origin + crossing_lines * lines_offset
+    u_0 = u[edge_idxs, 0]
+    v_0 = v[edge_idxs, 0]
+    crossing_v = v_0 + (crossing_u - u_0) * (v[edge_idxs, 1] - v_0) / (u[edge_idxs, 1] - u_0)
+    order = np.lexsort((crossing_v, crossing_lines))
+    crossing_lines = crossing_lines[order]
+    crossing_u = crossing_u[order]
+    crossing_v = crossing_v[order]
+    # pair consecutive crossings of the same line, an unmatched last crossing (open contour) is discarded
+    line_start = np.searchsorted(crossing_lines, crossing_lines, side='left')
+    line_end = np.searchsorted(crossing_lines, crossing_lines, side='right')
+    rank = np.arange(total_crossings) - line_start
+    starts = np.nonzero((rank % 2 == 0) & (np.arange(total_crossings) + 1 < line_end))[0]
+    ends = starts + 1
+    segments_u = np.stack((crossing_u[starts], crossing_u[ends]), axis=1)
+    segments_v = np.stack((crossing_v[starts], crossing_v[ends]), axis=1)
+    segments = np.empty((len(starts), 2, 2))
+    segments[:, :, 0] = cos_theta * segments_u + sin_theta * segments_v + center[0]
+    segments[:, :, 1] = - sin_theta * segments_u + cos_theta * segments_v + center[1]
+    return segments, crossing_lines[starts]
+
+
+# joins the filled segments of consecutive scan lines in a zigzag path, odd lines being scanned backwards
+def zigzag_path(segments, lines):
+    if segments.shape[0] == 0:
+        return np.zeros((0, 2))
+    odd_lines = lines % 2 == 1
+    line_start = np.searchsorted(lines, lines, side='left')
+    line_end = np.searchsorted(lines, lines, side='right')
+    rank = np.arange(len(lines)) - line_start
+    reversed_rank = np.where(odd_lines, line_end - 1 - rank, rank)
+    points = np.where(odd_lines[:, None, None], segments[:, ::-1], segments)
+    points_order = np.lexsort((reversed_rank, lines))
+    points = points[points_order]
+    points_lines = lines[points_order]
+    points = points.reshape(-1, 2)
+    # connection between the last point of a line and the first point of the next line, if not empty
+    last_of_line = np.nonzero(np.append(points_lines[1:] != points_lines[:-1], True))[0]
+    has_next = np.append(points_lines[last_of_line[:-1] + 1] == points_lines[last_of_line[:-1]] + 1, False)
+    last_of_line = last_of_line[has_next]
+    connections = np.stack((points[2 * last_of_line + 1], points[2 * last_of_line + 2]), axis=1)
+    insert_positions = 2 * last_of_line + 2
+    return np.insert(points, np.repeat(insert_positions, 2), connections.reshape(-1, 2), axis=0)
+
+
+# Tiled scan strategies. The region is partitioned by a lattice of square tiles ('Island', chessboard) or of stripes ('Stripes')
+# of side tile_size, expressed in the frame rotated by the hatch angle and anchored in the center, so that the same tiles are
+# used in every layer. Island tiles are hatched along the two lattice axes alternately, stripes are hatched across their width
+# with alternated scan direction. The grid only depends on the extent of the region, the tile size and the pattern: it holds,
+# for each hatch, the scan rank of the tiles it fills (-1 elsewhere, tiles in serpentine order) and the tiles it scans backwards.
+def tile_grid(diagonal, tile_size, pattern='Island'):
+    first_tile = int(np.floor(- diagonal * 0.5 / tile_size))
+    tiles_count = int(np.floor(diagonal * 0.5 / tile_size)) - first_tile + 1
+    columns, rows = np.meshgrid(np.arange(tiles_count) + first_tile, np.arange(tiles_count) + first_tile, indexing='ij')
+    serpentine = np.where(columns % 2 == 1, tiles_count - 1 - (rows - first_tile), rows - first_tile)
+    if pattern == 'Island':
+        hatches = ((0, 1), (90, 0))
+        ranks = (columns - first_tile) * tiles_count + serpentine
+        ranks = np.stack((np.where((columns + rows) % 2 == 0, ranks, -1), np.where((columns + rows) % 2 == 1, ranks, -1)))
+        backwards = np.zeros(ranks.shape, dtype=bool)
+    else:
+        hatches = ((90, 0),)
+        ranks = ((columns - first_tile) * tiles_count)[None]
+        backwards = (columns % 2 == 1)[None]
+    return hatches, first_tile, tile_size, ranks.astype(np.int32), backwards
+
+
+# hatch lines of all the tiles of the grid clipped at once, the pieces are returned sorted tile by tile with the scan rank of
+# their tile
+def tiled_fill(edges, center, diagonal, number_of_lines, angle, grid):
+    center = np.asarray(center, dtype=np.float64)
+    hatches, first_tile, tile_size, ranks, backwards = grid
+    pieces_list = []
+    ranks_list = []
+    lines_list = []
+    for hatch_idx, (hatch_angle, along) in enumerate(hatches):
+        segments, lines = scanline_fill(edges, center, diagonal, number_of_lines, angle + hatch_angle)
+        uv = __to_frame(segments, center, angle)
+        pieces, piece_idxs = __split_on_grid(uv, along, tile_size)
+        middles = 0.5 * (pieces[:, 0] + pieces[:, 1])
+        tiles = np.clip(np.floor(middles / tile_size).astype(np.int64) - first_tile, 0, ranks.shape[1] - 1)
+        piece_ranks = ranks[hatch_idx, tiles[:, 0], tiles[:, 1]]
+        is_backwards = backwards[hatch_idx, tiles[:, 0], tiles[:, 1]]
+        pieces[is_backwards] = pieces[is_backwards, ::-1]
+        in_tile = piece_ranks >= 0
+        pieces_list.append(pieces[in_tile])
+        ranks_list.append(piece_ranks[in_tile])
+        lines_list.append(lines[piece_idxs][in_tile])
+    pieces = np.concatenate(pieces_list)
+    piece_ranks = np.concatenate(ranks_list)
+    lines = np.concatenate(lines_list)
+    if len(pieces) == 0:
+        return np.zeros((0, 2, 2)), np.zeros(0, dtype=np.int32)
+    order = np.lexsort((lines, piece_ranks))
+    return __from_frame(pieces[order], center, angle), piece_ranks[order]
+
+
+def __to_frame(segments, center, angle):
+    theta = np.radians(angle)
+    relative = segments - center
+    return np.stack((np.cos(theta) * relative[..., 0] - np.sin(theta) * relative[..., 1],
+                     np.sin(theta) * relative[..., 0] + np.cos(theta) * relative[..., 1]), axis=-1)
+
+
+def __from_frame(segments, center, angle):
+    theta = np.radians(angle)
+    return np.stack((np.cos(theta) * segments[..., 0] + np.sin(theta) * segments[..., 1],
+                     - np.sin(theta) * segments[..., 0] + np.cos(theta) * segments[..., 1]), axis=-1) + center
+
+
+# splits (N, 2, 2) segments parallel to the axis along at the multiples of cell_size, returning the pieces and the index of
+# the segment they come from
+def __split_on_grid(segments, along, cell_size):
+    if len(segments) == 0:
+        return np.zeros((0, 2, 2)), np.zeros(0, dtype=np.int64)
+    start = segments[:, 0, along]
+    end = segments[:, 1, along]
+    low = np.minimum(start, end)
+    high = np.maximum(start, end)
+    first_cut = np.floor(low / cell_size).astype(np.int64) + 1
+    last_cut = np.ceil(high / cell_size).astype(np.int64) - 1
+    pieces_count = np.maximum(last_cut - first_cut + 1, 0) + 1
+    segment_idxs = np.repeat(np.arange(len(segments)), pieces_count)
+    piece_ids = np.arange(len(segment_idxs)) - np.repeat(np.cumsum(pieces_count) - pieces_count, pieces_count)
+    cuts = (first_cut[segment_idxs] + piece_ids) * cell_size
+    piece_low = np.where(piece_ids == 0, low[segment_idxs], cuts - cell_size)
+    piece_high = np.where(piece_ids == pieces_count[segment_idxs] - 1, high[segment_idxs], cuts)
+    # the pieces keep the direction of their segment
+    forward = (end >= start)[segment_idxs]
+    pieces = segments[segment_idxs].copy()
+    pieces[:, 0, along] = np.where(forward, piece_low, piece_high)
+    pieces[:, 1, along] = np.where(forward, piece_high, piece_low)
+    backward_order = np.lexsort((np.where(forward, piece_ids, - piece_ids), segment_idxs))
+    return pieces[backward_order], segment_idxs[backward_order]
+
+
+# nesting depth of each loop: number of the other loops containing its first vertex, with an even-odd test. Only the loops
+# whose bounding box contains the vertex are tested
+def loops_depth(loops):
+    if len(loops) == 0:
+        return np.zeros(0, dtype=np.int64)
+    edges = loops_to_edges(loops)
+    loops_length = np.array([len(loop) for loop in loops])
+    loops_start = np.cumsum(loops_length) - loops_length
+    points = np.array([loop[0] for loop in loops])
+    bbox_min = np.array([np.min(loop, axis=0) for loop in loops])
+    bbox_max = np.array([np.max(loop, axis=0) for loop in loops])
+    point_idxs, loop_idxs = __overlapping_ranges(points[:, 1], points[:, 1], bbox_min[:, 1], bbox_max[:, 1])
+    candidates = (point_idxs != loop_idxs) & (points[point_idxs, 0] >= bbox_min[loop_idxs, 0]) & (points[point_idxs, 0] <= bbox_max[loop_idxs, 0])
+    point_idxs = point_idxs[candidates]
+    loop_idxs = loop_idxs[candidates]
+    edges_count = loops_length[loop_idxs]
+    pair_points = np.repeat(point_idxs, edges_count)
+    pair_edges = np.repeat(loops_start[loop_idxs], edges_count) + np.arange(len(pair_points)) - \
+        np.repeat(np.cumsum(edges_count) - edges_count, edges_count)
+    x_0 = edges[pair_edges, 0, 0]
+    z_0 = edges[pair_edges, 0, 1]
+    x_1 = edges[pair_edges, 1, 0]
+    z_1 = edges[pair_edges, 1, 1]
+    point_x = points[pair_points, 0]
+    point_z = points[pair_points, 1]
+    straddles = (z_0 > point_z) != (z_1 > point_z)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_x = x_0 + (point_z - z_0) * (x_1 - x_0) / (z_1 - z_0)
+    crossings = straddles & (crossing_x > point_x)
+    pair_ids = np.repeat(np.arange(len(point_idxs)), edges_count)
+    is_inside = np.bincount(pair_ids, weights=crossings, minlength=len(point_idxs)).astype(np.int64) % 2 == 1
+    return np.bincount(point_idxs, weights=is_inside, minlength=len(loops)).astype(np.int64)
+
+
+# outer boundaries are made counter-clockwise and holes clockwise, so that the material is always on the left of the edges
+def orient_loops(loops):
+    depths = loops_depth(loops)
+    areas = loops_signed_area(loops)
+    return [loop[::-1] if (area > 0) == (depth % 2 == 1) else loop for loop, area, depth in zip(loops, areas, depths)]
+
+
+# Offsets the loops towards the material by distance (negative values grow the region), all the loops of a layer at once.
+# Every edge is moved along its normal. The gaps on reflex corners are filled with a miter, a bevel when the miter is longer
+# than miter_limit * distance or a round join of tolerance arc_tolerance. The resulting raw curves can self-intersect where
+# the region gets thinner than 2 * distance: the cleanup keeps only the boundary of the region with positive winding number.
+# The cleanup can still leave loops made of inverted pieces (e.g. a hole that collapsed while growing the region), which are
+# recognized because their vertices are closer than distance to the input boundary and dropped.
+def offset_loops(loops, distance, join_style='miter', miter_limit=2.0, arc_tolerance=0.005):
+    loops = [np.asarray(loop, dtype=np.float64) for loop in orient_loops(loops)]
+    if len(loops) == 0 or distance == 0:
+        return loops
+    points = np.vstack(loops)
+    loops_length = np.array([len(loop) for loop in loops])
+    loop_ids = np.repeat(np.arange(len(loops)), loops_length)
+    loops_start = np.repeat(np.cumsum(loops_length) - loops_length, loops_length)
+    next_point = loops_start + (np.arange(len(points)) - loops_start + 1) % np.repeat(loops_length, loops_length)
+    directions = points[next_point] - points
+    lengths = np.linalg.norm(directions, axis=1)
+    valid = lengths > 1e-12
+    line_starts = np.nonzero(valid)[0]
+    line_ends = next_point[valid]
+    line_loops = loop_ids[valid]
+    line_lengths = lengths[valid]
+    line_directions = directions[valid] / line_lengths[:, None]
+    line_normals = np.stack((- line_directions[:, 1], line_directions[:, 0]), axis=1)
+    line_points = points[line_starts] + distance * line_normals
+    next_line = __next_in_group(line_loops)
+    previous_line = np.empty_like(next_line)
+    previous_line[next_line] = np.arange(len(next_line))
+    cos_angle = np.clip(np.einsum('ij,ij->i', line_directions, line_directions[next_line]), -1.0, 1.0)
+    cross = line_directions[:, 0] * line_directions[next_line, 1] - line_directions[:, 1] * line_directions[next_line, 0]
+    # reflex corners open a gap between the offset edges that is closed with a join
+    is_join = cross * distance < 0
+    if join_style == 'round':
+        is_join &= cos_angle < 1.0 - 1e-9
+    else:
+        is_join &= 1.0 / np.sqrt(np.maximum((1.0 + cos_angle) * 0.5, 1e-12)) > miter_limit
+    # elsewhere the offset edges are cut at their intersection, unless the cut exceeds the length of one of the edges:
+    # in that case the two offset edges are simply connected and the cleanup removes the inverted pieces
+    setbacks = np.where(cross * distance <= 0, 0.0, np.abs(distance) * np.abs(cross) / np.maximum(1.0 + cos_angle, 1e-12))
+    fitting_lines = setbacks[previous_line] + setbacks <= line_lengths
+    is_miter = ~is_join & fitting_lines & fitting_lines[next_line]
+    if join_style == 'round':
+        sweep = np.arctan2(cross, cos_angle)
+        step = 2.0 * np.arccos(np.clip(1.0 - arc_tolerance / np.abs(distance), -1.0, 1.0))
+        join_points = np.maximum(np.ceil(np.abs(sweep) / max(step, 1e-6)).astype(np.int64), 1) + 1
+    else:
+        sweep = np.zeros(len(line_points))
+        join_points = np.full(len(line_points), 2)
+    points_per_vertex = np.where(is_miter, 1, np.where(is_join, join_points, 2))
+    vertex_ids = np.repeat(np.arange(len(line_points)), points_per_vertex)
+    sub_ids = np.arange(len(vertex_ids)) - np.repeat(np.cumsum(points_per_vertex) - points_per_vertex, points_per_vertex)
+    fractions = sub_ids / np.maximum(points_per_vertex[vertex_ids] - 1, 1)
+    corners = points[line_ends[vertex_ids]]
+    start_offsets = distance * line_normals[vertex_ids]
+    end_offsets = distance * line_normals[next_line][vertex_ids]
+    start_angles = np.arctan2(start_offsets[:, 1], start_offsets[:, 0])
+    if join_style == 'round':
+        angles = start_angles + sweep[vertex_ids] * fractions
+    else:
+        angles = np.where(fractions > 0, np.arctan2(end_offsets[:, 1], end_offsets[:, 0]), start_angles)
+    joined = corners + np.abs(distance) * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+    mitered = __intersect_lines(line_points, line_directions, line_points[next_line], line_directions[next_line])[vertex_ids]
+    backtracked = np.where((sub_ids == 0)[:, None], corners + start_offsets, corners + end_offsets)
+    output_points = np.where(is_miter[vertex_ids, None], mitered, np.where(is_join[vertex_ids, None], joined, backtracked))
+    output_loops = line_loops[vertex_ids]
+    tolerance = max(np.abs(distance), 1e-3) * 1e-3
+    result = __clean_loops(output_points, output_loops, tolerance=tolerance)
+    if len(result) == 0:
+        return result
+    # the offset loops reach distance from the input boundary at least on their join points (round joins cut inside by
+    # arc_tolerance), the inverted loops lie entirely closer
+    result_points = np.vstack(result)
+    result_ids = np.repeat(np.arange(len(result)), [len(loop) for loop in result])
+    too_close = __closer_than(result_points, loops_to_edges(loops), np.abs(distance) - arc_tolerance - tolerance)
+    return [loop for loop, close_count, count in zip(result, np.bincount(result_ids, weights=too_close), np.bincount(result_ids))
+            if close_count < count]
+
+
+# Douglas-Peucker simplification of a (N, 2) polyline, returns the mask of the points to keep. The end points are always
+# kept and every removed point is within tolerance of the segment that replaces it, on closed polylines (last point
+# equal to the first) the first split falls on the point farthest from the start.
+def simplify_polyline(points, tolerance):
+    points = np.asarray(points, dtype=np.float64)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    ranges = [(0, len(points) - 1)]
+    while len(ranges) > 0:
+        first, last = ranges.pop()
+        if last - first < 2:
+            continue
+        base = points[last] - points[first]
+        offsets = points[first + 1:last] - points[first]
+        base_length = base.dot(base)
+        if base_length > 0:
+            projections = np.clip(offsets.dot(base) / base_length, 0, 1)
+            offsets = offsets - projections[:, None] * base
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            ranges.append((first, split))
+            ranges.append((split, last))
+    return keep
+
+
+# Splits a (N, 2) polyline in runs of points that lie on a circular arc within tolerance and runs of lines. Returns a
+# list of (first index, last index, center, counterclockwise) with center None for the line runs. Arcs span at least
+# min_points points, turn always in the same direction, stay below a full turn and have radius up to max_radius.
+# Arcs only start where min_points consecutive points turn the same way with a small enough radius, the runs are
+# then grown by doubling their length and bisecting the first length that does not fit.
+def fit_arcs(points, tolerance, min_points=5, max_radius=1000.0):
+    points = np.asarray(points, dtype=np.float64)
+    pieces = []
+    if len(points) < min_points:
+        return [(0, len(points) - 1, None, False)] if len(points) > 1 else pieces
+    # turn direction and circumradius at each inner point
+    edges = np.diff(points, axis=0)
+    lengths = np.hypot(edges[:, 0], edges[:, 1])
+    crosses = edges[:-1, 0] * edges[1:, 1] - edges[:-1, 1] * edges[1:, 0]
+    chords = np.hypot(*(points[2:] - points[:-2]).T)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        radii = lengths[:-1] * lengths[1:] * chords / (2 * np.abs(crosses))
+    curved = np.nan_to_num(radii, nan=np.inf) <= max_radius
+    left = np.concatenate(([0], np.cumsum(curved & (crosses > 0))))
+    right = np.concatenate(([0], np.cumsum(curved & (crosses < 0))))
+    inner_count = min_points - 2
+    window_left = left[inner_count:] - left[:-inner_count]
+    window_right = right[inner_count:] - right[:-inner_count]
+    candidates = np.nonzero((window_left == inner_count) | (window_right == inner_count))[0]
+    line_start = 0
+    first = 0
+    for candidate in candidates:
+        if candidate < first:
+            continue
+        last = candidate + min_points - 1
+        arc = __fit_arc(points, candidate, last, tolerance, max_radius)
+        if arc is None:
+            continue
+        step = min_points - 1
+        bad_last = None
+        while last < len(points) - 1:
+            next_last = min(last + step, len(points) - 1)
+            next_arc = __fit_arc(points, candidate, next_last, tolerance, max_radius)
+            if next_arc is None:
+                bad_last = next_last
+                break
+            last, arc = next_last, next_arc
+            step *= 2
+        if bad_last is not None:
+            while bad_last - last > 1:
+                middle = (last + bad_last) // 2
+                middle_arc = __fit_arc(points, candidate, middle, tolerance, max_radius)
+                if middle_arc is None:
+                    bad_last = middle
+                else:
+                    last, arc = middle, middle_arc
+        if line_start < candidate:
+            pieces.append((line_start, candidate, None, False))
+        pieces.append((candidate, last, arc[0], arc[1]))
+        line_start = first = last
+    if line_start < len(points) - 1:
+        pieces.append((line_start, len(points) - 1, None, False))
+    return pieces
+
+
+# circle through the first, middle and last point of points[first:last + 1], returns (center, counterclockwise) when
+# all the points and the chords between them are within tolerance of the circle and the run turns less than a full turn
+def __fit_arc(points, first, last, tolerance, max_radius):
+    run = points[first:last + 1]
+    point_0, point_1, point_2 = run[0], run[len(run) // 2], run[-1]
+    determinant = 2 * ((point_1[0] - point_0[0]) * (point_2[1] - point_0[1]) - (point_1[1] - point_0[1]) * (point_2[0] - point_0[0]))
+    if determinant == 0:
+        return None
+    norm_1 = (point_1 - point_0).dot(point_1 - point_0)
+    norm_2 = (point_2 - point_0).dot(point_2 - point_0)
+    center = point_0 + np.array([(point_2[1] - point_0[1]) * norm_1 - (point_1[1] - point_0[1]) * norm_2,
+                                 (point_1[0] - point_0[0]) * norm_2 - (point_2[0] - point_0[0]) * norm_1]) / determinant
+    offsets = run - center
+    distances = np.hypot(offsets[:, 0], offsets[:, 1])
+    radius = distances[0]
+    if radius > max_radius or np.max(np.abs(distances - radius)) > tolerance:
+        return None
+    # sweep of each chord around the center, all in the same direction
+    steps = np.arctan2(offsets[:-1, 0] * offsets[1:, 1] - offsets[:-1, 1] * offsets[1:, 0],
+                       np.einsum('ij,ij->i', offsets[:-1], offsets[1:]))
+    counterclockwise = steps[0] > 0
+    if np.any((steps > 0) != counterclockwise) or np.any(steps == 0) or abs(steps.sum()) >= 2 * np.pi - 1e-3:
+        return None
+    # distance of the middle of the chords from the arc
+    if np.max(radius - radius * np.cos(np.abs(steps) * 0.5)) > tolerance:
+        return None
+    return center, bool(counterclockwise)
+
+
+# index of the next element of each element in its group, groups being contiguous runs of the same id
+def __next_in_group(group_ids):
+    count = len(group_ids)
+    group_start = np.searchsorted(group_ids, group_ids, side='left')
+    group_end = np.searchsorted(group_ids, group_ids, side='right')
+    next_idx = np.arange(count) + 1
+    return np.where(next_idx < group_end, next_idx, group_start)
+
+
+def __intersect_lines(points_0, directions_0, points_1, directions_1):
+    denominator = directions_0[:, 0] * directions_1[:, 1] - directions_0[:, 1] * directions_1[:, 0]
+    difference = points_1 - points_0
+    numerator = difference[:, 0] * directions_1[:, 1] - difference[:, 1] * directions_1[:, 0]
+    parallel = np.abs(denominator) < 1e-9
+    t = np.where(parallel, 0.0, numerator / np.where(parallel, 1.0, denominator))
+    return np.where(parallel[:, None], points_1, points_0 + t[:, None] * directions_0)
+
+
+# Self-intersection cleanup: all the crossings between the edges are inserted as vertices and only the pieces of edges
+# bounding the region with positive winding number (material on the left, void on the right) are kept and chained again into loops.
+def __clean_loops(points, loop_ids, tolerance):
+    next_point = __next_in_group(loop_ids)
+    edges = np.stack((points, points[next_point]), axis=1)
+    edge_idxs, parameters, crossing_points = __edges_crossings(edges)
+    crossing_loops = np.unique(loop_ids[edge_idxs])
+    # loops without crossings are entirely valid or invalid, a single edge of theirs is tested
+    is_crossing_loop = np.isin(loop_ids, crossing_loops)
+    first_of_loop = np.append(True, loop_ids[1:] != loop_ids[:-1])
+    tested_edges = np.nonzero(~is_crossing_loop & first_of_loop)[0]
+    split_edges = np.nonzero(is_crossing_loop)[0]
+    all_edge_idxs = np.concatenate((split_edges, edge_idxs))
+    all_parameters = np.concatenate((np.zeros(len(split_edges)), parameters))
+    all_points = np.concatenate((points[split_edges], crossing_points))
+    order = np.lexsort((all_parameters, all_edge_idxs))
+    sub_points = all_points[order]
+    sub_loops = loop_ids[all_edge_idxs[order]]
+    sub_segments = np.stack((sub_points, sub_points[__next_in_group(sub_loops)]), axis=1)
+    candidates = np.concatenate((edges[tested_edges], sub_segments))
+    directions = candidates[:, 1] - candidates[:, 0]
+    lengths = np.linalg.norm(directions, axis=1)
+    non_degenerate = lengths > 1e-12
+    candidates = candidates[non_degenerate]
+    normals = np.stack((- directions[non_degenerate, 1], directions[non_degenerate, 0]), axis=1) / lengths[non_degenerate, None]
+    middles = 0.5 * (candidates[:, 0] + candidates[:, 1])
+    # the sides are sampled close enough to the middle point not to cross the edges meeting at the ends of short pieces
+    side_offsets = 1e-3 * np.minimum(tolerance, lengths[non_degenerate])[:, None] * normals
+    left_winding = __winding_numbers(middles + side_offsets, edges)
+    right_winding = __winding_numbers(middles - side_offsets, edges)
+    keep = (left_winding > 0) & (right_winding <= 0)
+    tested_count = np.count_nonzero(non_degenerate[:len(tested_edges)])
+    result = [points[loop_ids == loop_id] for loop_id in loop_ids[tested_edges][non_degenerate[:len(tested_edges)]][keep[:tested_count]]]
+    kept_segments = candidates[tested_count:][keep[tested_count:]]
+    if len(kept_segments) > 0:
+        # overlapping collinear edges produce the same piece twice
+        keys = np.round(kept_segments.reshape(-1, 4) / (tolerance * 1e-3)).astype(np.int64)
+        _, unique_idxs = np.unique(keys, axis=0, return_index=True)
+        kept_segments = kept_segments[np.sort(unique_idxs)]
+        result += [loop for loop in assemble_loops(kept_segments, tolerance=tolerance * 1e-3, directed=True)
+                   if np.abs(loops_signed_area([loop])[0]) > (100 * tolerance) ** 2]
+    return result
+
+
+# Pairs (i, j) of items whose z ranges overlap, found by bucketing the ranges in horizontal bands.
+# Each pair is reported once, in the first band shared by the two ranges.
+def __overlapping_ranges(min_0, max_0, min_1, max_1):
+    if len(min_0) == 0 or len(min_1) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    z_min = min(min_0.min(), min_1.min())
+    z_max = max(max_0.max(), max_1.max())
+    number_of_bands = max(int(np.sqrt(max(len(min_0), len(min_1)))), 1)
+    band_height = max((z_max - z_min) / number_of_bands, 1e-12)
+    bands = []
+    for range_min, range_max in ((min_0, max_0), (min_1, max_1)):
+        first_band = np.minimum(((range_min - z_min) / band_height).astype(np.int64), number_of_bands - 1)
+        last_band = np.minimum(((range_max - z_min) / band_height).astype(np.int64), number_of_bands - 1)
+        bands_count = last_band - first_band + 1
+        items = np.repeat(np.arange(len(range_min)), bands_count)
+        item_bands = first_band[items] + np.arange(len(items)) - np.repeat(np.cumsum(bands_count) - bands_count, bands_count)
+        order = np.argsort(item_bands, kind='stable')
+        bands.append((items[order], item_bands[order], first_band))
+    items_0, bands_0, first_band_0 = bands[0]
+    items_1, bands_1, first_band_1 = bands[1]
+    band_start_1 = np.searchsorted(bands_1, np.arange(number_of_bands), side='left')
+    band_count_1 = np.searchsorted(bands_1, np.arange(number_of_bands), side='right') - band_start_1
+    pairs_count = band_count_1[bands_0]
+    pair_0 = np.repeat(items_0, pairs_count)
+    pair_bands = np.repeat(bands_0, pairs_count)
+    pair_1 = items_1[np.repeat(band_start_1[bands_0], pairs_count) + np.arange(len(pair_0)) - np.repeat(np.cumsum(pairs_count) - pairs_count, pairs_count)]
+    first_shared = pair_bands == np.maximum(first_band_0[pair_0], first_band_1[pair_1])
+    pair_0 = pair_0[first_shared]
+    pair_1 = pair_1[first_shared]
+    overlapping = (min_0[pair_0] <= max_1[pair_1]) & (min_1[pair_1] <= max_0[pair_0])
+    return pair_0[overlapping], pair_1[overlapping]
+
+
+# all the crossings between pairs of edges, returned for both edges of each pair as (edge index, parameter along the edge, point)
+def __edges_crossings(edges):
+    starts = edges[:, 0]
+    directions = edges[:, 1] - edges[:, 0]
+    bbox_min = edges.min(axis=1)
+    bbox_max = edges.max(axis=1)
+    idx_0, idx_1 = __overlapping_ranges(bbox_min[:, 1], bbox_max[:, 1], bbox_min[:, 1], bbox_max[:, 1])
+    candidates = (idx_1 > idx_0) & (bbox_min[idx_0, 0] <= bbox_max[idx_1, 0]) & (bbox_min[idx_1, 0] <= bbox_max[idx_0, 0])
+    idx_0 = idx_0[candidates]
+    idx_1 = idx_1[candidates]
+    denominator = directions[idx_0, 0] * directions[idx_1, 1] - directions[idx_0, 1] * directions[idx_1, 0]
+    difference = starts[idx_1] - starts[idx_0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (difference[:, 0] * directions[idx_1, 1] - difference[:, 1] * directions[idx_1, 0]) / denominator
+        u = (difference[:, 0] * directions[idx_0, 1] - difference[:, 1] * directions[idx_0, 0]) / denominator
+    # crossings strictly inside both edges, shared end points of consecutive edges are not crossings
+    crossing = (np.abs(denominator) > 1e-12) & (t > 1e-9) & (t < 1 - 1e-9) & (u > 1e-9) & (u < 1 - 1e-9)
+    point = starts[idx_0[crossing]] + t[crossing, None] * directions[idx_0[crossing]]
+    edge_idxs = [idx_0[crossing], idx_1[crossing]]
+    parameters = [t[crossing], u[crossing]]
+    crossing_points = [point, point]
+    # overlapping collinear edges are split at the end points of each other
+    lengths_0 = np.einsum('ij,ij->i', directions[idx_0], directions[idx_0])
+    lengths_1 = np.einsum('ij,ij->i', directions[idx_1], directions[idx_1])
+    distance = np.abs(difference[:, 0] * directions[idx_0, 1] - difference[:, 1] * directions[idx_0, 0]) / np.sqrt(np.maximum(lengths_0, 1e-24))
+    collinear = (np.abs(denominator) <= 1e-12 * np.sqrt(lengths_0 * lengths_1) + 1e-18) & (distance < 1e-9) & (lengths_0 > 0) & (lengths_1 > 0)
+    for target, source, target_lengths in ((idx_0, idx_1, lengths_0), (idx_1, idx_0, lengths_1)):
+        for end in range(2):
+            end_points = edges[source[collinear], end]
+            projection = np.einsum('ij,ij->i', end_points - starts[target[collinear]], directions[target[collinear]]) / target_lengths[collinear]
+            inside = (projection > 1e-9) & (projection < 1 - 1e-9)
+            edge_idxs.append(target[collinear][inside])
+            parameters.append(projection[inside])
+            crossing_points.append(end_points[inside])
+    return np.concatenate(edge_idxs), np.concatenate(parameters), np.concatenate(crossing_points)
+
+
+# mask of the points closer than distance to one of the (N, 2, 2) edges
+def __closer_than(points, edges, distance):
+    too_close = np.zeros(len(points), dtype=bool)
+    if distance <= 0 or len(edges) == 0:
+        return too_close
+    bbox_min = edges.min(axis=1) - distance
+    bbox_max = edges.max(axis=1) + distance
+    point_idxs, edge_idxs = __overlapping_ranges(points[:, 1], points[:, 1], bbox_min[:, 1], bbox_max[:, 1])
+    inside = (points[point_idxs, 0] >= bbox_min[edge_idxs, 0]) & (points[point_idxs, 0] <= bbox_max[edge_idxs, 0])
+    point_idxs = point_idxs[inside]
+    edge_idxs = edge_idxs[inside]
+    starts = edges[edge_idxs, 0]
+    directions = edges[edge_idxs, 1] - starts
+    relative = points[point_idxs] - starts
+    t = np.clip(np.einsum('ij,ij->i', relative, directions) / np.maximum(np.einsum('ij,ij->i', directions, directions), 1e-24), 0.0, 1.0)
+    closest = np.linalg.norm(relative - t[:, None] * directions, axis=1) < distance
+    too_close[point_idxs[closest]] = True
+    return too_close
+
+
+def __winding_numbers(points, edges):
+    z_0 = edges[:, 0, 1]
+    z_1 = edges[:, 1, 1]
+    point_idxs, edge_idxs = __overlapping_ranges(points[:, 1], points[:, 1], np.minimum(z_0, z_1), np.maximum(z_0, z_1))
+    x_0 = edges[edge_idxs, 0, 0]
+    x_1 = edges[edge_idxs, 1, 0]
+    z_0 = z_0[edge_idxs]
+    z_1 = z_1[edge_idxs]
+    point_x = points[point_idxs, 0]
+    point_z = points[point_idxs, 1]
+    side = (x_1 - x_0) * (point_z - z_0) - (point_x - x_0) * (z_1 - z_0)
+    upward = (z_0 <= point_z) & (z_1 > point_z) & (side > 0)
+    downward = (z_0 > point_z) & (z_1 <= point_z) & (side < 0)
+    return np.bincount(point_idxs, weights=upward.astype(np.int64) - downward.astype(np.int64), minlength=len(points)).astype(np.int64)
@@ -0,0 +1,333 @@
+import mmap
+import numpy as np
+from helpers import gcode_helpers
+
+# the text jobs are estimated in chunks of whole lines
+ESTIMATE_CHUNK_SIZE = 8 * 1024 * 1024
+# bytes of a serial frame besides the command: '*', the checksum and '\n'. In streaming mode "N<number> " is added
+FRAME_OVERHEAD_BYTES = 5
+# fields of the commands used by the estimate and the powers of ten of the digits of their numbers
+FIELD_LETTERS = 'XYIJFDRA'
+FIELD_ROWS = np.full(256, -1, dtype=np.int64)
+FIELD_ROWS[np.frombuffer(FIELD_LETTERS.encode('ascii'), dtype=np.uint8)] = np.arange(len(FIELD_LETTERS))
+MAX_DIGITS = 32
+POWERS_OF_TEN = 10.0 ** np.arange(-MAX_DIGITS, MAX_DIGITS + 1)
+# per layer times in ms, the layer 0 of the estimate of a job holds the commands before the first layer
+LAYER_TIMES_DTYPE = [('marking_ms', '<f8'), ('jump_ms', '<f8'), ('motor_ms', '<f8'), ('serial_ms', '<f8'), ('total_ms', '<f8')]
+
+
+# time model of the machine. Marking moves run at the scan speed of the last "G1 F" command (mm/s), jumps at the jump
+# speed of the galvo after a fixed jump delay. The recoating moves the wiper and the building plate with the recoat
+# settings of the sender, the other motor moves run at motor_feedrate_mm_min. The frames are sent at baudrate with
+# 10 bits per byte: with stop and wait every line waits for its transfer, its execution and the reply latency, in
+# streaming mode the transfer of the lines overlaps the galvo moves
+class PrintTimeModel():
+
+    def __init__(self, jump_speed_mm_s=2000.0, jump_delay_ms=0.1, baudrate=115200, streaming_mode=False,
+                 line_latency_ms=1.0, wiper_recoat_offset_mm=245, wiper_recoat_feedrate_mm_min=1800,
+                 building_plate_recoat_offset_mm=1, building_plate_recoat_feedrate_mm_min=300,
+                 motor_feedrate_mm_min=300, homing_ms=0.0):
+        self.jump_speed_mm_s = jump_speed_mm_s
+        self.jump_delay_ms = jump_delay_ms
+        self.baudrate = baudrate
+        self.streaming_mode = streaming_mode
+        self.line_latency_ms = line_latency_ms
+        self.wiper_recoat_offset_mm = wiper_recoat_offset_mm
+        self.wiper_recoat_feedrate_mm_min = wiper_recoat_feedrate_mm_min
+        self.building_plate_recoat_offset_mm = building_plate_recoat_offset_mm
+        self.building_plate_recoat_feedrate_mm_min = building_plate_recoat_feedrate_mm_min
+        self.motor_feedrate_mm_min = motor_feedrate_mm_min
+        self.homing_ms = homing_ms
+
+    # the wiper goes to the recoat offset and back, the building plate goes down and up by the recoat offset
+    def recoat_ms(self):
+        return 2 * abs(self.wiper_recoat_offset_mm) / self.wiper_recoat_feedrate_mm_min * 60000 + \
+               2 * abs(self.building_plate_recoat_offset_mm) / self.building_plate_recoat_feedrate_mm_min * 60000
+
+    def motor_move_ms(self, distance_mm):
+        return abs(distance_mm) / self.motor_feedrate_mm_min * 60000
+
+
+# machine state carried from a chunk, or a layer, to the next one
+class EstimateState():
+
+    def __init__(self):
+        self.position = np.zeros(2)
+        self.scan_speed = 0.0
+        self.building_plate_position = 0.0
+        self.wiper_position = 0.0
+        self.serial_lines = 0
+
+
+# estimate of a text or binary job reader: a LAYER_TIMES_DTYPE array with the commands before the first layer in row 0
+# and layer i in row i + 1, and the total time in ms
+def estimate_job(job_file, model):
+    if isinstance(job_file, gcode_helpers.BinaryJobReader):
+        layer_times = estimate_binary_job(job_file, model)
+    else:
+        layer_times = estimate_text_job(job_file.file_name, job_file.layer_offsets(), model)
+    return {'layers': layer_times, 'total_ms': float(layer_times['total_ms'].sum())}
+
+
+# hours:minutes:seconds, the hours are not wrapped at 24
+def format_duration(time_ms):
+    seconds = int(round(time_ms / 1000))
+    return "%i:%02i:%02i" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+# the file is memory mapped and tokenized in chunks of whole lines, the times are summed per layer with bincount
+def estimate_text_job(file_name, layer_offsets, model):
+    layer_offsets = np.asarray(layer_offsets, dtype=np.int64)
+    times = np.zeros((4, len(layer_offsets) + 1))
+    state = EstimateState()
+    with open(file_name, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return __layer_times(*times, model)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+            chunk_start = 0
+            while chunk_start < len(file_map):
+                chunk_end = min(chunk_start + ESTIMATE_CHUNK_SIZE, len(file_map))
+                if chunk_end < len(file_map):
+                    line_end = file_map.rfind(b'\n', chunk_start, chunk_end)
+                    chunk_end = line_end + 1 if line_end >= 0 else len(file_map)
+                data = np.frombuffer(file_map, dtype=np.uint8, count=chunk_end - chunk_start, offset=chunk_start)
+                __add_text_chunk_times(data, chunk_start, layer_offsets, state, model, times)
+                del data
+                chunk_start = chunk_end
+    return __layer_times(*times, model)
+
+
+def __add_text_chunk_times(data, chunk_start, layer_offsets, state, model, times):
+    lines = __tokenize_gcode(data)
+    if lines is None:
+        return
+    line_starts, letters, numbers, fields, line_bytes = lines
+    layers = np.searchsorted(layer_offsets, line_starts + chunk_start, side='right')
+    is_g = letters == ord('G')
+    # the laser parameters "G1 F H P" set the scan speed of the following marks
+    is_speed = is_g & ~np.isnan(fields['F']) & np.isnan(fields['X']) & np.isnan(fields['Y'])
+    last_speed = np.maximum.accumulate(np.where(is_speed, np.arange(len(letters)), -1))
+    scan_speeds = np.where(last_speed >= 0, fields['F'][np.maximum(last_speed, 0)], state.scan_speed)
+    if np.any(is_speed):
+        state.scan_speed = float(fields['F'][np.flatnonzero(is_speed)[-1]])
+    is_move = is_g & np.isin(numbers, (0, 1, 2, 3)) & ~(np.isnan(fields['X']) & np.isnan(fields['Y']))
+    move_ends = np.stack((fields['X'][is_move], fields['Y'][is_move]), axis=1)
+    # a missing coordinate keeps the previous one
+    for axis in range(2):
+        is_set = ~np.isnan(move_ends[:, axis])
+        last_set = np.maximum.accumulate(np.where(is_set, np.arange(len(is_set)), -1))
+        move_ends[:, axis] = np.where(last_set >= 0, move_ends[np.maximum(last_set, 0), axis], state.position[axis])
+    move_starts = np.concatenate((state.position.reshape(1, 2), move_ends[:-1]))
+    if len(move_ends) > 0:
+        state.position = move_ends[-1].copy()
+    move_codes = numbers[is_move]
+    lengths = np.hypot(*(move_ends - move_starts).T)
+    is_arc = (move_codes == 2) | (move_codes == 3)
+    if np.any(is_arc):
+        centers = move_starts[is_arc] + np.nan_to_num(np.stack((fields['I'][is_move][is_arc], fields['J'][is_move][is_arc]), axis=1))
+        lengths[is_arc] = arc_lengths(move_starts[is_arc], move_ends[is_arc], centers, move_codes[is_arc] == 3)
+    is_mark = ~np.isnan(fields['D'][is_move]) | is_arc
+    move_layers = layers[is_move]
+    move_speeds = scan_speeds[is_move]
+    marking_ms = np.divide(lengths * 1000, move_speeds, out=np.zeros(len(lengths)), where=is_mark & (move_speeds > 0))
+    jump_ms = np.where(is_mark, 0, model.jump_delay_ms + lengths / model.jump_speed_mm_s * 1000)
+    times[0] += np.bincount(move_layers, weights=marking_ms, minlength=times.shape[1])
+    times[1] += np.bincount(move_layers, weights=jump_ms, minlength=times.shape[1])
+    # the motor commands are not sent, they are a few per layer
+    is_motor = letters == ord('C')
+    for line_idx in np.flatnonzero(is_motor):
+        times[2][layers[line_idx]] += __motor_command_ms(numbers[line_idx], fields['R'][line_idx], fields['A'][line_idx], state, model)
+    is_serial = ~is_motor
+    times[3] += np.bincount(layers[is_serial], weights=__transfer_ms(line_bytes[is_serial], state, model), minlength=times.shape[1])
+
+
+# the command lines of a block of whole lines of G-code. A field is an upper case letter at the start of the line or
+# after a blank, followed by its number. The numbers of all the fields are parsed at once: every digit is weighted by
+# its power of ten from the decimal point and the digits are summed per field with bincount. Returns the start of the
+# command lines, their letter and number ("G" and 1 for "G1 X0 Y0"), the X Y I J F D R A values (nan when missing)
+# and the bytes of the commands without comments
+def __tokenize_gcode(data):
+    size = len(data)
+    newlines = np.flatnonzero(data == 10)
+    line_starts = np.concatenate(([0], newlines + 1))
+    line_ends = np.append(newlines, size)
+    line_ends = line_ends[line_starts < size]
+    line_starts = line_starts[line_starts < size]
+    # the content of a line ends at its comment or at '\r'
+    terminators = np.flatnonzero((data == 59) | (data == 13))
+    terminator_lines = np.searchsorted(line_starts, terminators, side='right') - 1
+    is_first_terminator = np.ones(len(terminators), dtype=bool)
+    is_first_terminator[1:] = terminator_lines[1:] != terminator_lines[:-1]
+    content_ends = line_ends.copy()
+    content_ends[terminator_lines[is_first_terminator]] = terminators[is_first_terminator]
+    content_marks = np.zeros(size + 1, dtype=np.int8)
+    content_marks[line_starts] = 1
+    content_marks[content_ends] -= 1
+    is_content = np.cumsum(content_marks[:size], dtype=np.int8) > 0
+    follows_blank = np.ones(size, dtype=bool)
+    follows_blank[1:] = (data[:-1] == 32) | (data[:-1] == 9) | (data[:-1] == 10)
+    is_field = (data >= 65) & (data <= 90) & is_content & follows_blank
+    field_starts = np.flatnonzero(is_field)
+    if len(field_starts) == 0:
+        return None
+    is_digit = (data >= 48) & (data <= 57)
+    is_number = (is_digit | (data == 46) | (data == 45) | (data == 43)) & is_content
+    # the runs of number characters following a letter are the numbers of the fields, in the same order
+    run_changes = np.flatnonzero(np.diff(is_number.view(np.int8), prepend=0, append=0))
+    run_starts, run_ends = run_changes[0::2], run_changes[1::2]
+    is_field_run = is_field[np.maximum(run_starts - 1, 0)] & (run_starts > 0)
+    number_starts = field_starts + 1
+    has_number = is_number[np.minimum(number_starts, size - 1)] & (number_starts < size)
+    number_ends = number_starts.copy()
+    number_ends[has_number] = run_ends[is_field_run]
+    if not np.all(is_field_run):
+        # the numbers not following a letter are ignored
+        run_marks = np.zeros(size + 1, dtype=np.int8)
+        run_marks[run_starts[~is_field_run]] = 1
+        run_marks[run_ends[~is_field_run]] -= 1
+        is_number &= np.cumsum(run_marks[:size], dtype=np.int8) == 0
+    points = np.append(np.flatnonzero((data == 46) & is_number), size)
+    decimal_points = np.minimum(points[np.searchsorted(points, number_starts)], number_ends)
+    digits = np.flatnonzero(is_digit & is_number)
+    digit_fields = np.cumsum(is_field, dtype=np.int32)[digits] - 1
+    exponents = decimal_points[digit_fields] - digits
+    exponents -= exponents > 0
+    values = np.bincount(digit_fields, weights=(data[digits] - 48) * POWERS_OF_TEN[exponents + MAX_DIGITS], minlength=len(field_starts))
+    values[data[np.minimum(number_starts, size - 1)] == 45] *= -1
+    values[~has_number] = np.nan
+    field_lines = np.searchsorted(line_starts, field_starts, side='right') - 1
+    # a line is a command when it starts with a field, the other fields belong to its command
+    is_command = field_starts == line_starts[field_lines]
+    command_lines = field_lines[is_command]
+    line_commands = np.full(len(line_starts), -1, dtype=np.int64)
+    line_commands[command_lines] = np.arange(len(command_lines))
+    field_commands = line_commands[field_lines]
+    field_letters = data[field_starts]
+    field_rows = FIELD_ROWS[field_letters]
+    is_kept = (field_rows >= 0) & (field_commands >= 0)
+    field_table = np.full((len(FIELD_LETTERS), len(command_lines)), np.nan)
+    field_table[field_rows[is_kept], field_commands[is_kept]] = values[is_kept]
+    fields = dict(zip(FIELD_LETTERS, field_table))
+    # the bytes sent are the ones up to the end of the last field of the line
+    is_last = np.append(field_lines[1:] != field_lines[:-1], True) & (field_commands >= 0)
+    command_bytes = np.zeros(len(command_lines), dtype=np.int64)
+    command_bytes[field_commands[is_last]] = number_ends[is_last] - line_starts[field_lines[is_last]]
+    return line_starts[command_lines], field_letters[is_command], values[is_command], fields, command_bytes
+
+
+# length of the arcs from the (N, 2) start points to the end points around the centers, a closed arc is a full circle
+def arc_lengths(starts, ends, centers, counterclockwise):
+    start_angles = np.arctan2(*(starts - centers).T[::-1])
+    end_angles = np.arctan2(*(ends - centers).T[::-1])
+    sweeps = np.where(counterclockwise, end_angles - start_angles, start_angles - end_angles) % (2 * np.pi)
+    sweeps[sweeps < 1e-9] = 2 * np.pi
+    return np.hypot(*(starts - centers).T) * sweeps
+
+
+def __motor_command_ms(number, relative_mm, absolute_mm, state, model):
+    if number == 0:
+        state.building_plate_position = 0.0
+        state.wiper_position = 0.0
+        return model.homing_ms
+    if number == 3:
+        return model.recoat_ms()
+    if number == 1:
+        previous_position = state.building_plate_position
+        if not np.isnan(absolute_mm):
+            state.building_plate_position = absolute_mm
+        elif not np.isnan(relative_mm):
+            state.building_plate_position += relative_mm
+        return model.motor_move_ms(state.building_plate_position - previous_position)
+    if number == 2:
+        previous_position = state.wiper_position
+        if not np.isnan(absolute_mm):
+            state.wiper_position = absolute_mm
+        elif not np.isnan(relative_mm):
+            state.wiper_position += relative_mm
+        return model.motor_move_ms(state.wiper_position - previous_position)
+    return 0.0
+
+
+# transfer time of the frames of the serial commands, with the reply latency of each line in stop and wait
+def __transfer_ms(command_bytes, state, model):
+    frame_bytes = command_bytes + FRAME_OVERHEAD_BYTES
+    if model.streaming_mode:
+        line_numbers = state.serial_lines + np.arange(1, len(command_bytes) + 1)
+        frame_bytes = frame_bytes + 2 + np.floor(np.log10(line_numbers)).astype(np.int64) + 1
+    state.serial_lines += len(command_bytes)
+    transfer_ms = frame_bytes * 10000.0 / model.baudrate
+    if not model.streaming_mode:
+        transfer_ms += model.line_latency_ms
+    return transfer_ms
+
+
+# with stop and wait the galvo waits for every line, in streaming mode the slowest of the galvo and the serial
+# transfer sets the time of the layer. The motors move after all the previous lines are executed
+def __layer_times(marking_ms, jump_ms, motor_ms, serial_ms, model):
+    layer_times = np.zeros(len(marking_ms), dtype=LAYER_TIMES_DTYPE)
+    layer_times['marking_ms'] = marking_ms
+    layer_times['jump_ms'] = jump_ms
+    layer_times['motor_ms'] = motor_ms
+    layer_times['serial_ms'] = serial_ms
+    if model.streaming_mode:
+        layer_times['total_ms'] = np.maximum(marking_ms + jump_ms, serial_ms) + motor_ms
+    else:
+        layer_times['total_ms'] = marking_ms + jump_ms + serial_ms + motor_ms
+    return layer_times
+
+
+# the layers are read one at a time and the moves are computed from their segments, without formatting the G-code
+def estimate_binary_job(job_file, model):
+    times = np.zeros((4, job_file.number_of_layers() + 1))
+    state = EstimateState()
+    decimals = job_file.number_of_decimals
+    for command in gcode_helpers.PREAMBLE_COMMANDS:
+        __add_command_ms(command, 0, state, model, times)
+    for layer_idx in range(job_file.number_of_layers()):
+        slice_idx, layer_thickness, blocks = job_file.read_layer(layer_idx)
+        for command in gcode_helpers.recoating_commands(layer_thickness, decimals):
+            __add_command_ms(command, layer_idx + 1, state, model, times)
+        for geometry_idx, block_type, points in blocks:
+            parameters = job_file.header['geometries'][str(geometry_idx)]['parameters']
+            prefix = 'contour_' if block_type == gcode_helpers.CONTOUR_BLOCK else 'infill_'
+            state.scan_speed = float(parameters[prefix + 'scan_speed'])
+            laser_command = "G1 F" + ("%%.%if" % decimals) % state.scan_speed + " H%i P%i" % (parameters[prefix + 'frequency'], parameters[prefix + 'laser_power'])
+            __add_command_ms(laser_command, layer_idx + 1, state, model, times)
+            segments = np.asarray(points, dtype=np.float64).reshape(-1, 2, 2)
+            if len(segments) == 0:
+                continue
+            jumps = gcode_helpers.jump_mask(segments)
+            previous_ends = np.concatenate((state.position.reshape(1, 2), segments[:-1, 1]))
+            jump_lengths = np.hypot(*(segments[jumps, 0] - previous_ends[jumps]).T)
+            mark_lengths = np.hypot(*(segments[:, 1] - segments[:, 0]).T)
+            state.position = segments[-1, 1].copy()
+            times[0][layer_idx + 1] += mark_lengths.sum() * 1000 / state.scan_speed if state.scan_speed > 0 else 0
+            times[1][layer_idx + 1] += len(jump_lengths) * model.jump_delay_ms + jump_lengths.sum() / model.jump_speed_mm_s * 1000
+            # "G1 X<x> Y<y>" for the jumps and "G1 X<x> Y<y> D<duty cycle>" for the marks
+            mark_bytes = 6 + __number_bytes(segments[:, 1], decimals).sum(axis=1) + 2 + len("%i" % parameters[prefix + 'duty_cycle'])
+            jump_bytes = 6 + __number_bytes(segments[jumps, 0], decimals).sum(axis=1)
+            times[3][layer_idx + 1] += __transfer_ms(np.concatenate((jump_bytes, mark_bytes)), state, model).sum()
+    return __layer_times(*times, model)
+
+
+def __add_command_ms(command, layer_idx, state, model, times):
+    motor_command = command.replace(" ", "")
+    if motor_command[0:1] == "C":
+        relative_mm, absolute_mm = np.nan, np.nan
+        try:
+            if motor_command[2:3] == "R":
+                relative_mm = float(motor_command[3:])
+            elif motor_command[2:3] == "A":
+                absolute_mm = float(motor_command[3:])
+        except ValueError:
+            pass
+        times[2][layer_idx] += __motor_command_ms(int(motor_command[1]), relative_mm, absolute_mm, state, model)
+    else:
+        times[3][layer_idx] += __transfer_ms(np.array([len(command)]), state, model).sum()
+
+
+# characters of the numbers formatted with the given decimals
+def __number_bytes(values, decimals):
+    rounded = np.round(values, decimals)
+    integer_digits = np.floor(np.log10(np.maximum(np.abs(rounded), 1))).astype(np.int64) + 1
+    return np.signbit(rounded) + integer_digits + (decimals + 1 if decimals > 0 else 0)
@@ -0,0 +1,106 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+# total length of the non printing moves between consecutive segments, from start_point to the first segment if given
+def jump_length(segments, start_point=None):
+    if len(segments) == 0:
+        return 0.0
+    jumps = np.linalg.norm(segments[1:, 0] - segments[:-1, 1], axis=1).sum()
+    if start_point is not None:
+        jumps += np.linalg.norm(segments[0, 0] - start_point)
+    return float(jumps)
+
+
+# reorders (N, 2, D) segments to reduce the jumps between them. Runs of connected segments (end point equal to the
+# next start point, e.g. contour loops and zigzag lines) are kept together as chains. The chains are visited with a
+# nearest neighbour walk from start_point, entering each chain from the closest of its two ends, and the walk can
+# be refined with 2-opt moves, which reverse a run of chains together with the direction of each of them.
+# Returns the reordered segments.
+def order_segments(segments, start_point=None, two_opt=True, two_opt_window=64, two_opt_passes=4, tolerance=0.0):
+    if len(segments) < 2:
+        return segments
+    joined = np.all(np.abs(segments[1:, 0] - segments[:-1, 1]) <= tolerance, axis=1)
+    chain_starts = np.concatenate(([0], np.nonzero(~joined)[0] + 1))
+    chain_ends = np.concatenate((chain_starts[1:], [len(segments)]))
+    entries = segments[chain_starts, 0]
+    exits = segments[chain_ends - 1, 1]
+    order, flipped = __nearest_neighbour_walk(entries, exits, start_point)
+    if two_opt:
+        order, flipped = __two_opt(entries, exits, order, flipped, start_point, two_opt_window, two_opt_passes)
+    segment_idxs = []
+    segment_flipped = []
+    for chain_idx, is_flipped in zip(order, flipped):
+        chain_idxs = np.arange(chain_starts[chain_idx], chain_ends[chain_idx])
+        segment_idxs.append(chain_idxs[::-1] if is_flipped else chain_idxs)
+        segment_flipped.append(np.full(len(chain_idxs), is_flipped, dtype=bool))
+    segment_idxs = np.concatenate(segment_idxs)
+    segment_flipped = np.concatenate(segment_flipped)
+    ordered_segments = segments[segment_idxs]
+    ordered_segments[segment_flipped] = ordered_segments[segment_flipped, ::-1]
+    return ordered_segments
+
+
+def __nearest_neighbour_walk(entries, exits, start_point):
+    chains_count = len(entries)
+    # the ends of chain c have index c (entering from its start) and c + chains_count (entering from its end)
+    ends = np.concatenate((entries, exits))
+    visited = np.zeros(chains_count, dtype=bool)
+    order = np.empty(chains_count, dtype=np.int64)
+    flipped = np.empty(chains_count, dtype=bool)
+    position = entries[0] if start_point is None else start_point
+    tree_idxs = np.arange(2 * chains_count)
+    tree = cKDTree(ends)
+    for step in range(chains_count):
+        # the tree is rebuilt on the remaining ends when most of its points have been visited
+        if 2 * (chains_count - step) < len(tree_idxs) // 2:
+            tree_idxs = tree_idxs[~visited[tree_idxs % chains_count]]
+            tree = cKDTree(ends[tree_idxs])
+        neighbours = min(8, len(tree_idxs))
+        while True:
+            _, idxs = tree.query(position, k=neighbours)
+            idxs = tree_idxs[np.atleast_1d(idxs)]
+            candidates = idxs[~visited[idxs % chains_count]]
+            if len(candidates) > 0 or neighbours == len(tree_idxs):
+                break
+            neighbours = min(2 * neighbours, len(tree_idxs))
+        chain_idx = candidates[0] % chains_count
+        order[step] = chain_idx
+        flipped[step] = candidates[0] >= chains_count
+        visited[chain_idx] = True
+        position = entries[chain_idx] if flipped[step] else exits[chain_idx]
+    return order, flipped
+
+
+def __two_opt(entries, exits, order, flipped, start_point, window, passes):
+    chains_count = len(order)
+    # entry and exit point of each chain in the walk
+    walk_entries = np.where(flipped[:, None], exits[order], entries[order])
+    walk_exits = np.where(flipped[:, None], entries[order], exits[order])
+    for _ in range(passes):
+        improved = False
+        for first in range(chains_count):
+            if first == 0 and start_point is None:
+                continue
+            previous = walk_exits[first - 1] if first > 0 else start_point
+            lasts = np.arange(first, min(first + window, chains_count))
+            # reversing the run first..last replaces the jumps previous -> entry(first) and exit(last) -> entry(last + 1)
+            # with previous -> exit(last) and entry(first) -> entry(last + 1)
+            gains = np.linalg.norm(walk_entries[first] - previous) - np.linalg.norm(walk_exits[lasts] - previous, axis=1)
+            has_next = lasts + 1 < chains_count
+            nexts = walk_entries[lasts[has_next] + 1]
+            gains[has_next] += np.linalg.norm(walk_exits[lasts[has_next]] - nexts, axis=1) - np.linalg.norm(walk_entries[first] - nexts, axis=1)
+            best = np.argmax(gains)
+            if gains[best] <= 1e-9:
+                continue
+            last = lasts[best]
+            run = slice(first, last + 1)
+            order[run] = order[run][::-1].copy()
+            flipped[run] = ~flipped[run][::-1]
+            reversed_entries = walk_exits[run][::-1].copy()
+            walk_exits[run] = walk_entries[run][::-1].copy()
+            walk_entries[run] = reversed_entries
+            improved = True
+        if not improved:
+            break
+    return order, flipped
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 from PySide2.QtCore import Signal, Slot, QJsonDocument
 
@@ -238,11 +239,298 @@ marching_squares_table = [
 ]
 
 
+# adaptive layers: each face allows a thickness equal to cusp_height / |n_y| (clamped to [min, max]),
+# the heights are binned at min_thickness resolution and each layer takes the smallest allowed thickness
+# of the faces it crosses
+def compute_adaptive_layer_thicknesses(triangles, total_height, min_thickness, max_thickness, cusp_height):
+    triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    if total_height <= 0:
+        return np.array([], dtype=np.float64)
+    min_thickness = min(min_thickness, max_thickness)
+    number_of_bins = int(np.ceil(total_height / min_thickness)) + 1
+    allowed_thickness = np.full(number_of_bins, max_thickness, dtype=np.float64)
+    if triangles.shape[0] > 0:
+        normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        normals_length = np.linalg.norm(normals, axis=1)
+        valid = normals_length > 0
+        normal_y = np.zeros(triangles.shape[0])
+        normal_y[valid] = np.abs(normals[valid, 1] / normals_length[valid])
+        faces_thickness = np.full(triangles.shape[0], max_thickness)
+        sloped = normal_y > 0
+        faces_thickness[sloped] = np.clip(cusp_height / normal_y[sloped], min_thickness, max_thickness)
+        constrained = valid & (faces_thickness < max_thickness)
+        faces_min = np.clip(triangles[constrained, :, 1].min(axis=1), 0, total_height)
+        faces_max = np.clip(triangles[constrained, :, 1].max(axis=1), 0, total_height)
+        first_bins = np.floor(faces_min / min_thickness).astype(np.int64)
+        last_bins = np.minimum(np.floor(faces_max / min_thickness).astype(np.int64), number_of_bins - 1)
+        bins_count = last_bins - first_bins + 1
+        bins_offsets = np.arange(bins_count.sum()) - np.repeat(np.cumsum(bins_count) - bins_count, bins_count)
+        bins_idxs = np.repeat(first_bins, bins_count) + bins_offsets
+        np.minimum.at(allowed_thickness, bins_idxs, np.repeat(faces_thickness[constrained], bins_count))
+    window = int(np.ceil(max_thickness / min_thickness)) + 1
+    layers_thickness = []
+    current_height = 0.0
+    while current_height < total_height - 1e-9:
+        first_bin = int(np.floor(current_height / min_thickness + 1e-9))
+        thickness = allowed_thickness[first_bin:first_bin + window].min()
+        last_bin = int(np.floor((current_height + thickness) / min_thickness - 1e-9))
+        thickness = min(thickness, allowed_thickness[first_bin:last_bin + 1].min())
+        thickness = max(min_thickness, np.round(thickness, 4))
+        layers_thickness.append(thickness)
+        current_height += thickness
+    return np.array(layers_thickness, dtype=np.float64)
+
+
+# per layer slicing results of each geometry, stored together with the hash of everything they depend on.
+# A new result for the same geometry, kind and layer replaces the previous one.
+class SliceCache():
+
+    def __init__(self):
+        self.__entries = {}
+
+    def get(self, geometry_key, kind, layer_idx, parameters_hash):
+        layers = self.__entries.get((geometry_key, kind))
+        if layers is None or layer_idx not in layers:
+            return None
+        cached_hash, vertices = layers[layer_idx]
+        if cached_hash != parameters_hash:
+            return None
+        return vertices
+
+    def set(self, geometry_key, kind, layer_idx, parameters_hash, vertices):
+        self.__entries.setdefault((geometry_key, kind), {})[layer_idx] = (parameters_hash, vertices)
+
+    def trim(self, number_of_layers):
+        for layers in self.__entries.values():
+            for layer_idx in [idx for idx in layers if idx >= number_of_layers]:
+                del layers[layer_idx]
+
+    def remove_geometry(self, geometry_key):
+        for key in [key for key in self.__entries if key[0] == geometry_key]:
+            del self.__entries[key]
+
+    def clear(self):
+        self.__entries = {}
+
+
+# columnar storage of the sliced toolpath of a geometry. The segment end points of all the layers are stored one
+# after the other as float32 (x, z) pairs, since the height is the same for the whole layer it is stored once per
+# layer, and the points of layer i are points[layer_offsets[i]:layer_offsets[i + 1]]. Each segment (pair of points)
+# has an entry in the segment types column.
+# With a spill path the store works out of core: when the layers kept in memory exceed spill_points they are appended
+# to <spill_path>.points / <spill_path>.types and read back lazily through memory maps, so only the layer index and
+# the last layers stay in memory. The last layer is always in memory, so that it can still be replaced.
+class ToolpathStore():
+
+    CONTOUR = 0
+    INFILL = 1
+
+    def __init__(self, segment_type=CONTOUR, layer_thickness=0, spill_path=None, spill_points=1 << 20):
+        self.segment_type = segment_type
+        self.layer_thickness = layer_thickness
+        self.spill_path = spill_path
+        self.spill_points = spill_points
+        self.__points = np.empty((0, 2), dtype=np.float32)
+        self.__segment_types = np.empty(0, dtype=np.uint8)
+        self.__layer_offsets = np.zeros(1, dtype=np.int64)
+        self.__layer_heights = np.empty(0, dtype=np.float32)
+        self.__number_of_layers = 0
+        # points before memory_start are in the spill files, the others in the memory buffers
+        self.__memory_start = 0
+        self.__mapped_points = None
+        self.__mapped_segment_types = None
+
+    # vertices are the flat (x, y, z) coordinates of the segment end points of the layer
+    def append_layer(self, vertices, height, segment_types=None):
+        if self.spill_path is not None and self.number_of_points() - self.__memory_start >= self.spill_points:
+            self.flush()
+        points = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)[:, [0, 2]]
+        start = self.__layer_offsets[self.__number_of_layers] - self.__memory_start
+        end = start + len(points)
+        self.__reserve(end, self.__number_of_layers + 1)
+        self.__points[start:end] = points
+        self.__segment_types[start // 2:end // 2] = self.segment_type if segment_types is None else segment_types
+        self.__layer_offsets[self.__number_of_layers + 1] = self.__memory_start + end
+        self.__layer_heights[self.__number_of_layers] = height
+        self.__number_of_layers += 1
+
+    def replace_last_layer(self, vertices, segment_types=None):
+        self.__number_of_layers -= 1
+        self.append_layer(vertices, self.__layer_heights[self.__number_of_layers], segment_types)
+
+    # moves the layers kept in memory to the spill files
+    def flush(self):
+        if self.spill_path is None:
+            return
+        memory_points = self.number_of_points() - self.__memory_start
+        if memory_points == 0:
+            return
+        with open(self.spill_path + '.points', 'ab') as points_file:
+            points_file.write(self.__points[:memory_points].tobytes())
+        with open(self.spill_path + '.types', 'ab') as types_file:
+            types_file.write(self.__segment_types[:memory_points // 2].tobytes())
+        self.__memory_start += memory_points
+        self.__mapped_points = None
+        self.__mapped_segment_types = None
+        self.__points = np.empty((0, 2), dtype=np.float32)
+        self.__segment_types = np.empty(0, dtype=np.uint8)
+
+    # removes the spill files, the store must not be used afterwards. A file still mapped by a view of its layers cannot
+    # be removed on Windows, it is reported and left to the removal of the spill directory
+    def release(self):
+        self.__mapped_points = None
+        self.__mapped_segment_types = None
+        if self.spill_path is None:
+            return
+        for extension in ('.points', '.types'):
+            if os.path.exists(self.spill_path + extension):
+                try:
+                    os.remove(self.spill_path + extension)
+                except OSError as e:
+                    print("Toolpath spill file not removed:", e)
+
+    def number_of_layers(self):
+        return self.__number_of_layers
+
+    def number_of_points(self):
+        return int(self.__layer_offsets[self.__number_of_layers])
+
+    def get_layer_size(self, layer_idx):
+        return int(self.__layer_offsets[layer_idx + 1] - self.__layer_offsets[layer_idx])
+
+    def get_layer_height(self, layer_idx):
+        return float(self.__layer_heights[layer_idx])
+
+    # (x, z) coordinates of the points of the layer, as a view of the store (or of its spill file). An empty store
+    # has no points
+    def get_layer_points(self, layer_idx):
+        if self.__number_of_layers == 0:
+            return np.empty((0, 2), dtype=np.float32)
+        layer_idx = layer_idx % self.__number_of_layers
+        start = int(self.__layer_offsets[layer_idx])
+        end = int(self.__layer_offsets[layer_idx + 1])
+        if start >= self.__memory_start:
+            return self.__points[start - self.__memory_start:end - self.__memory_start]
+        return self.__get_mapped_points()[start:end]
+
+    def get_layer_segment_types(self, layer_idx):
+        if self.__number_of_layers == 0:
+            return np.empty(0, dtype=np.uint8)
+        layer_idx = layer_idx % self.__number_of_layers
+        start = int(self.__layer_offsets[layer_idx])
+        end = int(self.__layer_offsets[layer_idx + 1])
+        if start >= self.__memory_start:
+            return self.__segment_types[(start - self.__memory_start) // 2:(end - self.__memory_start) // 2]
+        return self.__get_mapped_segment_types()[start // 2:end // 2]
+
+    def get_layer_vertices(self, layer_idx):
+        if self.__number_of_layers == 0:
+            return np.empty(0, dtype=np.float32)
+        layer_idx = layer_idx % self.__number_of_layers
+        return self.get_vertices(layer_idx, layer_idx + 1).ravel()
+
+    # the new points must have the same size as the layer ones (e.g. the same segments in a different order)
+    def set_layer_points(self, layer_idx, points):
+        self.get_layer_points(layer_idx)[:] = points
+
+    # first point and number of points of the layers first_layer..last_layer - 1
+    def get_points_range(self, first_layer, last_layer):
+        first_layer = min(max(first_layer, 0), self.__number_of_layers)
+        last_layer = min(max(last_layer, first_layer), self.__number_of_layers)
+        return int(self.__layer_offsets[first_layer]), int(self.__layer_offsets[last_layer] - self.__layer_offsets[first_layer])
+
+    def get_layer_offsets(self):
+        return self.__layer_offsets[:self.__number_of_layers + 1]
+
+    def get_layer_heights(self):
+        return self.__layer_heights[:self.__number_of_layers]
+
+    # rounds all the coordinates to the given number of decimals, a chunk of layers at a time
+    def quantize(self, decimals, first_layer=0, last_layer=None):
+        if last_layer is None:
+            last_layer = self.__number_of_layers
+        for first_chunk_layer, last_chunk_layer in self.get_layer_chunks():
+            first_chunk_layer = max(first_chunk_layer, first_layer)
+            last_chunk_layer = min(last_chunk_layer, last_layer)
+            if first_chunk_layer < last_chunk_layer:
+                for points in self.__get_points_views(first_chunk_layer, last_chunk_layer):
+                    np.round(points, decimals, out=points)
+
+    # contiguous float32 (x, y, z) array of the points of the layers first_layer..last_layer - 1,
+    # ready to be uploaded in a vertex buffer
+    def get_vertices(self, first_layer=0, last_layer=None):
+        if last_layer is None:
+            last_layer = self.__number_of_layers
+        first_point, number_of_points = self.get_points_range(first_layer, last_layer)
+        vertices = np.empty((number_of_points, 3), dtype=np.float32)
+        point_idx = 0
+        for points in self.__get_points_views(first_layer, last_layer):
+            vertices[point_idx:point_idx + len(points), 0] = points[:, 0]
+            vertices[point_idx:point_idx + len(points), 2] = points[:, 1]
+            point_idx += len(points)
+        vertices[:, 1] = np.repeat(self.__layer_heights[first_layer:last_layer],
+                                   np.diff(self.__layer_offsets[first_layer:last_layer + 1]))
+        return vertices
+
+    # consecutive ranges of layers with about max_points points each (a single layer can exceed it)
+    def get_layer_chunks(self, max_points=1 << 20):
+        chunks = []
+        first_layer = 0
+        while first_layer < self.__number_of_layers:
+            last_layer = int(np.searchsorted(self.__layer_offsets[:self.__number_of_layers + 1],
+                                             self.__layer_offsets[first_layer] + max_points, side='right')) - 1
+            last_layer = min(max(last_layer, first_layer + 1), self.__number_of_layers)
+            chunks.append((first_layer, last_layer))
+            first_layer = last_layer
+        return chunks
+
+    # views of the points of the layers first_layer..last_layer - 1, split between spill file and memory
+    def __get_points_views(self, first_layer, last_layer):
+        start = int(self.__layer_offsets[first_layer])
+        end = int(self.__layer_offsets[last_layer])
+        views = []
+        if start < self.__memory_start:
+            views.append(self.__get_mapped_points()[start:min(end, self.__memory_start)])
+        if end > self.__memory_start:
+            views.append(self.__points[max(start - self.__memory_start, 0):end - self.__memory_start])
+        return views
+
+    def __get_mapped_points(self):
+        if self.__mapped_points is None:
+            self.__mapped_points = np.memmap(self.spill_path + '.points', dtype=np.float32, mode='r+',
+                                             shape=(self.__memory_start, 2))
+        return self.__mapped_points
+
+    def __get_mapped_segment_types(self):
+        if self.__mapped_segment_types is None:
+            self.__mapped_segment_types = np.memmap(self.spill_path + '.types', dtype=np.uint8, mode='r+',
+                                                    shape=(self.__memory_start // 2,))
+        return self.__mapped_segment_types
+
+    # the arrays grow geometrically so that appending a layer is amortized constant time
+    def __reserve(self, number_of_points, number_of_layers):
+        if number_of_points > len(self.__points):
+            capacity = max(number_of_points, 2 * len(self.__points), 1024)
+            self.__points = self.__resized(self.__points, capacity)
+            self.__segment_types = self.__resized(self.__segment_types, capacity // 2 + 1)
+        if number_of_layers >= len(self.__layer_offsets):
+            capacity = max(number_of_layers + 1, 2 * len(self.__layer_offsets))
+            self.__layer_offsets = self.__resized(self.__layer_offsets, capacity)
+            self.__layer_heights = self.__resized(self.__layer_heights, capacity)
+
+    @staticmethod
+    def __resized(array, capacity):
+        resized = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+        resized[:len(array)] = array
+        return resized
+
+
 class MetalSlicingParameters():
 
     def __init__(self, infill_laser_power=0, infill_scan_speed=0, infill_duty_cycle=0, infill_frequency=0,
                  infill_density=0, infill_overlap=0, infill_rotation_angle=0, contour_laser_power=0,
-                 contour_scan_speed=0, contour_duty_cycle=0, contour_frequency=0):
+                 contour_scan_speed=0, contour_duty_cycle=0, contour_frequency=0, infill_tile_size=0,
+                 contour_compression_tolerance=0):
         self.infill_laser_power = infill_laser_power
         self.infill_scan_speed = infill_scan_speed
         self.infill_duty_cycle = infill_duty_cycle
@@ -251,12 +539,16 @@ class MetalSlicingParameters():
         self.infill_overlap = infill_overlap
         self.infill_rotation_angle = infill_rotation_angle
         self.infill_strategy_idx = 0
+        self.infill_tile_size = infill_tile_size
         # self.infill_vertices = []
         self.contour_laser_power = contour_laser_power
         self.contour_scan_speed = contour_scan_speed
         self.contour_duty_cycle = contour_duty_cycle
         self.contour_frequency = contour_frequency
         self.contour_strategy_idx = 0
+        # reduction of the contour G-code moves, the tolerance is a percentage of the laser width
+        self.contour_compression_idx = 0
+        self.contour_compression_tolerance = contour_compression_tolerance
         # self.contour_vertices = []
 
     @Slot(int)
@@ -273,6 +565,20 @@ class MetalSlicingParameters():
     def get_contour_strategy_idx(self):
         return self.contour_strategy_idx
 
+    @Slot(int)
+    def set_contour_compression_idx(self, value):
+        self.contour_compression_idx = value
+
+    def get_contour_compression_idx(self):
+        return self.contour_compression_idx
+
+    @Slot(float)
+    def set_contour_compression_tolerance(self, value):
+        self.contour_compression_tolerance = value
+
+    def get_contour_compression_tolerance(self):
+        return self.contour_compression_tolerance
+
     @Slot(int)
     def set_infill_density(self, value):
         self.infill_density = value
@@ -294,6 +600,13 @@ class MetalSlicingParameters():
     def get_infill_rotation_angle(self):
         return self.infill_rotation_angle
 
+    @Slot(float)
+    def set_infill_tile_size(self, value):
+        self.infill_tile_size = value
+
+    def get_infill_tile_size(self):
+        return self.infill_tile_size
+
     @Slot(float)
     def set_infill_laser_power(self, value):
         self.infill_laser_power = value
@@ -350,6 +663,14 @@ class MetalSlicingParameters():
     def get_contour_frequency(self):
         return self.contour_frequency
 
+    # hash of the parameters that change the contour and infill toolpaths (laser settings are only used by the writer)
+    def get_contour_parameters_hash(self):
+        return hash((self.contour_strategy_idx,))
+
+    def get_infill_parameters_hash(self):
+        return hash((self.infill_strategy_idx, self.infill_density, self.infill_overlap, self.infill_rotation_angle,
+                     self.infill_tile_size))
+
     def get_parameters_dict(self):
         slicer_data = {
             'infill_laser_power': self.infill_laser_power,
@@ -360,11 +681,14 @@ class MetalSlicingParameters():
             'infill_overlap': self.infill_overlap,
             'infill_rotation_angle': self.infill_rotation_angle,
             'infill_strategy_idx': self.infill_strategy_idx,
+            'infill_tile_size': self.infill_tile_size,
             'contour_laser_power': self.contour_laser_power,
             'contour_scan_speed': self.contour_scan_speed,
             'contour_duty_cycle': self.contour_duty_cycle,
             'contour_frequency': self.contour_frequency,
-            'contour_strategy_idx': self.contour_strategy_idx
+            'contour_strategy_idx': self.contour_strategy_idx,
+            'contour_compression_idx': self.contour_compression_idx,
+            'contour_compression_tolerance': self.contour_compression_tolerance
         }
         return slicer_data
 
@@ -377,9 +701,14 @@ class MetalSlicingParameters():
         self.set_infill_overlap(parameters['infill_overlap'])
         self.set_infill_rotation_angle(parameters['infill_rotation_angle'])
         self.set_infill_strategy_idx(parameters['infill_strategy_idx'])
+        if 'infill_tile_size' in parameters:
+            self.set_infill_tile_size(parameters['infill_tile_size'])
         self.set_contour_laser_power(parameters['contour_laser_power'])
         self.set_contour_scan_speed(parameters['contour_scan_speed'])
         self.set_contour_duty_cycle(parameters['contour_duty_cycle'])
         self.set_contour_frequency(parameters['contour_frequency'])
         self.set_contour_strategy_idx(parameters['contour_strategy_idx'])
+        if 'contour_compression_idx' in parameters:
+            self.set_contour_compression_idx(parameters['contour_compression_idx'])
+            self.set_contour_compression_tolerance(parameters['contour_compression_tolerance'])
 
@@ -1,4 +1,5 @@
 from PySide2.QtCore import QObject, Signal, Slot
+import time
 
 
 class ClearpathSCSK(QObject):
@@ -10,13 +11,14 @@ class ClearpathSCSK(QObject):
 
     def __init__(self, spindle_pitch_microns=4000, steps_per_revolution=6400, axis_orientation=1):
         QObject.__init__(self)
+        # without the Teknic driver the motors stay disconnected
+        self.is_connected = False
         try:
             self.pywrapper = __import__('external_libraries.clearpath.clearpathPyWrapper', fromlist='ClearpathTeknicDriver')
         except ImportError:
             print("ImportError")
             return None
         self.scskTeknic = self.pywrapper.ClearpathTeknicDriver()
-        self.is_connected = False
         self.ports_count = 0
         self.nodes = []
         self.nodes_id = []
@@ -97,10 +99,7 @@ class ClearpathSCSK(QObject):
                 print(e)
                 return False
 
-    def home_motor(self, *args):
-        node = args[0]
-        port = args[1]
-        wait_for_motor = args[2]
+    def home_motor(self, node=0, port=0, wait_for_motor=True):
         if self.is_connected:
             try:
                 self.scskTeknic.enableNodeMotion(node, port)
@@ -109,9 +108,7 @@ class ClearpathSCSK(QObject):
                 if is_valid:
                     self.print_text_signal.emit("...homing building plate...")
                     if wait_for_motor:
-                        homing_done = False
-                        while not homing_done:
-                            homing_done = not self.scskTeknic.isHoming(node, port)
+                        self.wait_for_motor(node, port, is_homing=True)
                     self.print_text_signal.emit("building plate homed!")
                     self.homed_signal.emit(True)
                     return True
@@ -121,10 +118,7 @@ class ClearpathSCSK(QObject):
             except Exception as e:
                 raise e
 
-    def move_motor(self, distance_mm, feed_rate_mm_min, is_relative=True, *args):
-        node = args[0]
-        port = args[1]
-        wait_for_motor = args[2]
+    def move_motor(self, distance_mm, feed_rate_mm_min, is_relative=True, node=0, port=0, wait_for_motor=True):
         if self.is_connected:
             try:
                 self.scskTeknic.enableNodeMotion(node, port)
@@ -135,15 +129,21 @@ class ClearpathSCSK(QObject):
                 feedrate_rpm = feed_rate_mm_min / spindle_pitch_mm
                 expected_time = self.scskTeknic.move(counts, feedrate_rpm, is_relative, node, port)
                 if wait_for_motor:
-                    movement_done = False
-                    while not movement_done:
-                        movement_done = not self.scskTeknic.isMoving(node, port)
+                    self.wait_for_motor(node, port)
                 self.print_text_signal.emit("building plate moved!")
                 print(expected_time)
                 return True
             except Exception as e:
                 raise e
 
+    # the driver is polled with a sleep that doubles up to max_poll_s instead of a busy loop, a short motion is
+    # detected within a millisecond and a long one costs a poll every max_poll_s
+    def wait_for_motor(self, node=0, port=0, is_homing=False, min_poll_s=0.0005, max_poll_s=0.01):
+        poll_s = min_poll_s
+        while self.scskTeknic.isHoming(node, port) if is_homing else self.scskTeknic.isMoving(node, port):
+            time.sleep(poll_s)
+            poll_s = min(2 * poll_s, max_poll_s)
+
     def print_motor_position(self, *args):
         node = args[0]
         port = args[1]
@@ -0,0 +1,548 @@
+import sys
+import os
+import time
+import json
+import signal
+import socket
+import argparse
+import threading
+from collections import deque, OrderedDict
+from PySide2.QtCore import QObject, Signal, Slot, QTimer, QCoreApplication
+from PySide2.QtWidgets import QApplication
+from MetalPrinter.gCodeSender import GCodeSender
+from DLPPrinter.dlpMainController import DLPMainController
+from helpers import gcode_helpers
+
+QUEUED = 'queued'
+LOADING = 'loading'
+RUNNING = 'running'
+COMPLETED = 'completed'
+STOPPED = 'stopped'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+# parsed metal jobs shared by the printers. A job file is scanned once for its layer index and the same reader streams
+# it to every printer, a reader is closed when it is not used and more than max_jobs readers are open. The key
+# includes the modification time and the size of the file, so a job file written again is parsed again
+class JobCache():
+
+    def __init__(self, max_jobs=8):
+        self.max_jobs = max_jobs
+        self.__lock = threading.Lock()
+        self.__loading_locks = {}
+        # key: [reader, number of users]
+        self.__entries = OrderedDict()
+
+    @staticmethod
+    def __get_key(file_name):
+        file_name = os.path.abspath(file_name)
+        file_stat = os.stat(file_name)
+        return file_name, file_stat.st_mtime_ns, file_stat.st_size
+
+    # the printers asking for a job being parsed wait for it instead of parsing it again
+    def acquire(self, file_name):
+        key = self.__get_key(file_name)
+        with self.__lock:
+            loading_lock = self.__loading_locks.setdefault(key, threading.Lock())
+        with loading_lock:
+            with self.__lock:
+                entry = self.__entries.get(key)
+                if entry is not None:
+                    entry[1] += 1
+                    self.__entries.move_to_end(key)
+                    return entry[0]
+            reader = gcode_helpers.open_job_file(file_name)
+            with self.__lock:
+                self.__entries[key] = [reader, 1]
+                self.__evict()
+            return reader
+
+    def release(self, reader):
+        with self.__lock:
+            for entry in self.__entries.values():
+                if entry[0] is reader:
+                    entry[1] -= 1
+            self.__evict()
+
+    def number_of_jobs(self):
+        with self.__lock:
+            return len(self.__entries)
+
+    def __evict(self):
+        for key in list(self.__entries.keys()):
+            if len(self.__entries) <= self.max_jobs:
+                return
+            reader, users = self.__entries[key]
+            if users <= 0:
+                del self.__entries[key]
+                self.__loading_locks.pop(key, None)
+                reader.close()
+
+    def close(self):
+        with self.__lock:
+            for reader, users in self.__entries.values():
+                reader.close()
+            self.__entries.clear()
+
+
+# queue of the jobs of a printer and the worker thread that runs them one after the other. The jobs are taken from
+# the queue only while the printer is dispatching. The controller is a QObject of the main thread, the worker calls
+# it through the dispatcher and only polls its state while the job runs
+class PrinterWorker():
+
+    def __init__(self, name, dispatcher, poll_interval_s=0.2):
+        self.name = name
+        self.controller = None
+        self.poll_interval_s = poll_interval_s
+        self._dispatcher = dispatcher
+        self.__jobs = deque()
+        self.__condition = threading.Condition()
+        self.__is_running = True
+        self.__is_dispatching = False
+        self.__is_stop_requested = False
+        self.current_job = None
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def queue_job(self, job):
+        with self.__condition:
+            self.__jobs.append(job)
+            self.__condition.notify_all()
+
+    def cancel_job(self, job_id):
+        with self.__condition:
+            for job in self.__jobs:
+                if job['id'] == job_id:
+                    self.__jobs.remove(job)
+                    job['state'] = CANCELLED
+                    return True
+        return False
+
+    def queued_jobs(self):
+        with self.__condition:
+            return list(self.__jobs)
+
+    def set_dispatching(self, value):
+        with self.__condition:
+            self.__is_dispatching = value
+            self.__condition.notify_all()
+
+    def is_dispatching(self):
+        return self.__is_dispatching
+
+    # the current job is stopped and no other job is started until the printer is dispatching again
+    def stop(self):
+        with self.__condition:
+            self.__is_dispatching = False
+            self.__is_stop_requested = self.current_job is not None
+            job = self.current_job
+        if job is not None and job['state'] == RUNNING:
+            self._dispatcher.call_in_main_thread(self.stop_job)
+
+    def close(self):
+        self.stop()
+        with self.__condition:
+            self.__is_running = False
+            self.__condition.notify_all()
+        self.__thread.join(5)
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while self.__is_running and (not self.__is_dispatching or len(self.__jobs) == 0):
+                    self.__condition.wait()
+                if not self.__is_running:
+                    return
+                job = self.__jobs.popleft()
+                self.current_job = job
+                self.__is_stop_requested = False
+            try:
+                self.__run_job(job)
+            except Exception as e:
+                print(e)
+                job['state'] = FAILED
+                job['message'] = str(e)
+            finally:
+                job['end_time'] = time.time()
+                with self.__condition:
+                    self.current_job = None
+                self._dispatcher.print_message(self.name, "Job %i %s" % (job['id'], job['state']))
+
+    def __run_job(self, job):
+        job['state'] = LOADING
+        self.load_job(job)
+        if self.__is_stop_requested:
+            job['state'] = STOPPED
+            return
+        job['start_time'] = time.time()
+        if not self._dispatcher.call_in_main_thread(self.start_job, job):
+            job['state'] = FAILED
+            return
+        job['state'] = RUNNING
+        # a stop requested while the job was starting
+        if self.__is_stop_requested:
+            self._dispatcher.call_in_main_thread(self.stop_job)
+        while self.is_busy():
+            time.sleep(self.poll_interval_s)
+        if self.__is_stop_requested:
+            job['state'] = STOPPED
+        elif self.is_completed():
+            job['state'] = COMPLETED
+        else:
+            job['state'] = FAILED
+
+    def status(self):
+        job = self.current_job
+        return {'name': self.name,
+                'type': self.printer_type,
+                'dispatching': self.__is_dispatching,
+                'state': self.get_state(),
+                'progress': self.get_progress(),
+                'remaining_ms': self.get_remaining_time(),
+                'current_job': None if job is None else job['id'],
+                'queued_jobs': [queued_job['id'] for queued_job in self.queued_jobs()]}
+
+
+# metal printer driven by a GCodeSender. The job file is parsed in the worker thread through the shared job cache and
+# each printer saves its own checkpoint next to the job file
+class MetalPrinterWorker(PrinterWorker):
+
+    printer_type = 'metal'
+
+    def __init__(self, name, dispatcher, settings):
+        PrinterWorker.__init__(self, name, dispatcher)
+        self.__settings = settings
+        self.__job_file = None
+        self.__next_job_file = None
+
+    def create_controller(self):
+        self.controller = GCodeSender()
+        self.controller.set_console_verbosity(self.__settings.get('console_verbosity', 0))
+        self.controller.set_streaming_mode(self.__settings.get('streaming_mode', True))
+        self.controller.set_rx_buffer_size(self.__settings.get('rx_buffer_size', 127))
+        self.controller.set_pipelined_recoating(self.__settings.get('pipelined_recoating', True))
+        if 'baudrate' in self.__settings:
+            self.controller.set_baudrate(self.controller.get_baudrates_list().index(self.__settings['baudrate']))
+        self.controller.set_comport_url(self.__settings.get('port', ''))
+        self.controller.print_text_signal.connect(lambda text: self._dispatcher.print_message(self.name, text))
+
+    def connect(self):
+        is_connected = self.controller.connect_serial() is not False
+        if self.__settings.get('motors', True):
+            self.controller.motor_connect()
+        return is_connected
+
+    def disconnect(self):
+        self.controller.close_connection()
+
+    def load_job(self, job):
+        if self.__next_job_file is not None:
+            self._dispatcher.job_cache.release(self.__next_job_file)
+            self.__next_job_file = None
+        self.__next_job_file = self._dispatcher.job_cache.acquire(job['job_file'])
+
+    # the reader of the previous job is released when the sender opens the next one
+    def start_job(self, job):
+        is_opened = self.controller.open_file(job['job_file'], job_file=self.__next_job_file,
+                                              checkpoint_name=job['job_file'] + '.' + self.name) is not False
+        if self.__job_file is not None:
+            self._dispatcher.job_cache.release(self.__job_file)
+        self.__job_file, self.__next_job_file = self.__next_job_file, None
+        if not is_opened:
+            return False
+        first_layer = job.get('first_layer', 0)
+        if job.get('resume', False):
+            first_layer = self.controller.get_checkpoint_layer()
+        self.controller.resume_from_layer(first_layer)
+        return self.controller.get_state() != GCodeSender.IDLE
+
+    def stop_job(self):
+        self.controller.stop()
+
+    def pause_job(self):
+        self.controller.pause()
+
+    def is_busy(self):
+        return self.controller.get_state() != GCodeSender.IDLE
+
+    def is_completed(self):
+        return self.controller.get_progress() >= 100 and \
+               self.controller.get_checkpoint_layer() >= self.controller.get_number_of_layers()
+
+    def get_state(self):
+        return self.controller.get_state()
+
+    def get_progress(self):
+        return self.controller.get_progress()
+
+    def get_remaining_time(self):
+        return self.controller.get_remaining_time()
+
+
+# DLP printer driven by a DLPMainController, the images of the job are projected on the projector screen
+class DLPPrinterWorker(PrinterWorker):
+
+    printer_type = 'dlp'
+
+    def __init__(self, name, dispatcher, settings):
+        PrinterWorker.__init__(self, name, dispatcher)
+        self.__settings = settings
+
+    def create_controller(self):
+        self.controller = DLPMainController(printer_setup=self.__settings.get('printer_setup', 'BOTTOM-UP'),
+                                            projector_setup=self.__settings.get('projector_setup', 'VisitechLRSWQ'),
+                                            motor_setup=self.__settings.get('motor_setup', 'ClearpathSDSK'))
+        self.controller.print_text_signal.connect(lambda text: self._dispatcher.print_message(self.name, text))
+
+    def connect(self):
+        if 'port' in self.__settings:
+            self.controller.update_port_list()
+            self.controller.select_port(list(self.controller.available_ports()).index(self.__settings['port']))
+        self.controller.connect_printer()
+        self.controller.start_projector()
+        return True
+
+    def disconnect(self):
+        self.controller.disconnect_printer()
+
+    def load_job(self, job):
+        pass
+
+    def start_job(self, job):
+        self.controller.set_support_images(list(job.get('support_images', [])))
+        self.controller.set_features_images(list(job.get('features_images', [])))
+        self.controller.starting_printing_process()
+        return self.controller.is_printing
+
+    def stop_job(self):
+        self.controller.stop_printing_process()
+
+    def pause_job(self):
+        self._dispatcher.print_message(self.name, "DLP jobs can not be paused!")
+
+    def is_busy(self):
+        return self.controller.is_printing
+
+    def is_completed(self):
+        return self.controller.print_status == "SUCCESS"
+
+    def get_state(self):
+        return 'printing' if self.controller.is_printing else 'idle'
+
+    def get_progress(self):
+        if self.controller.number_of_layers == 0:
+            return 0
+        return int(self.controller.current_layer / self.controller.number_of_layers * 100)
+
+    def get_remaining_time(self):
+        return self.controller.evaluate_time_estimate(self.controller.current_layer if self.controller.is_printing else 0)
+
+
+# headless dispatcher of the jobs of several printers. It is controlled through a local TCP socket with one json
+# request per line, every request gets one json reply line:
+#   {"command": "printers"}                                       status of all the printers
+#   {"command": "connect" | "disconnect", "printer": name}
+#   {"command": "queue", "printer": name, "job_file": path, "first_layer": 0, "resume": false}     metal job
+#   {"command": "queue", "printer": name, "support_images": [...], "features_images": [...]}       DLP job
+#   {"command": "start" | "hold", "printer": name}                starts or holds the dispatching of the queued jobs
+#   {"command": "pause" | "stop", "printer": name}                pauses or stops the current job, stop also holds
+#   {"command": "cancel", "job": id}                              removes a queued job
+#   {"command": "jobs"} or {"command": "status", "job": id}
+class PrinterDispatcher(QObject):
+
+    invoke_signal = Signal(object)
+
+    def __init__(self, host='localhost', port=5555, max_cached_jobs=8):
+        QObject.__init__(self)
+        self.host = host
+        self.port = port
+        self.job_cache = JobCache(max_cached_jobs)
+        self.__printers = OrderedDict()
+        self.__jobs = OrderedDict()
+        self.__next_job_id = 1
+        self.__lock = threading.Lock()
+        self.__server = None
+        self.__is_serving = False
+        self.invoke_signal.connect(self.__invoke)
+
+    def print_message(self, printer_name, text):
+        for line in text.splitlines():
+            print("[%s] %s" % (printer_name, line))
+
+    # the controllers are QObjects of the main thread, the other threads queue the calls and wait for their result
+    def call_in_main_thread(self, function, *args):
+        if threading.current_thread() is threading.main_thread():
+            return function(*args)
+        call = {'function': function, 'args': args, 'done': threading.Event()}
+        self.invoke_signal.emit(call)
+        call['done'].wait()
+        if 'error' in call:
+            raise call['error']
+        return call.get('result')
+
+    @Slot(object)
+    def __invoke(self, call):
+        try:
+            call['result'] = call['function'](*call['args'])
+        except Exception as e:
+            call['error'] = e
+        call['done'].set()
+
+    def add_printer(self, settings):
+        name = settings['name']
+        if name in self.__printers:
+            raise ValueError("Printer %s already added!" % name)
+        printer_type = settings.get('type', 'metal')
+        if printer_type == 'metal':
+            printer = MetalPrinterWorker(name, self, settings)
+        elif printer_type == 'dlp':
+            printer = DLPPrinterWorker(name, self, settings)
+        else:
+            raise ValueError("Unknown printer type: %s" % printer_type)
+        self.call_in_main_thread(printer.create_controller)
+        self.__printers[name] = printer
+        if settings.get('connect', False):
+            self.call_in_main_thread(printer.connect)
+        return printer
+
+    def get_printer(self, name):
+        return self.__printers[name]
+
+    def start_server(self):
+        self.__server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__server.bind((self.host, self.port))
+        self.__server.listen(5)
+        self.port = self.__server.getsockname()[1]
+        self.__is_serving = True
+        threading.Thread(target=self.__accept_connections, daemon=True).start()
+        print("Dispatcher listening on %s:%i" % (self.host, self.port))
+
+    def close(self):
+        self.__is_serving = False
+        if self.__server is not None:
+            try:
+                self.__server.close()
+            except:
+                pass
+        for printer in self.__printers.values():
+            printer.close()
+            printer.disconnect()
+        self.job_cache.close()
+
+    def __accept_connections(self):
+        while self.__is_serving:
+            try:
+                connection, address = self.__server.accept()
+            except:
+                return
+            threading.Thread(target=self.__serve_connection, args=(connection,), daemon=True).start()
+
+    def __serve_connection(self, connection):
+        with connection:
+            requests = connection.makefile('rb')
+            for line in requests:
+                if len(line.strip()) == 0:
+                    continue
+                try:
+                    reply = self.handle_request(json.loads(line.decode('utf-8')))
+                except Exception as e:
+                    reply = {'ok': False, 'error': str(e)}
+                try:
+                    connection.sendall(json.dumps(reply).encode('utf-8') + b'\n')
+                except:
+                    return
+
+    def handle_request(self, request):
+        command = request.get('command')
+        if command == 'printers':
+            return {'ok': True, 'printers': [printer.status() for printer in self.__printers.values()]}
+        if command == 'jobs':
+            return {'ok': True, 'jobs': list(self.__jobs.values())}
+        if command == 'status':
+            return {'ok': True, 'job': self.__jobs[request['job']]}
+        if command == 'cancel':
+            job = self.__jobs[request['job']]
+            return {'ok': self.__printers[job['printer']].cancel_job(job['id'])}
+        if 'printer' not in request or request['printer'] not in self.__printers:
+            return {'ok': False, 'error': "Unknown printer: %s" % request.get('printer')}
+        printer = self.__printers[request['printer']]
+        if command == 'queue':
+            return {'ok': True, 'job': self.queue_job(printer, request)}
+        if command == 'start':
+            printer.set_dispatching(True)
+        elif command == 'hold':
+            printer.set_dispatching(False)
+        elif command == 'stop':
+            printer.stop()
+        elif command == 'pause':
+            self.call_in_main_thread(printer.pause_job)
+        elif command == 'connect':
+            return {'ok': self.call_in_main_thread(printer.connect) is not False}
+        elif command == 'disconnect':
+            self.call_in_main_thread(printer.disconnect)
+        else:
+            return {'ok': False, 'error': "Unknown command: %s" % command}
+        return {'ok': True}
+
+    def queue_job(self, printer, request):
+        job = {key: value for key, value in request.items() if key != 'command'}
+        if printer.printer_type == 'metal' and not os.path.isfile(job.get('job_file', '')):
+            raise ValueError("Job file not found: %s" % job.get('job_file'))
+        with self.__lock:
+            job['id'] = self.__next_job_id
+            self.__next_job_id += 1
+            self.__jobs[job['id']] = job
+        job['state'] = QUEUED
+        job['queued_time'] = time.time()
+        printer.queue_job(job)
+        return job['id']
+
+
+# one request to a running dispatcher and its reply
+def send_request(request, host='localhost', port=5555):
+    with socket.create_connection((host, port), timeout=10) as connection:
+        connection.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        return json.loads(connection.makefile('rb').readline().decode('utf-8'))
+
+
+# the printers are read from a json file: {"host": "localhost", "port": 5555, "printers": [{"name": "metal-1",
+# "type": "metal", "port": "COM3", "baudrate": 115200, "streaming_mode": true, "connect": true}, {"name": "dlp-1",
+# "type": "dlp", "projector_setup": "VisitechLRSWQ", "motor_setup": "ClearpathSDSK", "connect": true}]}
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dispatches the jobs of several metal and DLP printers")
+    parser.add_argument('config_file', nargs='?', help="json file with the printers")
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--send', default=None, help="send a json request to a running dispatcher and print the reply")
+    args = parser.parse_args(argv)
+    if args.send is not None:
+        print(json.dumps(send_request(json.loads(args.send), args.host or 'localhost', args.port or 5555), indent=2))
+        return 0
+    if args.config_file is None:
+        parser.error("the config file is required")
+    with open(args.config_file, 'r') as f:
+        config = json.load(f)
+    # the projector windows of the DLP printers need a widgets application
+    if any(settings.get('type', 'metal') == 'dlp' for settings in config['printers']):
+        application = QApplication(sys.argv)
+    else:
+        application = QCoreApplication(sys.argv)
+    dispatcher = PrinterDispatcher(args.host or config.get('host', 'localhost'), args.port or config.get('port', 5555),
+                                   config.get('max_cached_jobs', 8))
+    for settings in config['printers']:
+        dispatcher.add_printer(settings)
+    dispatcher.start_server()
+    # the python signal handler runs only when the interpreter gets the control back from the event loop
+    signal.signal(signal.SIGINT, lambda signum, frame: application.quit())
+    interrupt_timer = QTimer()
+    interrupt_timer.timeout.connect(lambda: None)
+    interrupt_timer.start(200)
+    exit_code = application.exec_()
+    dispatcher.close()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
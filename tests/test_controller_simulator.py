@@ -0,0 +1,79 @@
+import time
+import pytest
+import serial
+from collections import deque
+from helpers import gcode_helpers
+from MetalPrinter.controllerSimulator import ControllerSimulatorProcess
+
+RX_BUFFER_SIZE = 127
+COMMANDS = ["G1 X%.3f Y%.3f D100" % (0.125 * idx, -0.25 * idx) for idx in range(200)]
+
+
+def start_simulator():
+    simulator = ControllerSimulatorProcess(rx_buffer_size=RX_BUFFER_SIZE, command_latency_s=0.0002, baud_rate=115200,
+                                           round_trip_latency_s=0.004)
+    simulator.start()
+    return simulator
+
+
+# each frame is sent after the reply to the previous one
+def stop_and_wait(port, commands):
+    for frame in gcode_helpers.encode_frames(commands):
+        port.write(frame)
+        assert port.readline() == b'ok\n'
+
+
+# the frames are sent as long as the characters not yet acknowledged fit in the receive buffer
+def streaming(port, commands):
+    in_flight = deque()
+    for frame in gcode_helpers.encode_frames(commands, 1):
+        while sum(in_flight) + len(frame) > RX_BUFFER_SIZE:
+            assert port.readline() == b'ok\n'
+            in_flight.popleft()
+        port.write(frame)
+        in_flight.append(len(frame))
+    for _ in in_flight:
+        assert port.readline() == b'ok\n'
+
+
+def send_time(simulator, send, commands):
+    simulator.reset_statistics()
+    port = serial.serial_for_url(simulator.get_url(), timeout=5)
+    try:
+        start_time = time.perf_counter()
+        send(port, commands)
+        elapsed_time_s = time.perf_counter() - start_time
+    finally:
+        port.close()
+    statistics = simulator.get_statistics()
+    assert statistics['acknowledged_lines'] == len(commands)
+    assert statistics['lost_bytes'] == 0 and statistics['resend_requests'] == 0
+    return elapsed_time_s
+
+
+def test_streaming_beats_stop_and_wait_on_the_simulated_line():
+    simulator = start_simulator()
+    try:
+        stop_and_wait_time_s = send_time(simulator, stop_and_wait, COMMANDS)
+        streaming_time_s = send_time(simulator, streaming, COMMANDS)
+    finally:
+        simulator.stop()
+    # with stop and wait every line waits for the transfer of its frame and of the reply, the round trip and its
+    # execution, streaming overlaps them
+    frame_bytes = sum(len(frame) for frame in gcode_helpers.encode_frames(COMMANDS))
+    assert stop_and_wait_time_s >= (frame_bytes + 3 * len(COMMANDS)) * 10 / 115200 + len(COMMANDS) * (0.004 + 0.0002)
+    assert streaming_time_s * 1.5 < stop_and_wait_time_s
+
+
+def test_sender_streaming_beats_stop_and_wait(tmp_path):
+    pytest.importorskip('PySide2')
+    from MetalPrinter import senderBenchmark
+    job_file = str(tmp_path / 'job.gcode')
+    with open(job_file, 'w') as f:
+        f.write(gcode_helpers.preamble_gcode() + "".join(command + "\n" for command in COMMANDS))
+    arguments = {'rx_buffer_size': RX_BUFFER_SIZE, 'command_latency_s': 0.0002, 'baud_rate': 115200, 'round_trip_latency_s': 0.004}
+    streaming_results = senderBenchmark.run_benchmark(job_file, streaming_mode=True, **arguments)
+    stop_and_wait_results = senderBenchmark.run_benchmark(job_file, streaming_mode=False, **arguments)
+    assert streaming_results['lost_bytes'] == stop_and_wait_results['lost_bytes'] == 0
+    assert min(streaming_results['acknowledged_lines'], stop_and_wait_results['acknowledged_lines']) >= len(COMMANDS)
+    assert streaming_results['lines_per_second'] > 1.5 * stop_and_wait_results['lines_per_second']
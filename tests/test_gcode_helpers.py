@@ -0,0 +1,173 @@
+import numpy as np
+import pytest
+from helpers import gcode_helpers
+
+NUMBER_OF_DECIMALS = 3
+PARAMETERS = {'contour_scan_speed': 10.0, 'contour_frequency': 100000, 'contour_laser_power': 100, 'contour_duty_cycle': 90,
+              'infill_scan_speed': 20.0, 'infill_frequency': 50000, 'infill_laser_power': 80, 'infill_duty_cycle': 100}
+
+
+# (slice index, layer thickness, blocks) of a small job, the points are on the fixed point grid of the binary job
+def job_layers(number_of_layers=4, seed=0):
+    rng = np.random.default_rng(seed)
+    layers = []
+    for slice_idx in range(number_of_layers):
+        blocks = []
+        for block_type in (gcode_helpers.INFILL_BLOCK, gcode_helpers.CONTOUR_BLOCK):
+            points = np.round(rng.uniform(-5, 5, (2 * int(rng.integers(1, 20)), 2)), NUMBER_OF_DECIMALS)
+            if block_type == gcode_helpers.CONTOUR_BLOCK:
+                # closed polyline, every segment starts where the previous one ends
+                loop = points[::2]
+                points = np.stack((loop, np.roll(loop, -1, axis=0)), axis=1).reshape(-1, 2)
+            blocks.append((0, block_type, points))
+        layers.append((slice_idx, 0.03 + 0.01 * slice_idx, blocks))
+    return layers
+
+
+def laser_command(block_type):
+    prefix = 'contour_' if block_type == gcode_helpers.CONTOUR_BLOCK else 'infill_'
+    return "G1 F%.3f H%i P%i\n" % (PARAMETERS[prefix + 'scan_speed'], PARAMETERS[prefix + 'frequency'], PARAMETERS[prefix + 'laser_power'])
+
+
+def write_text_job(file_name, layers, arc_tolerance=0.0):
+    with open(file_name, 'w') as f:
+        f.write(";Galvo Scanner System\n\n" + gcode_helpers.preamble_gcode())
+        for slice_idx, layer_thickness, blocks in layers:
+            task_blocks = []
+            for _, block_type, points in blocks:
+                prefix = 'contour_' if block_type == gcode_helpers.CONTOUR_BLOCK else 'infill_'
+                task_blocks.append((";Start Block\n" + laser_command(block_type), PARAMETERS[prefix + 'duty_cycle'], points, 0.0,
+                                    arc_tolerance, False))
+            gcode, _ = gcode_helpers.layer_gcode((slice_idx, layer_thickness, task_blocks, NUMBER_OF_DECIMALS, False, False))
+            f.write(gcode)
+
+
+def write_binary_job(file_name, layers):
+    writer = gcode_helpers.BinaryJobWriter(file_name, {'geometries': {'0': {'parameters': PARAMETERS}}}, NUMBER_OF_DECIMALS)
+    for slice_idx, layer_thickness, blocks in layers:
+        writer.write_layer(slice_idx, layer_thickness, blocks)
+    writer.close()
+
+
+def test_gcode_routines_match_the_shared_commands():
+    preamble = [line.split(';')[0].strip() for line in gcode_helpers.preamble_gcode().splitlines()]
+    assert [line for line in preamble if line] == list(gcode_helpers.PREAMBLE_COMMANDS)
+    recoating = [line.split(';')[0].strip() for line in gcode_helpers.recoating_gcode(3, 0.05, 3).splitlines()]
+    assert [line for line in recoating if line] == gcode_helpers.recoating_commands(0.05, 3)
+
+
+def test_text_and_binary_jobs_send_the_same_commands(tmp_path):
+    layers = job_layers()
+    write_text_job(str(tmp_path / 'job.gcode'), layers)
+    write_binary_job(str(tmp_path / 'job.mjob'), layers)
+    text_job = gcode_helpers.open_job_file(str(tmp_path / 'job.gcode'))
+    binary_job = gcode_helpers.open_job_file(str(tmp_path / 'job.mjob'))
+    try:
+        assert text_job.number_of_layers() == binary_job.number_of_layers() == len(layers)
+        for first_layer in (0, 2):
+            text_commands = list(text_job.commands(first_layer))
+            assert text_commands == list(binary_job.commands(first_layer))
+            assert len(text_commands) == text_job.number_of_commands(first_layer) == binary_job.number_of_commands(first_layer)
+    finally:
+        text_job.close()
+        binary_job.close()
+
+
+def layer_tasks(layers):
+    tasks = []
+    for slice_idx, layer_thickness, blocks in layers:
+        task_blocks = [(";Start Block\n" + laser_command(block_type), 100, points, 0.0, 0.0, False)
+                       for _, block_type, points in blocks]
+        tasks.append((slice_idx, layer_thickness, task_blocks, NUMBER_OF_DECIMALS, True, True))
+    return tasks
+
+
+def test_parallel_layers_match_the_serial_layers():
+    tasks = layer_tasks(job_layers(number_of_layers=8))
+    serial_layers = [gcode_helpers.encoded_layer_gcode(task) for task in tasks]
+    parallel_gcode = []
+    jump_lengths = gcode_helpers.write_layers_parallel(iter(tasks), parallel_gcode.append, processes=2, max_pending=3)
+    assert parallel_gcode == [gcode for gcode, _ in serial_layers]
+    assert jump_lengths == [tuple(layer_jump_lengths) for _, layer_jump_lengths in serial_layers]
+
+
+def test_chunked_text_job_scan_matches_a_single_chunk(tmp_path, monkeypatch):
+    file_name = str(tmp_path / 'job.gcode')
+    write_text_job(file_name, job_layers())
+    text_job = gcode_helpers.TextJobReader(file_name)
+    try:
+        layers = (text_job.slice_numbers().tolist(), text_job.layer_offsets().tolist(),
+                  text_job.layer_command_counts().tolist(), [text_job.layer_state(idx) for idx in range(text_job.number_of_layers())])
+        commands = [list(text_job.commands(first_layer)) for first_layer in range(text_job.number_of_layers())]
+    finally:
+        text_job.close()
+    # chunk boundaries inside the lines, on the line ends and inside the ";Slice" markers
+    for chunk_size in (1, 7, 64, 257):
+        monkeypatch.setattr(gcode_helpers, 'TEXT_JOB_SCAN_CHUNK_SIZE', chunk_size)
+        chunked_job = gcode_helpers.TextJobReader(file_name)
+        try:
+            assert (chunked_job.slice_numbers().tolist(), chunked_job.layer_offsets().tolist(),
+                    chunked_job.layer_command_counts().tolist(),
+                    [chunked_job.layer_state(idx) for idx in range(chunked_job.number_of_layers())]) == layers
+            assert [list(chunked_job.commands(first_layer)) for first_layer in range(chunked_job.number_of_layers())] == commands
+        finally:
+            chunked_job.close()
+
+
+# per-byte checksum of the sender before the frames were encoded in batches
+def append_checksum(msg):
+    checksum = 0
+    for byte in msg.encode('ascii'):
+        checksum ^= byte
+    return (msg + '*' + str(checksum) + '\n').encode('ascii')
+
+
+def test_encoded_frames_match_the_per_byte_checksum():
+    commands = ["G92", "", "M4 V2 T11000 D683 F490", "G1 X-1.250 Y3.000", "G0 X0.000 Y0.000", "M10"]
+    assert gcode_helpers.encode_frames(commands) == [append_checksum(command) for command in commands]
+    assert gcode_helpers.encode_frames(commands, 7) == [append_checksum("N%i %s" % (7 + idx, command))
+                                                        for idx, command in enumerate(commands)]
+    assert gcode_helpers.encode_frames([]) == []
+    assert gcode_helpers.encode_frames([""]) == [append_checksum("")]
+
+
+def test_framed_commands_skip_the_motor_commands_across_batches():
+    commands = ["G92", "C0", "M10", "", "C1 R0.050", "G1 X1.000 Y2.000", "C3", "M7 R3"]
+    expected = []
+    line_number = 3
+    for command in commands:
+        if len(command) == 0 or command[0:1] == "C":
+            expected.append((command, None, None))
+        else:
+            expected.append((command, line_number, append_checksum("N%i %s" % (line_number, command))))
+            line_number += 1
+    for batch_size in (1, 3, 1024):
+        assert list(gcode_helpers.framed_commands(iter(commands), 3, batch_size)) == expected
+
+
+def test_format_polylines_writes_arcs_without_negative_zeros():
+    angles = np.linspace(0, 1.5 * np.pi, 49)
+    points = 5.0 * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+    segments = np.stack((points[:-1], points[1:]), axis=1).reshape(-1, 2)
+    assert gcode_helpers.format_polylines(segments, 3, 90, 0.0, 1e-2) == "G1 X5.000 Y0.000\nG3 X0.000 Y-5.000 I-5.000 J0.000 D90\n"
+    reversed_segments = segments[::-1]
+    assert gcode_helpers.format_polylines(reversed_segments, 3, 90, 0.0, 1e-2) == "G1 X0.000 Y-5.000\nG2 X5.000 Y0.000 I0.000 J5.000 D90\n"
+    # tiny negative coordinates are written as zeros, with and without simplification
+    points = np.array([[-0.0, -1e-5], [1.0, -0.0002], [1.0, 1.0]])
+    segments = np.stack((points[:-1], points[1:]), axis=1).reshape(-1, 2)
+    expected = "G1 X0.000 Y0.000\nG1 X1.000 Y0.000 D90\nG1 X1.000 Y1.000 D90\n"
+    assert gcode_helpers.format_polylines(segments, 3, 90, 1e-4, 0.0) == expected
+    assert gcode_helpers.format_segments(segments, 3, 90) == expected
+
+
+def test_job_checkpoint_round_trip_and_corruption(tmp_path):
+    job_file_name = str(tmp_path / 'job.gcode')
+    assert gcode_helpers.read_job_checkpoint(job_file_name) is None
+    checkpoint = {'job_file': job_file_name, 'completed_layers': 3, 'number_of_layers': 4, 'line': 120}
+    gcode_helpers.write_job_checkpoint(job_file_name, checkpoint)
+    assert gcode_helpers.read_job_checkpoint(job_file_name) == checkpoint
+    for corrupt_data in ('{"completed_layers": 3', '{"line": 120}', '[3]', '{"completed_layers": "3"}'):
+        with open(job_file_name + gcode_helpers.JOB_CHECKPOINT_EXTENSION, 'w') as f:
+            f.write(corrupt_data)
+        with pytest.raises(ValueError):
+            gcode_helpers.read_job_checkpoint(job_file_name)
@@ -0,0 +1,96 @@
+import numpy as np
+from helpers import polygon_helpers
+
+
+def square(x_min, z_min, size):
+    return np.array([[x_min, z_min], [x_min + size, z_min], [x_min + size, z_min + size], [x_min, z_min + size]], dtype=np.float64)
+
+
+def signed_areas(loops):
+    return sorted(polygon_helpers.loops_signed_area(loops).tolist())
+
+
+def test_loops_depth_counts_containing_loops():
+    loops = [square(0, 0, 10), square(1, 1, 8), square(2, 2, 2), square(20, 0, 5), square(6, 6, 2)]
+    assert polygon_helpers.loops_depth(loops).tolist() == [0, 1, 2, 0, 2]
+
+
+def test_orient_loops_makes_holes_clockwise():
+    loops = polygon_helpers.orient_loops([square(0, 0, 10)[::-1], square(3, 3, 4)])
+    areas = polygon_helpers.loops_signed_area(loops)
+    assert areas[0] > 0 and areas[1] < 0
+
+
+def test_offset_square_inwards_and_outwards():
+    assert np.allclose(signed_areas(polygon_helpers.offset_loops([square(0, 0, 10)], 1.0)), [64.0])
+    assert np.allclose(signed_areas(polygon_helpers.offset_loops([square(0, 0, 10)], -1.0)), [144.0])
+    # round joins add a quarter of circle on every corner
+    round_area = signed_areas(polygon_helpers.offset_loops([square(0, 0, 10)], -1.0, join_style='round', arc_tolerance=1e-4))
+    assert np.allclose(round_area, [100.0 + 40.0 + np.pi], atol=1e-2)
+
+
+def test_offset_hole_grows_and_shrinks():
+    loops = [square(0, 0, 10), square(3, 3, 4)]
+    assert np.allclose(signed_areas(polygon_helpers.offset_loops(loops, 1.0)), [-36.0, 64.0])
+    assert np.allclose(signed_areas(polygon_helpers.offset_loops(loops, -1.0)), [-4.0, 144.0])
+
+
+def test_offset_collapsed_hole_is_removed():
+    loops = [square(0, 0, 10), square(3, 3, 4)]
+    for distance in (-2.0, -3.0, -4.0, -5.0, -6.0, -8.0, -20.0):
+        for join_style in ('miter', 'round'):
+            result = polygon_helpers.offset_loops(loops, distance, join_style=join_style)
+            assert len(result) == 1
+            assert polygon_helpers.loops_signed_area(result)[0] > 0
+    assert np.allclose(signed_areas(polygon_helpers.offset_loops(loops, -6.0)), [22.0 ** 2])
+
+
+def test_offset_splits_thin_neck():
+    # two 4 x 4 squares joined by a neck 1 wide and 2 long
+    dumbbell = np.array([[0, 0], [4, 0], [4, 1.5], [6, 1.5], [6, 0], [10, 0], [10, 4], [6, 4], [6, 2.5], [4, 2.5], [4, 4], [0, 4]],
+                        dtype=np.float64)
+    # a neck wider than twice the offset stays
+    assert np.allclose(signed_areas(polygon_helpers.offset_loops([dumbbell], 0.25)), [2 * 3.5 * 3.5 + 2.5 * 0.5])
+    result = polygon_helpers.offset_loops([dumbbell], 1.0)
+    assert np.allclose(signed_areas(result), [4.0, 4.0])
+
+
+def test_offset_collapses_thin_region():
+    assert polygon_helpers.offset_loops([square(0, 0, 2)], 1.1) == []
+    assert polygon_helpers.offset_loops([square(0, 0, 10), square(3, 3, 4)], 1.6) == []
+
+
+def arc(radius, sweep, number_of_points):
+    angles = np.linspace(0, sweep, number_of_points)
+    return radius * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+
+
+def test_simplify_polyline_keeps_the_corners():
+    closed_square = np.array([[0, 0], [1, 0], [2, 0], [2, 1], [2, 2], [1, 2], [0, 2], [0, 1], [0, 0]], dtype=np.float64)
+    assert np.flatnonzero(polygon_helpers.simplify_polyline(closed_square, 1e-3)).tolist() == [0, 2, 4, 6, 8]
+    collinear = np.stack((np.arange(6.0), 2 * np.arange(6.0)), axis=1)
+    assert np.flatnonzero(polygon_helpers.simplify_polyline(collinear, 1e-3)).tolist() == [0, 5]
+
+
+def test_fit_arcs_finds_a_single_arc():
+    points = arc(5.0, 1.5 * np.pi, 49)
+    [(first, last, center, counterclockwise)] = polygon_helpers.fit_arcs(points, 1e-2)
+    assert (first, last, counterclockwise) == (0, 48, True)
+    assert np.allclose(center, 0.0)
+    [(first, last, center, counterclockwise)] = polygon_helpers.fit_arcs(points[::-1], 1e-2)
+    assert (first, last, counterclockwise) == (0, 48, False)
+    assert np.allclose(center, 0.0)
+    # the sagitta of the chords is above the tolerance
+    assert polygon_helpers.fit_arcs(points, 1e-3) == [(0, 48, None, False)]
+
+
+def test_fit_arcs_leaves_lines_and_corners():
+    closed_square = np.array([[0, 0], [1, 0], [2, 0], [2, 1], [2, 2], [1, 2], [0, 2], [0, 1], [0, 0]], dtype=np.float64)
+    assert polygon_helpers.fit_arcs(closed_square, 1e-2) == [(0, 8, None, False)]
+    collinear = np.stack((np.arange(6.0), 2 * np.arange(6.0)), axis=1)
+    assert polygon_helpers.fit_arcs(collinear, 1e-2) == [(0, 5, None, False)]
+
+
+def test_fit_arcs_stops_below_a_full_turn():
+    pieces = polygon_helpers.fit_arcs(arc(5.0, 2 * np.pi, 65), 1e-2)
+    assert [(first, last, center is None) for first, last, center, _ in pieces] == [(0, 63, False), (63, 64, True)]
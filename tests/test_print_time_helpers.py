@@ -0,0 +1,112 @@
+import math
+import numpy as np
+import pytest
+from helpers import gcode_helpers
+from helpers import print_time_helpers
+from test_gcode_helpers import job_layers, write_binary_job, write_text_job
+
+
+# layers with a three quarters circle, a full circle scanned clockwise and the random blocks of job_layers
+def arc_job_layers():
+    layers = []
+    for slice_idx, layer_thickness, blocks in job_layers():
+        for sweep, radius in ((1.5 * np.pi, 4.0), (-2 * np.pi, 2.5)):
+            angles = np.linspace(0, sweep, 49)
+            points = radius * np.stack((np.cos(angles), np.sin(angles)), axis=1) + slice_idx
+            blocks.append((0, gcode_helpers.CONTOUR_BLOCK, np.stack((points[:-1], points[1:]), axis=1).reshape(-1, 2)))
+        layers.append((slice_idx, layer_thickness, blocks))
+    return layers
+
+
+# per layer times of a text job executed a line at a time, the same model of print_time_helpers
+def reference_layer_times(file_name, model):
+    times = [[0.0, 0.0, 0.0, 0.0]]
+    position = (0.0, 0.0)
+    scan_speed = 0.0
+    building_plate_position = 0.0
+    serial_lines = 0
+    with open(file_name) as f:
+        for line in f:
+            if line.startswith(';Slice '):
+                times.append([0.0, 0.0, 0.0, 0.0])
+            command = line.split(';')[0].strip()
+            if len(command) == 0:
+                continue
+            code, words = command.split()[0], command.split()[1:]
+            fields = {word[0]: float(word[1:]) for word in words}
+            if code[0] == 'C':
+                if code == 'C0':
+                    building_plate_position = 0.0
+                    times[-1][2] += model.homing_ms
+                elif code == 'C1':
+                    target = fields['A'] if 'A' in fields else building_plate_position + fields['R']
+                    times[-1][2] += model.motor_move_ms(target - building_plate_position)
+                    building_plate_position = target
+                elif code == 'C3':
+                    times[-1][2] += model.recoat_ms()
+                continue
+            # the frames are counted with a 3 digits checksum
+            serial_lines += 1
+            frame = ("N%i %s" % (serial_lines, command) if model.streaming_mode else command) + "*255\n"
+            times[-1][3] += len(frame) * 10000.0 / model.baudrate + (0 if model.streaming_mode else model.line_latency_ms)
+            if code not in ('G0', 'G1', 'G2', 'G3'):
+                continue
+            if 'X' not in fields and 'Y' not in fields:
+                scan_speed = fields.get('F', scan_speed)
+                continue
+            end = (fields.get('X', position[0]), fields.get('Y', position[1]))
+            if code in ('G2', 'G3'):
+                center = (position[0] + fields.get('I', 0.0), position[1] + fields.get('J', 0.0))
+                start_angle = math.atan2(position[1] - center[1], position[0] - center[0])
+                end_angle = math.atan2(end[1] - center[1], end[0] - center[0])
+                sweep = (end_angle - start_angle if code == 'G3' else start_angle - end_angle) % (2 * math.pi)
+                length = math.hypot(position[0] - center[0], position[1] - center[1]) * (sweep if sweep > 1e-9 else 2 * math.pi)
+            else:
+                length = math.hypot(end[0] - position[0], end[1] - position[1])
+            if 'D' in fields or code in ('G2', 'G3'):
+                times[-1][0] += length * 1000 / scan_speed
+            else:
+                times[-1][1] += model.jump_delay_ms + length / model.jump_speed_mm_s * 1000
+            position = end
+    times = np.array(times)
+    if model.streaming_mode:
+        return times, np.maximum(times[:, 0] + times[:, 1], times[:, 3]) + times[:, 2]
+    return times, times.sum(axis=1)
+
+
+def assert_layer_times(layer_times, reference):
+    times, total_ms = reference
+    for column, name in enumerate(('marking_ms', 'jump_ms', 'motor_ms', 'serial_ms')):
+        assert np.allclose(layer_times[name], times[:, column], rtol=1e-6, atol=1e-9)
+    assert np.allclose(layer_times['total_ms'], total_ms, rtol=1e-6, atol=1e-9)
+
+
+@pytest.mark.parametrize('streaming_mode', [False, True])
+def test_text_job_estimate_matches_the_line_by_line_reference(tmp_path, streaming_mode):
+    file_name = str(tmp_path / 'job.gcode')
+    write_text_job(file_name, arc_job_layers(), arc_tolerance=1e-2)
+    with open(file_name) as f:
+        gcode = f.read()
+    assert "\nG2 " in gcode and "\nG3 " in gcode
+    model = print_time_helpers.PrintTimeModel(streaming_mode=streaming_mode, homing_ms=500.0)
+    text_job = gcode_helpers.TextJobReader(file_name)
+    try:
+        layer_times = print_time_helpers.estimate_text_job(file_name, text_job.layer_offsets(), model)
+    finally:
+        text_job.close()
+    assert_layer_times(layer_times, reference_layer_times(file_name, model))
+
+
+# the binary job sends the commands of the text job written from the same layers
+@pytest.mark.parametrize('streaming_mode', [False, True])
+def test_binary_job_estimate_matches_the_line_by_line_reference(tmp_path, streaming_mode):
+    layers = job_layers()
+    write_text_job(str(tmp_path / 'job.gcode'), layers)
+    write_binary_job(str(tmp_path / 'job.mjob'), layers)
+    model = print_time_helpers.PrintTimeModel(streaming_mode=streaming_mode, homing_ms=500.0)
+    binary_job = gcode_helpers.open_job_file(str(tmp_path / 'job.mjob'))
+    try:
+        layer_times = print_time_helpers.estimate_binary_job(binary_job, model)
+    finally:
+        binary_job.close()
+    assert_layer_times(layer_times, reference_layer_times(str(tmp_path / 'job.gcode'), model))
@@ -0,0 +1,33 @@
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('PySide2')
+from helpers.slicer_helpers import ToolpathStore
+
+
+def layer_vertices(number_of_segments, offset):
+    points = np.arange(number_of_segments * 2 * 3, dtype=np.float32).reshape(-1, 3) + offset
+    return points.ravel()
+
+
+def test_empty_store_has_empty_layers():
+    store = ToolpathStore()
+    assert store.get_layer_points(0).shape == (0, 2)
+    assert store.get_layer_segment_types(0).shape == (0,)
+    assert store.get_layer_vertices(-1).shape == (0,)
+
+
+def test_spilled_layers_are_read_back_and_released(tmp_path):
+    spill_path = str(tmp_path / 'geometry_0_infill')
+    store = ToolpathStore(ToolpathStore.INFILL, 0.03, spill_path, spill_points=8)
+    for layer_idx in range(6):
+        store.append_layer(layer_vertices(3, layer_idx), layer_idx * 0.03)
+    assert os.path.exists(spill_path + '.points')
+    for layer_idx in range(6):
+        expected = layer_vertices(3, layer_idx).reshape(-1, 3)[:, [0, 2]]
+        assert np.array_equal(store.get_layer_points(layer_idx), expected)
+    assert store.get_layer_offsets().dtype == np.int64
+    store.release()
+    assert not os.path.exists(spill_path + '.points')
+    assert not os.path.exists(spill_path + '.types')